@@ -0,0 +1,277 @@
+import argparse
+import asyncio
+import contextlib
+import json
+import platform
+import statistics
+import sys
+import time
+from typing import Callable, Dict, List, Optional
+
+import documentReader
+import llm
+import main
+from database import result_cache, validate_sql
+from fakeServices import DEFAULT_ANSWER, DEFAULT_SQL, FakeAsyncOpenAI, FakeDatabase
+from llm import build_sql_prompt, detect_hazards, extract_sql_from_text, load_doc_from_db
+from queryPlanner import plan_query
+
+# Offline benchmark suite for the /ask pipeline.
+#
+#   python benchmark.py                              # run and print the report
+#   python benchmark.py --save baseline.json         # keep a baseline
+#   python benchmark.py --compare baseline.json      # exit 1 on regressions
+#
+# Micro-benchmarks time the CPU-bound helpers; the end-to-end run drives
+# main.ask_events with FakeAsyncOpenAI and FakeDatabase (fakeServices.py)
+# and reports per-stage latency distributions and throughput.
+
+DOC_PATH = "Beehive_DB_Context_Summary.docx"
+
+QUESTIONS = [
+    "What is the flood risk in Miami?",
+    "What risks are there for offices in Boston, Charlotte, and London?",
+    "How does heat risk in Asia compare with Europe by 2050?",
+    "What are the highest risk locations for flooding in the US?",
+    "Which coastal areas are most exposed to cyclones?",
+    "How many cyclones are expected in Miami in the next 10 years?",
+]
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    # Linear interpolation between closest ranks (numpy's default)
+    if not sorted_values:
+        return 0.0
+    position = (len(sorted_values) - 1) * q
+    low = int(position)
+    high = min(low + 1, len(sorted_values) - 1)
+    return sorted_values[low] + (sorted_values[high] - sorted_values[low]) * (position - low)
+
+
+def summarize(samples_ms: List[float]) -> dict:
+    values = sorted(samples_ms)
+    if not values:
+        return {"count": 0}
+    return {
+        "count": len(values),
+        "mean_ms": round(statistics.fmean(values), 4),
+        "p50_ms": round(percentile(values, 0.50), 4),
+        "p90_ms": round(percentile(values, 0.90), 4),
+        "p99_ms": round(percentile(values, 0.99), 4),
+        "min_ms": round(values[0], 4),
+        "max_ms": round(values[-1], 4),
+    }
+
+
+def time_call(fn: Callable[[], object], iterations: int, warmup: int = 10) -> dict:
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    stats = summarize(samples)
+    stats["ops_per_sec"] = round(iterations / (sum(samples) / 1000), 1) if sum(samples) else None
+    return stats
+
+
+def _load_doc_cold():
+    documentReader._DB_DOC_CACHE = None
+    return load_doc_from_db(DOC_PATH)
+
+
+def run_micro_benchmarks(iterations: int = 1000) -> Dict[str, dict]:
+    db_context = load_doc_from_db(DOC_PATH)
+    hazards = ['"FloodRisk"', '"HeatRisk"']
+    plan = plan_query(QUESTIONS[1], detect_hazards(QUESTIONS[1]))
+    batch_sql = plan.sql if plan is not None else DEFAULT_SQL
+
+    results = {
+        "validate_sql.simple": time_call(lambda: validate_sql(DEFAULT_SQL), iterations),
+        "validate_sql.batch": time_call(lambda: validate_sql(batch_sql), iterations),
+        "detect_hazards": time_call(lambda: [detect_hazards(q) for q in QUESTIONS], iterations),
+        "build_sql_prompt": time_call(lambda: build_sql_prompt(db_context, QUESTIONS[0], hazards, None), iterations),
+        "extract_sql_from_text": time_call(lambda: extract_sql_from_text(DEFAULT_SQL), iterations),
+        "load_doc_from_db.cold": time_call(_load_doc_cold, max(iterations // 20, 5), warmup=1),
+        "load_doc_from_db.warm": time_call(lambda: load_doc_from_db(DOC_PATH), iterations),
+    }
+    load_doc_from_db(DOC_PATH)
+    return results
+
+
+@contextlib.contextmanager
+def offline_services(openai_client, database):
+    # Swap the OpenAI client and the DB call used by the /ask pipeline
+    saved = (llm.aclient, main.run_sql_query_async)
+    llm.aclient = openai_client
+    main.run_sql_query_async = database.run_async
+    try:
+        yield
+    finally:
+        llm.aclient, main.run_sql_query_async = saved
+
+
+async def _timed_ask(question: str) -> dict:
+    # Stage duration = time from a stage event to the next stage event (or done)
+    stages, first_token = {}, None
+    current, stage_started = None, None
+    started = time.perf_counter()
+    async for event in main.ask_events(question):
+        now = time.perf_counter()
+        if event["type"] in ("stage", "done"):
+            if current is not None:
+                stages[current] = stages.get(current, 0.0) + (now - stage_started) * 1000
+            current, stage_started = event.get("stage"), now
+        elif event["type"] == "token" and first_token is None:
+            first_token = (now - started) * 1000
+    total = (time.perf_counter() - started) * 1000
+    return {"stages": stages, "ttft_ms": first_token, "total_ms": total}
+
+
+async def _run_ask(questions: List[str], requests: int, concurrency: int) -> List[dict]:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i):
+        async with semaphore:
+            return await _timed_ask(questions[i % len(questions)])
+
+    return await asyncio.gather(*(one(i) for i in range(requests)))
+
+
+def run_ask_benchmark(requests: int = 200, concurrency: int = 10, llm_latency: float = 0.0,
+                      chunk_rate: float = 0.0, db_latency: float = 0.0, db_rows: int = 20,
+                      questions: Optional[List[str]] = None, answer: str = DEFAULT_ANSWER,
+                      caches: bool = False) -> dict:
+    """
+    End-to-end /ask benchmark with fake OpenAI and DB latencies.
+    The NL->SQL, result and summary caches are cleared first so LLM SQL generation
+    and summarization are measured too. The question list is short, so the summary
+    cache stays off during the run unless caches=True; cache_hits shows what was
+    still served from the caches.
+    """
+    questions = questions or QUESTIONS
+    openai_client = FakeAsyncOpenAI(latency=llm_latency, chunk_rate=chunk_rate, answer=answer)
+    database = FakeDatabase(latency=db_latency, rows=db_rows)
+    llm.sql_cache.clear()
+    llm.summary_cache.clear()
+    result_cache.invalidate()
+    before = {"sql_cache": llm.sql_cache.stats()["hits"], "summary_cache": llm.summary_cache.stats()["hits"]}
+
+    saved_summary_cache = main.SUMMARY_CACHE_ENABLED
+    main.SUMMARY_CACHE_ENABLED = caches and saved_summary_cache
+    try:
+        with offline_services(openai_client, database):
+            started = time.perf_counter()
+            samples = asyncio.run(_run_ask(questions, requests, concurrency))
+            wall = time.perf_counter() - started
+    finally:
+        main.SUMMARY_CACHE_ENABLED = saved_summary_cache
+
+    stage_names = []
+    for sample in samples:
+        stage_names.extend(name for name in sample["stages"] if name not in stage_names)
+    return {
+        "stages": {name: summarize([s["stages"][name] for s in samples if name in s["stages"]])
+                   for name in stage_names},
+        "ttft": summarize([s["ttft_ms"] for s in samples if s["ttft_ms"] is not None]),
+        "total": summarize([s["total_ms"] for s in samples]),
+        "throughput_rps": round(requests / wall, 2) if wall else None,
+        "llm_calls": openai_client.calls,
+        "db_queries": database.queries,
+        "caches": caches,
+        "cache_hits": {"sql_cache": llm.sql_cache.stats()["hits"] - before["sql_cache"],
+                       "summary_cache": llm.summary_cache.stats()["hits"] - before["summary_cache"]},
+    }
+
+
+def run_benchmarks(iterations: int = 1000, **ask_options) -> dict:
+    return {
+        "meta": {
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "iterations": iterations,
+            "ask": ask_options,
+        },
+        "micro": run_micro_benchmarks(iterations),
+        "ask": run_ask_benchmark(**ask_options),
+    }
+
+
+def _latency_metrics(report: dict) -> Dict[str, float]:
+    metrics = {f"micro.{name}.p50_ms": stats["p50_ms"] for name, stats in report.get("micro", {}).items()}
+    ask = report.get("ask", {})
+    for name, stats in ask.get("stages", {}).items():
+        if stats.get("count"):
+            metrics[f"ask.stage.{name}.p50_ms"] = stats["p50_ms"]
+            metrics[f"ask.stage.{name}.p90_ms"] = stats["p90_ms"]
+    for name in ("ttft", "total"):
+        if ask.get(name, {}).get("count"):
+            metrics[f"ask.{name}.p50_ms"] = ask[name]["p50_ms"]
+            metrics[f"ask.{name}.p90_ms"] = ask[name]["p90_ms"]
+    return metrics
+
+
+def compare(baseline: dict, current: dict, threshold: float = 0.2, min_delta_ms: float = 0.05) -> List[dict]:
+    """
+    Regressions of current vs baseline: latencies more than `threshold` (relative)
+    and `min_delta_ms` (absolute, to ignore timer noise) slower, or throughput
+    more than `threshold` lower.
+    """
+    regressions = []
+    before, after = _latency_metrics(baseline), _latency_metrics(current)
+    for name, old in before.items():
+        new = after.get(name)
+        if new is None:
+            continue
+        if new - old > min_delta_ms and new > old * (1 + threshold):
+            regressions.append({"metric": name, "baseline": old, "current": new,
+                                "change": round(new / old - 1, 3) if old else None})
+
+    old_rps = baseline.get("ask", {}).get("throughput_rps")
+    new_rps = current.get("ask", {}).get("throughput_rps")
+    if old_rps and new_rps is not None and new_rps < old_rps * (1 - threshold):
+        regressions.append({"metric": "ask.throughput_rps", "baseline": old_rps, "current": new_rps,
+                            "change": round(new_rps / old_rps - 1, 3)})
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline benchmarks for the /ask pipeline.")
+    parser.add_argument("--iterations", type=int, default=1000, help="iterations per micro-benchmark")
+    parser.add_argument("--requests", type=int, default=200, help="end-to-end /ask requests")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="fake OpenAI latency (seconds)")
+    parser.add_argument("--chunk-rate", type=float, default=200.0, help="fake streamed chunks per second")
+    parser.add_argument("--db-latency", type=float, default=0.01, help="fake DB latency (seconds)")
+    parser.add_argument("--db-rows", type=int, default=20)
+    parser.add_argument("--caches", action="store_true", help="keep the summary cache on during the /ask run")
+    parser.add_argument("--save", help="write the report to this JSON file")
+    parser.add_argument("--compare", help="baseline JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="relative slowdown flagged as a regression")
+    args = parser.parse_args()
+
+    report = run_benchmarks(
+        iterations=args.iterations,
+        requests=args.requests,
+        concurrency=args.concurrency,
+        llm_latency=args.llm_latency,
+        chunk_rate=args.chunk_rate,
+        db_latency=args.db_latency,
+        db_rows=args.db_rows,
+        caches=args.caches,
+    )
+    print(json.dumps(report, indent=2))
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, report, args.threshold)
+        for r in regressions:
+            print(f"[WARN] Regression in {r['metric']}: {r['baseline']} -> {r['current']} ({r['change']:+.1%})")
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,270 @@
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import Callable
+
+import pg8000.native
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection became available within the checkout timeout."""
+
+
+class PooledConnection:
+    """
+    A pg8000 connection owned by the pool.
+
+    Keeps a small LRU of prepared statements keyed on the SQL text so repeated
+    query shapes skip the parse/plan round trip on this connection. Preparing costs
+    its own round trip (and a Close on eviction), and most SQL here has literals
+    inlined, so a text is only prepared the second time it is seen; one-off
+    statements run directly.
+    """
+
+    def __init__(self, raw: pg8000.native.Connection, max_prepared: int):
+        self.raw = raw
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self.max_prepared = max_prepared
+        self._prepared: "OrderedDict[str, pg8000.native.PreparedStatement]" = OrderedDict()
+        self._seen: "OrderedDict[int, None]" = OrderedDict()    # hashes of texts run once
+
+    def run(self, sql: str, **params):
+        # Run a statement, reusing a prepared statement when this SQL was seen before.
+        if self.max_prepared <= 0:
+            rows = self.raw.run(sql, **params)
+            return rows, self.raw.columns
+
+        statement = self._prepared.get(sql)
+        if statement is None:
+            key = hash(sql)
+            if key not in self._seen:
+                self._seen[key] = None
+                if len(self._seen) > self.max_prepared * 8:
+                    self._seen.popitem(last=False)
+                rows = self.raw.run(sql, **params)
+                return rows, self.raw.columns
+            del self._seen[key]
+            statement = self.raw.prepare(sql)
+            self._prepared[sql] = statement
+            if len(self._prepared) > self.max_prepared:
+                _, evicted = self._prepared.popitem(last=False)
+                evicted.close()
+        else:
+            self._prepared.move_to_end(sql)
+
+        rows = statement.run(**params)
+        return rows, statement.columns
+
+    def ping(self) -> bool:
+        try:
+            self.raw.run("SELECT 1")
+            return True
+        except Exception:
+            return False
+
+    def close(self):
+        self._prepared.clear()
+        self._seen.clear()
+        try:
+            self.raw.close()
+        except Exception:
+            pass
+
+
+class ConnectionPool:
+    """
+    Thread-safe pool of long-lived Postgres connections.
+
+    - min_size connections are opened on first use and kept open.
+    - At most max_size connections exist at once; callers wait up to
+      checkout_timeout seconds for one to be returned.
+    - Connections idle for longer than idle_timeout (beyond min_size) or older
+      than max_lifetime are closed and recycled.
+    - Connections idle for longer than health_check_after are pinged before reuse.
+    """
+
+    def __init__(
+        self,
+        connect: Callable[[], pg8000.native.Connection],
+        min_size: int = 1,
+        max_size: int = 10,
+        idle_timeout: float = 300.0,
+        max_lifetime: float = 3600.0,
+        health_check_after: float = 30.0,
+        checkout_timeout: float = 10.0,
+        max_prepared: int = 64,
+    ):
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError("Invalid pool size: need 0 <= min_size <= max_size and max_size >= 1")
+
+        self._connect = connect
+        self.min_size = min_size
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.max_lifetime = max_lifetime
+        self.health_check_after = health_check_after
+        self.checkout_timeout = checkout_timeout
+        self.max_prepared = max_prepared
+
+        self._idle: "deque[PooledConnection]" = deque()
+        self._lock = threading.Condition()
+        self._size = 0
+        self._in_use = 0
+        self._waiting = 0
+        self._created = 0
+        self._closed_count = 0
+        self._failed_health_checks = 0
+        self._closed = False
+        self._filled = False
+
+    def _open(self) -> PooledConnection:
+        return PooledConnection(self._connect(), self.max_prepared)
+
+    def _discard(self, conn: PooledConnection):
+        # Caller must hold the lock.
+        self._size -= 1
+        self._closed_count += 1
+        conn.close()
+
+    def _is_expired(self, conn: PooledConnection, now: float) -> bool:
+        return now - conn.created_at > self.max_lifetime
+
+    def fill(self):
+        # Open connections up to min_size (called lazily on first checkout).
+        with self._lock:
+            missing = self.min_size - self._size
+            self._size += max(missing, 0)
+            self._filled = True
+        for _ in range(max(missing, 0)):
+            try:
+                conn = self._open()
+            except Exception:
+                with self._lock:
+                    self._size -= 1
+                    self._lock.notify()
+                raise
+            with self._lock:
+                self._created += 1
+                self._idle.append(conn)
+                self._lock.notify()
+
+    def _recycle_idle(self, now: float):
+        # Close connections idle past idle_timeout (keeping min_size) or past max_lifetime.
+        # Caller must hold the lock.
+        kept = deque()
+        while self._idle:
+            conn = self._idle.popleft()
+            too_old = self._is_expired(conn, now)
+            too_idle = now - conn.last_used > self.idle_timeout and self._size > self.min_size
+            if too_old or too_idle:
+                self._discard(conn)
+            else:
+                kept.append(conn)
+        self._idle = kept
+
+    def acquire(self) -> PooledConnection:
+        if not self._filled:
+            self.fill()
+
+        deadline = time.monotonic() + self.checkout_timeout
+        while True:
+            with self._lock:
+                if self._closed:
+                    raise RuntimeError("Connection pool is closed")
+
+                self._recycle_idle(time.monotonic())
+
+                conn = None
+                open_new = False
+                self._waiting += 1
+                try:
+                    while not self._idle and self._size >= self.max_size:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            raise PoolTimeout(
+                                f"No database connection available after {self.checkout_timeout}s"
+                            )
+                        self._lock.wait(remaining)
+                finally:
+                    self._waiting -= 1
+
+                if self._idle:
+                    # Most recently used first: keeps the warm set small so extras can idle out.
+                    conn = self._idle.pop()
+                else:
+                    self._size += 1
+                    open_new = True
+                self._in_use += 1
+
+            if open_new:
+                try:
+                    conn = self._open()
+                except Exception:
+                    with self._lock:
+                        self._size -= 1
+                        self._in_use -= 1
+                        self._lock.notify()
+                    raise
+                with self._lock:
+                    self._created += 1
+                return conn
+
+            if time.monotonic() - conn.last_used > self.health_check_after and not conn.ping():
+                with self._lock:
+                    self._failed_health_checks += 1
+                    self._in_use -= 1
+                    self._discard(conn)
+                    self._lock.notify()
+                continue
+
+            return conn
+
+    def release(self, conn: PooledConnection, broken: bool = False):
+        now = time.monotonic()
+        with self._lock:
+            self._in_use -= 1
+            if broken or self._closed or self._is_expired(conn, now):
+                self._discard(conn)
+            else:
+                conn.last_used = now
+                self._idle.append(conn)
+            self._lock.notify()
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        except Exception as error:
+            # Query errors leave the session usable; socket/protocol errors do not.
+            self.release(conn, broken=not isinstance(error, pg8000.native.DatabaseError))
+            raise
+        else:
+            self.release(conn)
+
+    def run(self, sql: str, **params):
+        with self.connection() as conn:
+            return conn.run(sql, **params)
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            while self._idle:
+                self._discard(self._idle.pop())
+            self._lock.notify_all()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": self._in_use,
+                "waiting": self._waiting,
+                "created": self._created,
+                "closed": self._closed_count,
+                "failed_health_checks": self._failed_health_checks,
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+            }
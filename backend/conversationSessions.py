@@ -0,0 +1,260 @@
+import hashlib
+import re
+import secrets
+import sys
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+from database import HAZARD_KEYWORDS, QueryResult
+from geoLocations import find_locations
+from lruCache import LRUCache
+from queryPlanner import (
+    QueryPlan, answer_in_memory, build_plan_sql, mentions_scenario, needs_llm, parse_horizons,
+    parse_scenario, plan_columns, requested_horizons,
+)
+from resultCache import estimate_rows_size
+
+# Conversation sessions for /ask: the last resolved turn (question, plan, SQL,
+# rows) per session id, so follow-ups like "what about 30 years?" or "and SSP1?"
+# are answered from the stored rows or a small delta query instead of a full
+# pipeline run (no hazard detection, no LLM SQL generation).
+
+_PRESENTATION = re.compile(
+    r"\b(table|list|bullet\w*|short\w*|brief\w*|summar\w*|simpl\w*|explain|detail\w*|rephrase|again)\b"
+)
+_SESSION_ID = re.compile(r"^[A-Za-z0-9_-]{8,128}$")
+# A follow-up opens like one ("what about ...", "and ...?"), points back at the
+# previous answer ("show it as a table") or is short and elliptical ("30 years?").
+# Definition and general questions that merely mention a hazard are new questions.
+_FOLLOW_UP_CUE = re.compile(
+    r"^(what about|how about|what if|and|also|same|now|only|just|instead)\b|"
+    r"\b(it|that|this|these|those|them|instead|as well|too)\b"
+)
+_GENERAL = re.compile(r"\b(defin\w*|mean(s|ing)?|general(ly)?|why|methodolog\w*|calculat\w*|measured)\b")
+_ELLIPTICAL_WORDS = 4
+
+
+def new_session_id() -> str:
+    return secrets.token_urlsafe(16)
+
+
+def valid_session_id(session_id: Optional[str]) -> bool:
+    return bool(session_id) and bool(_SESSION_ID.match(session_id))
+
+
+@dataclass
+class SessionState:
+    """The last answered turn of a conversation."""
+    question: str
+    sql: str
+    plan: Optional[QueryPlan] = None
+    rows: Optional[QueryResult] = field(default=None, repr=False)   # None when too large to keep
+
+    def fingerprint(self) -> str:
+        # Follow-ups depend on this turn, so it is part of their coalescing key
+        return hashlib.sha256(f"{self.question}\n{self.sql}".encode("utf-8")).hexdigest()[:16]
+
+
+def _state_size(state: SessionState) -> int:
+    return sys.getsizeof(state.question) + sys.getsizeof(state.sql) + (
+        estimate_rows_size(state.rows) if state.rows is not None else 0)
+
+
+class SessionStore:
+    """
+    Bounded per-session state: at most max_sessions sessions (least recently used
+    evicted first, also by total byte size), each expiring ttl seconds after its last
+    turn. Result sets over max_rows are not kept; follow-ups then re-query.
+    """
+
+    def __init__(self, max_sessions: int = 10000, ttl: Optional[float] = 1800,
+                 max_rows: int = 500, max_bytes: Optional[int] = 64 * 1024 * 1024):
+        self.max_rows = max_rows
+        self._cache = LRUCache(max_entries=max_sessions, ttl=ttl, max_bytes=max_bytes, sizeof=_state_size)
+        self.follow_ups = 0
+        self.reused_rows = 0
+        self.delta_queries = 0
+
+    def get(self, session_id: str) -> Optional[SessionState]:
+        return self._cache.get(session_id)
+
+    def count(self, follow_up: "FollowUp"):
+        self.follow_ups += 1
+        if follow_up.delta is None:
+            self.reused_rows += 1
+        else:
+            self.delta_queries += 1
+
+    def save(self, session_id: str, question: str, sql: str, plan: Optional[QueryPlan], rows) -> None:
+        kept = QueryResult(rows, getattr(rows, "columns", [])) if len(rows) <= self.max_rows else None
+        self._cache.set(session_id, SessionState(question, sql, plan, kept))
+
+    async def recording(self, session_id: str, question: str, events):
+        # Pass the /ask events through and save the turn once it completed with rows;
+        # rows missing failed fan-out branches are incomplete, so a follow-up re-queries
+        sql, plan, rows = None, None, None
+        async for event in events:
+            kind = event["type"]
+            if kind == "sql":
+                sql = event["sql"]
+            elif kind == "plan":
+                plan = plan_from_event(event)
+            elif kind == "rows":
+                rows = None if event.get("failed") else QueryResult(event["rows"], event["columns"])
+            elif kind == "done" and sql and rows:
+                self.save(session_id, question, sql, plan, rows)
+            yield event
+
+    def stats(self) -> dict:
+        stats = self._cache.stats()
+        return {
+            "sessions": stats["entries"],
+            "bytes": stats["bytes"],
+            "evictions": stats["evictions"],
+            "expirations": stats["expirations"],
+            "follow_ups": self.follow_ups,
+            "reused_rows": self.reused_rows,
+            "delta_queries": self.delta_queries,
+        }
+
+
+def plan_event_fields(plan: QueryPlan) -> dict:
+    return {
+        "kind": plan.kind,
+        "locations": [list(location) for location in plan.locations],
+        "hazard_tables": list(plan.hazard_tables),
+        "scenario": plan.scenario,
+        "horizons": list(plan.horizons),
+    }
+
+
+def plan_from_event(event: dict) -> QueryPlan:
+    plan = QueryPlan(
+        kind=event["kind"],
+        locations=[tuple(location) for location in event["locations"]],
+        hazard_tables=list(event["hazard_tables"]),
+        scenario=int(event["scenario"]),
+        horizons=tuple(event["horizons"]),
+    )
+    plan.sql = build_plan_sql(plan)
+    return plan
+
+
+def _mentioned_hazards(text: str) -> List[str]:
+    # Unlike detect_hazards, no mention means "keep the previous hazards"
+    return [table for table, keywords in HAZARD_KEYWORDS.items() if any(k in text for k in keywords)]
+
+
+def _risk_column(plan: QueryPlan, horizon: int) -> str:
+    return "risk_score" if len(plan.horizons) == 1 else f"risk_{horizon}yr"
+
+
+def _hazard_name(table: str) -> str:
+    return table.strip('"')
+
+
+@dataclass
+class FollowUp:
+    """
+    A follow-up resolved against the previous turn. question is the combined
+    question used for the summary and base_question the conversation's original
+    question, which is what the session keeps (so chained follow-ups don't nest).
+    reused holds the stored rows that still apply and delta the plan for whatever
+    has to be fetched (None if nothing).
+    """
+    question: str
+    sql: str
+    plan: Optional[QueryPlan]
+    reused: List[list]
+    delta: Optional[QueryPlan]
+    key: str
+    columns: List[str]
+    base_question: str = ""
+
+    @property
+    def source(self) -> str:
+        return "session" if self.delta is None else "session_delta"
+
+    async def result(self, run_query) -> QueryResult:
+        if self.plan is None:
+            return QueryResult(self.reused, self.columns)
+        fetched = []
+        if self.delta is not None:
+            fetched = answer_in_memory(self.delta)
+            if fetched is None:
+                fetched = await run_query(self.delta.sql, trusted=True)
+        # Rows grouped per hazard table in plan order, like the plan's own SQL
+        by_hazard = {}
+        for row in list(self.reused) + list(fetched):
+            by_hazard.setdefault(row[1], []).append(list(row))
+        rows = [row for table in self.plan.hazard_tables for row in by_hazard.get(_hazard_name(table), [])]
+        return QueryResult(rows, self.columns)
+
+
+def _project(previous: QueryPlan, rows, plan: QueryPlan) -> List[list]:
+    # Stored rows re-shaped for the new plan: hazards filtered, horizons picked out
+    columns = plan_columns(previous)
+    base = 3 if previous.kind == "city" else 2
+    wanted = {_hazard_name(table) for table in plan.hazard_tables}
+    picks = [columns.index(_risk_column(previous, h)) for h in plan.horizons]
+    return [list(row[:base]) + [row[i] for i in picks] for row in rows if row[1] in wanted]
+
+
+def plan_follow_up(question: str, state: Optional[SessionState]) -> Optional[FollowUp]:
+    """
+    Resolve question as a follow-up to the previous turn, or None when it should
+    go through the full pipeline (no follow-up cue, it names places, needs the
+    LLM, or changes nothing the session can answer).
+    """
+    if state is None:
+        return None
+    text = question.lower().strip()
+    if not _FOLLOW_UP_CUE.search(text) and len(re.findall(r"\w+", text)) > _ELLIPTICAL_WORDS:
+        return None
+    if _GENERAL.search(text):
+        return None
+    # calendar years ("by 2050") have no template
+    if find_locations(question) or needs_llm(question) or parse_horizons(question) is None:
+        return None
+
+    scenario = None
+    if mentions_scenario(question):
+        scenario = parse_scenario(question)
+        if scenario is None:
+            return None
+    horizons = requested_horizons(question)
+    hazards = _mentioned_hazards(text)
+    restyle = bool(_PRESENTATION.search(text))
+    if not (scenario or horizons or hazards or restyle):
+        return None
+
+    # state.question is the conversation's base question, never an earlier combination
+    combined = f"{state.question} (follow-up: {question})"
+    key = state.fingerprint()
+    previous = state.plan
+    if previous is None:
+        # LLM-planned turn: only a different presentation of the same rows is possible
+        if scenario or horizons or hazards or state.rows is None:
+            return None
+        return FollowUp(combined, state.sql, None, list(state.rows), None, key, state.rows.columns, state.question)
+
+    plan = QueryPlan(
+        kind=previous.kind,
+        locations=list(previous.locations),
+        hazard_tables=hazards or list(previous.hazard_tables),
+        scenario=scenario or previous.scenario,
+        horizons=horizons or previous.horizons,
+    )
+    plan.sql = build_plan_sql(plan)
+
+    # Stored rows cover the hazards and horizons they were fetched for, at one scenario
+    reused, missing = [], list(plan.hazard_tables)
+    if state.rows is not None and plan.scenario == previous.scenario and set(plan.horizons) <= set(previous.horizons):
+        reused = _project(previous, state.rows, plan)
+        missing = [table for table in plan.hazard_tables if table not in previous.hazard_tables]
+    delta = None
+    if missing:
+        delta = QueryPlan(previous.kind, plan.locations, missing, plan.scenario, plan.horizons)
+        delta.sql = build_plan_sql(delta)
+    return FollowUp(combined, plan.sql, plan, reused, delta, key, plan_columns(plan), state.question)
+
@@ -1,8 +1,17 @@
+import asyncio
+import json
 import os
 import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import sqlparse
 import pg8000.native
 from dotenv import load_dotenv
+from sqlparse import tokens as T
+from sqlparse.sql import Function, Identifier, IdentifierList
+from connectionPool import ConnectionPool
+from lruCache import LRUCache
+from resultCache import ResultCache, canonicalize_sql
 
 load_dotenv()
 
@@ -57,6 +66,26 @@ Rules:
 - Output ONLY the SQL query. No markdown, comments, or explanations.
 """
 
+def _parse_schema(schema: str) -> dict:
+    # {'"CycloneRisk"': ['id', 'region', ...], ...} from the SCHEMA text above
+    tables = {}
+    for table, body in re.findall(r'("[A-Za-z]+")\(\s*(.*?)\s*\)', schema, re.S):
+        tables[table] = [column.strip() for column in body.split(",") if column.strip()]
+    return tables
+
+
+SCHEMA_COLUMNS = _parse_schema(SCHEMA)
+
+# Scenario x horizon risk score columns present in every hazard table
+RISK_COLUMNS = [f"ssp{s}_{h}yr" for s in (1, 3, 5) for h in (1, 10, 30)]
+_BASE_COLUMNS = {"id", "region", "risk_type", "risk_id", "geometry"}
+
+
+def metric_columns(table: str) -> list:
+    # Hazard-specific numeric columns (frequencies, flood %, heat days, ...)
+    return [c for c in SCHEMA_COLUMNS[table] if c not in _BASE_COLUMNS and c not in RISK_COLUMNS]
+
+
 HAZARD_KEYWORDS = {
     '"CycloneRisk"': ["cyclone", "hurricane", "storm", "typhoon"],
     '"FloodRisk"':   ["flood", "inundation", "water"],
@@ -103,15 +132,332 @@ def validate_sql(sql: str) -> bool:
     return True
 
 
-def run_sql_query(sql: str):
-    # Run SQL query on Postgres or return dummy if no DB config.
-    connection = pg8000.native.Connection(
+def _connect() -> pg8000.native.Connection:
+    # Open one raw connection; statement_timeout is applied as a startup parameter
+    # so every pooled session is bounded without an extra round trip.
+    statement_timeout_ms = os.getenv("DB_STATEMENT_TIMEOUT_MS", "30000")
+    return pg8000.native.Connection(
         user=os.getenv("DB_USER"),
         password=os.getenv("DB_PASS"),
         host=os.getenv("DB_HOST"),
         database=os.getenv("DB_NAME"),
-        port=int(os.getenv("DB_PORT", 5432))
+        port=int(os.getenv("DB_PORT", 5432)),
+        application_name="beehive-backend",
+        startup_params={"statement_timeout": statement_timeout_ms},
     )
-    rows = connection.run(sql)
-    connection.close()
+
+
+_POOL = None
+_POOL_LOCK = threading.Lock()
+_DB_EXECUTOR = None
+
+
+def get_pool() -> ConnectionPool:
+    # Shared pool for everything in this module, created lazily from env config.
+    global _POOL
+    if _POOL is None:
+        with _POOL_LOCK:
+            if _POOL is None:
+                _POOL = ConnectionPool(
+                    _connect,
+                    min_size=int(os.getenv("DB_POOL_MIN", 1)),
+                    max_size=int(os.getenv("DB_POOL_MAX", 10)),
+                    idle_timeout=float(os.getenv("DB_POOL_IDLE_TIMEOUT", 300)),
+                    max_lifetime=float(os.getenv("DB_POOL_MAX_LIFETIME", 3600)),
+                    health_check_after=float(os.getenv("DB_POOL_HEALTH_CHECK_AFTER", 30)),
+                    checkout_timeout=float(os.getenv("DB_POOL_CHECKOUT_TIMEOUT", 10)),
+                    max_prepared=int(os.getenv("DB_POOL_MAX_PREPARED", 64)),
+                )
+    return _POOL
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    # pg8000 is a blocking driver: async callers run it on a dedicated executor sized
+    # to the pool, so DB work never competes with the framework's shared threadpool
+    # and at most max_size threads ever wait on Postgres.
+    global _DB_EXECUTOR
+    if _DB_EXECUTOR is None:
+        with _POOL_LOCK:
+            if _DB_EXECUTOR is None:
+                _DB_EXECUTOR = ThreadPoolExecutor(
+                    max_workers=int(os.getenv("DB_POOL_MAX", 10)),
+                    thread_name_prefix="db",
+                )
+    return _DB_EXECUTOR
+
+
+def warm_pool() -> dict:
+    # Open the pool's min_size connections and the DB executor before the first request
+    pool = get_pool()
+    pool.fill()
+    _get_executor()
+    return pool.stats()
+
+
+def close_pool():
+    global _POOL, _DB_EXECUTOR
+    with _POOL_LOCK:
+        if _POOL is not None:
+            _POOL.close()
+            _POOL = None
+        if _DB_EXECUTOR is not None:
+            _DB_EXECUTOR.shutdown(wait=False)
+            _DB_EXECUTOR = None
+
+
+def pool_stats() -> dict:
+    # Pool counters (in use, waiting, created, ...); empty until the first query.
+    return _POOL.stats() if _POOL is not None else {}
+
+
+# Hazard tables are static reference data, so results are cached on canonical SQL.
+# Call invalidate_result_cache()/refresh_result_cache() after reloading the data.
+RESULT_CACHE_ENABLED = os.getenv("RESULT_CACHE_ENABLED", "true").lower() != "false"
+result_cache = ResultCache(
+    ALLOWED_TABLES,
+    max_entries=int(os.getenv("RESULT_CACHE_MAX_ENTRIES", 10000)),
+    max_bytes=int(os.getenv("RESULT_CACHE_MAX_BYTES", 64 * 1024 * 1024)),
+    ttl=float(os.getenv("RESULT_CACHE_TTL", 3600)),
+)
+
+
+class QueryResult(list):
+    # Result rows (a plain list of rows, as before) plus the result column names.
+    def __init__(self, rows=(), columns=None):
+        super().__init__(rows)
+        self.columns = list(columns or [])
+
+
+def result_columns(rows) -> list:
+    return getattr(rows, "columns", [])
+
+
+class QueryRejected(Exception):
+    """Raised when the query governor refuses to run a query; the message is the reason."""
+
+
+# Query cost governor for LLM-generated SQL: heavy columns are stripped, EXPLAIN
+# estimates gate admission (cached per query shape), and rows are fetched through
+# a cursor in a read-only transaction with a statement timeout and a hard row cap.
+GOVERNOR_ENABLED = os.getenv("DB_GOVERNOR_ENABLED", "true").lower() != "false"
+MAX_QUERY_COST = float(os.getenv("DB_MAX_QUERY_COST", 5_000_000))
+MAX_RESULT_ROWS = int(os.getenv("DB_MAX_RESULT_ROWS", 5000))
+FETCH_SIZE = int(os.getenv("DB_FETCH_SIZE", 500))
+QUERY_TIMEOUT_MS = int(os.getenv("DB_QUERY_TIMEOUT_MS", 15000))
+
+HEAVY_COLUMNS = {"geometry", "centroid"}
+HEAVY_FUNCTIONS = {"st_astext", "st_asgeojson", "st_asbinary", "st_asewkt", "st_asewkb", "st_askml", "st_assvg"}
+
+_explain_cache = LRUCache(max_entries=1024, ttl=600)
+_governor_counts = {"explained": 0, "rejected": 0, "limited": 0, "stripped": 0, "truncated": 0}
+_governor_lock = threading.Lock()
+
+
+def _count(name: str, n: int = 1):
+    with _governor_lock:
+        _governor_counts[name] += n
+
+
+def _is_heavy_item(tokens) -> bool:
+    # A select-list item that only returns a geometry (bare column or ST_As* of it)
+    items = [t for t in tokens if not t.is_whitespace]
+    if len(items) != 1 or not isinstance(items[0], Identifier):
+        return False
+    first = items[0].token_first(skip_ws=True, skip_cm=True)
+    if isinstance(first, Function):
+        return (first.get_name() or "").lower() in HEAVY_FUNCTIONS
+    names = [t for t in items[0].tokens if not t.is_whitespace]
+    # column, table.column, or either with an alias
+    column_ref = all(t.ttype in T.Name or t.match(T.Punctuation, ".") or t.match(T.Keyword, "AS")
+                     or isinstance(t, Identifier) for t in names)
+    return column_ref and (items[0].get_real_name() or "").lower() in HEAVY_COLUMNS
+
+
+def _strip_select_lists(tlist) -> int:
+    # Remove heavy items from every SELECT list in tlist (recursing into subqueries).
+    removed = 0
+    in_select = False
+    for token in tlist.tokens:
+        if token.ttype is T.DML and token.normalized == "SELECT":
+            in_select = True
+            continue
+        if in_select and token.is_keyword and token.normalized == "FROM":
+            in_select = False
+        if in_select and isinstance(token, IdentifierList):
+            items, current = [], []
+            for t in token.tokens:
+                if t.match(T.Punctuation, ","):
+                    items.append(current)
+                    current = []
+                else:
+                    current.append(t)
+            items.append(current)
+            kept = [item for item in items if not _is_heavy_item(item)]
+            if not kept:
+                raise QueryRejected("query only selects geometry columns")
+            if len(kept) < len(items):
+                removed += len(items) - len(kept)
+                comma = sqlparse.sql.Token(T.Punctuation, ",")
+                new_tokens = []
+                for i, item in enumerate(kept):
+                    if i:
+                        new_tokens.append(comma)
+                    new_tokens.extend(item)
+                token.tokens = new_tokens
+            continue
+        if in_select and isinstance(token, Identifier) and _is_heavy_item([token]):
+            raise QueryRejected("query only selects geometry columns")
+        if token.is_group:
+            removed += _strip_select_lists(token)
+    return removed
+
+
+def strip_heavy_columns(sql: str):
+    # -> (sql without geometry projections, number of columns removed)
+    statements = sqlparse.parse(sql)
+    removed = sum(_strip_select_lists(statement) for statement in statements)
+    if not removed:
+        return sql, 0
+    return "".join(str(statement) for statement in statements), removed
+
+
+def _explain(conn, sql: str) -> dict:
+    # EXPLAIN estimates, cached per query shape (literals ignored)
+    shape = canonicalize_sql(sql, keep_literals=False)
+    estimate = _explain_cache.get(shape)
+    if estimate is None:
+        rows = conn.raw.run(f"EXPLAIN (FORMAT JSON) {sql}")
+        plan = rows[0][0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        top = plan[0]["Plan"]
+        estimate = {"cost": float(top["Total Cost"]), "rows": int(top["Plan Rows"])}
+        _explain_cache.set(shape, estimate)
+        _count("explained")
+    return estimate
+
+
+def _fetch_capped(conn, sql: str, max_rows: int):
+    # Read-only transaction + server-side cursor: rows arrive in FETCH_SIZE batches
+    # and fetching stops at max_rows, so backend memory stays bounded.
+    raw = conn.raw
+    raw.run("BEGIN READ ONLY")
+    try:
+        raw.run(f"SET LOCAL statement_timeout = {int(QUERY_TIMEOUT_MS)}")
+        raw.run(f"DECLARE governed NO SCROLL CURSOR FOR {sql}")
+        rows, columns = [], []
+        while len(rows) < max_rows:
+            batch = raw.run(f"FETCH FORWARD {min(FETCH_SIZE, max_rows - len(rows))} FROM governed")
+            columns = raw.columns or columns
+            if not batch:
+                break
+            rows.extend(batch)
+        truncated = len(rows) >= max_rows and bool(raw.run("FETCH FORWARD 1 FROM governed"))
+        raw.run("CLOSE governed")
+        raw.run("COMMIT")
+    except Exception:
+        try:
+            raw.run("ROLLBACK")
+        except Exception:
+            pass
+        raise
+    return rows, columns, truncated
+
+
+def governed_execute(sql: str):
+    """
+    Run an untrusted (e.g. LLM-generated) query under the governor.
+    Raises QueryRejected when the plan estimate exceeds DB_MAX_QUERY_COST.
+    """
+    sql = sql.strip().rstrip(";")
+    try:
+        sql, removed = strip_heavy_columns(sql)
+    except QueryRejected as e:
+        _count("rejected")
+        print(f"[WARN] Query rejected: {e}")
+        raise
+    if removed:
+        _count("stripped", removed)
+
+    # The rejection is raised after the connection is back in the pool: an exception
+    # inside connection() would mark the (healthy) connection as broken.
+    reason = None
+    with get_pool().connection() as conn:
+        estimate = _explain(conn, sql)
+        if estimate["cost"] > MAX_QUERY_COST:
+            reason = f"estimated cost {estimate['cost']:.0f} exceeds DB_MAX_QUERY_COST {MAX_QUERY_COST:.0f}"
+        else:
+            if estimate["rows"] > MAX_RESULT_ROWS:
+                # Let the planner pick a fast-start plan instead of materializing everything
+                _count("limited")
+                sql = f"SELECT * FROM ({sql}) AS governed_result LIMIT {MAX_RESULT_ROWS + 1}"
+            rows, columns, truncated = _fetch_capped(conn, sql, MAX_RESULT_ROWS)
+    if reason is not None:
+        _count("rejected")
+        print(f"[WARN] Query rejected: {reason}")
+        raise QueryRejected(reason)
+
+    if truncated:
+        _count("truncated")
+        print(f"[WARN] Query result truncated to {MAX_RESULT_ROWS} rows")
+    result = QueryResult(rows, [c["name"] for c in columns or []])
+    result.truncated = truncated
+    return result
+
+
+def governor_stats() -> dict:
+    with _governor_lock:
+        counts = dict(_governor_counts)
+    return {**counts, "explain_cache": _explain_cache.stats(), "max_cost": MAX_QUERY_COST, "max_rows": MAX_RESULT_ROWS}
+
+
+def _execute_trusted(sql: str):
+    # SQL built by this backend (templates, cube/index loads) runs without the governor.
+    rows, columns = get_pool().run(sql)
+    return QueryResult(rows, [c["name"] for c in columns or []])
+
+
+def _execute(sql: str):
+    if GOVERNOR_ENABLED:
+        return governed_execute(sql)
+    return _execute_trusted(sql)
+
+
+def _fetch(sql: str, use_cache: bool, trusted: bool):
+    # Cache miss: run the query and store the rows (callers have already checked the cache)
+    rows = _execute_trusted(sql) if trusted else _execute(sql)
+    if use_cache:
+        result_cache.put(sql, rows)
     return rows
+
+
+def run_sql_query(sql: str, use_cache: bool = True, trusted: bool = False):
+    # Run SQL query on Postgres using a pooled connection (served from cache when possible).
+    use_cache = use_cache and RESULT_CACHE_ENABLED
+    if use_cache:
+        rows = result_cache.get(sql)
+        if rows is not None:
+            return rows
+    return _fetch(sql, use_cache, trusted)
+
+
+async def run_sql_query_async(sql: str, use_cache: bool = True, trusted: bool = False):
+    # Async variant of run_sql_query for the event-loop pipeline; the cache is checked
+    # here only, so a miss is counted (and the SQL canonicalized) once.
+    use_cache = use_cache and RESULT_CACHE_ENABLED
+    if use_cache:
+        rows = result_cache.get(sql)
+        if rows is not None:
+            return rows
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_executor(), _fetch, sql, use_cache, trusted)
+
+
+def invalidate_result_cache(tables=None) -> int:
+    # Drop cached results for the given tables (e.g. ['"FloodRisk"']) or all of them.
+    return result_cache.invalidate(tables)
+
+
+def refresh_result_cache(tables=None) -> int:
+    # Re-execute cached queries against the reloaded data.
+    return result_cache.refresh(_execute, tables)
@@ -0,0 +1,280 @@
+import argparse
+import json
+import math
+import sys
+from dataclasses import dataclass
+from typing import Callable, List, Optional, Sequence
+
+from database import ALLOWED_TABLES, SCHEMA_COLUMNS, _connect
+from llm import build_city_hazard_block, build_region_hazard_block
+from queryCompiler import compile_city_batch_block, compile_region_batch_block
+
+# Performance migrations for the hazard tables and a plan-regression check.
+#   python dbMigrations.py migrate [--dry-run]   GiST / trigram indexes, centroid columns
+#   python dbMigrations.py check [--natural]     EXPLAIN the app's query shapes; exit 1 on hazard-table seq scans
+#   python dbMigrations.py seed [--cells N]      synthetic hazard tables for a local PostGIS stand-in
+# Every migration is idempotent: it is skipped when already present. Indexes are
+# built CONCURRENTLY and don't block the app. The centroid columns are STORED
+# generated columns: adding one rewrites the whole table under an ACCESS
+# EXCLUSIVE lock, so reads and writes on that table wait until it is done. Run
+# `migrate` for those in a maintenance window (`migrate --dry-run` marks them "blocking").
+
+
+@dataclass
+class Migration:
+    name: str
+    statements: List[str]
+    exists_sql: str     # returns a row once the migration is in place
+    table: Optional[str] = None
+    index: Optional[str] = None
+    blocking: bool = False   # takes a lock that blocks reads and writes on the table
+
+
+def _relname(table: str) -> str:
+    return table.strip('"')
+
+
+def _index(name: str, table: str, using: str) -> Migration:
+    return Migration(
+        name=name,
+        statements=[f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table} {using}"],
+        # an interrupted CONCURRENTLY build leaves an invalid index behind; that one is rebuilt
+        exists_sql=f"SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+                   f"WHERE c.relname = '{name}' AND i.indisvalid",
+        table=table,
+        index=name,
+    )
+
+
+def _column(table: str, column: str, definition: str) -> Migration:
+    return Migration(
+        name=f"{_relname(table).lower()}_{column}",
+        statements=[f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {column} {definition}"],
+        exists_sql=f"SELECT 1 FROM information_schema.columns "
+                   f"WHERE table_name = '{_relname(table)}' AND column_name = '{column}'",
+        table=table,
+        # a STORED generated column rewrites the table under ACCESS EXCLUSIVE
+        blocking=True,
+    )
+
+
+def table_migrations(table: str) -> List[Migration]:
+    prefix = _relname(table).lower()
+    return [
+        # KNN ordering (geometry <-> point) needs a GiST index to avoid sorting the whole table
+        _index(f"{prefix}_geometry_gist", table, "USING gist (geometry)"),
+        # region ILIKE '%...%' filters: trigram index on the raw column the SQL filters on
+        _index(f"{prefix}_region_trgm", table, "USING gin (region gin_trgm_ops)"),
+        # precomputed centroids: point-to-point distances and cheap centroid loads
+        _column(table, "centroid", "geometry GENERATED ALWAYS AS (ST_Centroid(geometry)) STORED"),
+        _index(f"{prefix}_centroid_gist", table, "USING gist (centroid)"),
+    ]
+
+
+def all_migrations(tables: Sequence[str] = ALLOWED_TABLES) -> List[Migration]:
+    migrations = [Migration(
+        name="pg_trgm",
+        statements=["CREATE EXTENSION IF NOT EXISTS pg_trgm"],
+        exists_sql="SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'",
+    )]
+    for table in tables:
+        migrations.extend(table_migrations(table))
+    return migrations
+
+
+def apply_migrations(run: Callable[[str], list], tables: Sequence[str] = ALLOWED_TABLES,
+                     dry_run: bool = False) -> List[dict]:
+    """
+    Apply missing migrations with run(sql) (an autocommit connection) and ANALYZE
+    the tables that changed. A failing migration is reported and the rest still run.
+    Blocking migrations (column additions) are announced with a warning first.
+    """
+    report, changed = [], set()
+    for migration in all_migrations(tables):
+        if run(migration.exists_sql):
+            report.append({"name": migration.name, "status": "present"})
+            continue
+        if dry_run:
+            report.append({"name": migration.name, "status": "pending", "sql": migration.statements,
+                           "blocking": migration.blocking})
+            continue
+        if migration.blocking:
+            print(f"[WARN] Migration {migration.name} rewrites {migration.table} under an ACCESS EXCLUSIVE lock; "
+                  f"reads and writes on it block until it finishes")
+        try:
+            if migration.index:
+                run(f"DROP INDEX CONCURRENTLY IF EXISTS {migration.index}")
+            for statement in migration.statements:
+                run(statement)
+        except Exception as e:
+            print(f"[WARN] Migration {migration.name} failed: {e}")
+            report.append({"name": migration.name, "status": "failed", "error": str(e)})
+            continue
+        report.append({"name": migration.name, "status": "applied"})
+        if migration.table:
+            changed.add(migration.table)
+    for table in sorted(changed):
+        # fresh statistics so the planner actually picks the new indexes
+        run(f"ANALYZE {table}")
+    return report
+
+
+# Representative locations for the plan check (values don't matter, shapes do)
+_CITIES = [("Miami", -80.1918, 25.7617), ("London", -0.1276, 51.5072)]
+_REGIONS = [("India", "asia"), ("France", "europe")]
+
+
+def representative_queries(table: str) -> List[tuple]:
+    # (name, sql): planner templates, batch compiler and the LLM prompt's city/region shapes
+    label, lon, lat = _CITIES[0]
+    return [
+        ("city_block", build_city_hazard_block(label, lon, lat, table)),
+        ("region_block", build_region_hazard_block(*_REGIONS[0], table)),
+        ("city_batch", compile_city_batch_block(_CITIES, table)),
+        ("region_batch", compile_region_batch_block(_REGIONS, table)),
+        ("prompt_city", f"SELECT 'Miami' AS city, '{_relname(table)}' AS hazard, ssp5_10yr AS risk_score "
+                        f"FROM {table} ORDER BY geometry <-> ST_SetSRID(ST_MakePoint({lon}, {lat}), 4326) LIMIT 1"),
+        ("prompt_region", f"SELECT 'India' AS region, '{_relname(table)}' AS hazard, AVG(ssp5_10yr) AS risk_score "
+                          f"FROM {table} WHERE region ILIKE '%asia%'"),
+    ]
+
+
+def seq_scans(plan: dict, relations: Sequence[str]) -> List[str]:
+    # Relations from `relations` read with a Seq Scan anywhere in an EXPLAIN (FORMAT JSON) plan tree
+    found = []
+    if plan.get("Node Type") == "Seq Scan" and plan.get("Relation Name") in relations:
+        found.append(plan["Relation Name"])
+    for child in plan.get("Plans", []):
+        found.extend(seq_scans(child, relations))
+    return found
+
+
+def check_plans(explain: Callable[[str], dict], tables: Sequence[str] = ALLOWED_TABLES) -> List[dict]:
+    """
+    EXPLAIN every representative query; explain(sql) returns the top plan node.
+    A query fails when a hazard table is read with a sequential scan.
+    """
+    relations = [_relname(table) for table in tables]
+    results = []
+    for table in tables:
+        for name, sql in representative_queries(table):
+            plan = explain(sql)
+            scans = seq_scans(plan, relations)
+            results.append({
+                "table": _relname(table),
+                "query": name,
+                "ok": not scans,
+                "seq_scans": scans,
+                "cost": plan.get("Total Cost"),
+            })
+    return results
+
+
+def explainer(conn, natural: bool = False) -> Callable[[str], dict]:
+    """
+    EXPLAIN through a raw connection. By default sequential scans are disabled
+    for the check so a Seq Scan only shows up when no index can serve the query
+    (a small stand-in table would otherwise always be scanned); natural=True
+    keeps the planner's own choice, for databases with production-sized data.
+    """
+    def explain(sql: str) -> dict:
+        conn.run("BEGIN")
+        try:
+            if not natural:
+                conn.run("SET LOCAL enable_seqscan = off")
+            plan = conn.run(f"EXPLAIN (FORMAT JSON) {sql}")[0][0]
+        finally:
+            conn.run("ROLLBACK")
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return plan[0]["Plan"]
+    return explain
+
+
+def _continent(lon: str, lat: str) -> str:
+    # Rough continent for a synthetic cell, matching the gazetteer's region keys
+    return (
+        f"CASE WHEN {lon} < -30 AND {lat} > 12 THEN 'north_america' "
+        f"WHEN {lon} < -30 THEN 'south_america' "
+        f"WHEN {lon} < 60 AND {lat} > 35 THEN 'europe' "
+        f"WHEN {lon} < 60 THEN 'africa' "
+        f"WHEN {lon} > 110 AND {lat} < -10 THEN 'oceania' "
+        f"ELSE 'asia' END"
+    )
+
+
+def seed_statements(table: str, cells: int) -> List[str]:
+    """
+    CREATE + fill one synthetic hazard table: a grid of polygon cells with random
+    1-7 risk scores and random metrics, same columns as the real schema.
+    """
+    values = [c for c in SCHEMA_COLUMNS[table] if c not in ("id", "region", "risk_type", "risk_id", "geometry")]
+    columns = ",\n    ".join(f"{c} double precision" for c in values)
+    side = max(int(math.ceil(math.sqrt(cells))), 1)
+    step_lon, step_lat = 360.0 / side, 160.0 / side
+    generated = ", ".join(
+        "ceil(random() * 7)" if c.endswith("yr") else "round((random() * 100)::numeric, 2)" for c in values)
+    return [
+        f"""CREATE TABLE {table} (
+    id serial PRIMARY KEY,
+    region text,
+    risk_type text,
+    risk_id text,
+    geometry geometry(Polygon, 4326),
+    {columns}
+)""",
+        f"""INSERT INTO {table} (region, risk_type, risk_id, geometry, {", ".join(values)})
+SELECT {_continent("lon", "lat")}, '{_relname(table).lower()}', 'synthetic-' || g,
+       ST_MakeEnvelope(lon, lat, lon + {step_lon}, lat + {step_lat}, 4326), {generated}
+FROM (
+    SELECT g, -180 + (g % {side}) * {step_lon} AS lon, -80 + (g / {side}) * {step_lat} AS lat
+    FROM generate_series(0, {cells - 1}) AS g
+) cells""",
+        f"ANALYZE {table}",
+    ]
+
+
+def seed_stand_in(run: Callable[[str], list], tables: Sequence[str] = ALLOWED_TABLES, cells: int = 20000) -> dict:
+    # Only tables that don't exist yet are created, so this never touches real data
+    run("CREATE EXTENSION IF NOT EXISTS postgis")
+    report = {}
+    for table in tables:
+        if run(f"SELECT 1 FROM information_schema.tables WHERE table_name = '{_relname(table)}'"):
+            report[_relname(table)] = "exists"
+            continue
+        for statement in seed_statements(table, cells):
+            run(statement)
+        report[_relname(table)] = f"seeded {cells} cells"
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Hazard table performance migrations and plan checks.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    migrate = commands.add_parser("migrate", help="apply missing indexes and columns (columns lock the table)")
+    migrate.add_argument("--dry-run", action="store_true", help="only list pending migrations")
+    check = commands.add_parser("check", help="fail when the app's queries fall back to sequential scans")
+    check.add_argument("--natural", action="store_true", help="keep seq scans enabled (production-sized data)")
+    seed = commands.add_parser("seed", help="create synthetic hazard tables in an empty PostGIS database")
+    seed.add_argument("--cells", type=int, default=20000, help="cells per hazard table")
+    args = parser.parse_args()
+
+    # DB_* env config, same as the app; pg8000.native runs each statement in autocommit
+    conn = _connect()
+    try:
+        if args.command in ("migrate", "seed"):
+            # index builds and table rewrites run far longer than the app's DB_STATEMENT_TIMEOUT_MS
+            conn.run("SET statement_timeout = 0")
+        if args.command == "migrate":
+            print(json.dumps(apply_migrations(conn.run, dry_run=args.dry_run), indent=2))
+        elif args.command == "seed":
+            print(json.dumps(seed_stand_in(conn.run, cells=args.cells), indent=2))
+        else:
+            results = check_plans(explainer(conn, natural=args.natural))
+            print(json.dumps(results, indent=2))
+            failed = [r for r in results if not r["ok"]]
+            if failed:
+                print(f"[WARN] {len(failed)} of {len(results)} queries scan a hazard table sequentially")
+                sys.exit(1)
+    finally:
+        conn.close()
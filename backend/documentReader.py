@@ -1,19 +1,103 @@
-from typing import Optional
-from docx import Document
+import argparse
+import hashlib
+import json
+import os
+from typing import Optional, Tuple
 
 _DB_DOC_CACHE: Optional[str] = None
+# (path, mtime_ns, size) of the file _DB_DOC_CACHE was loaded from
+_DB_DOC_KEY: Optional[Tuple[str, int, int]] = None
+
+# The DB context is compiled ahead of time into a small JSON artifact next to the
+# DOCX (python documentReader.py --compile), so requests never need python-docx.
+# The artifact records the DOCX's sha256, size and mtime and is only used while
+# it still matches the DOCX.
+
+
+def artifact_path(file_path: str) -> str:
+    return os.path.splitext(file_path)[0] + ".json"
+
+
+def _sha256(file_path: str) -> str:
+    with open(file_path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def parse_docx(file_path: str) -> str:
+    # python-docx is only imported when the DOCX itself has to be parsed
+    from docx import Document
 
-# This is to load the reference database file for context
-def load_doc_from_db(file_path) -> str:
-    # cache it globally for referrencing it for the results later
-    global _DB_DOC_CACHE
-    if _DB_DOC_CACHE is not None:
-        return _DB_DOC_CACHE
     doc = Document(file_path)
     parts = []
     for para in doc.paragraphs:
         text = para.text.strip()
         if text:
             parts.append(text)
-    _DB_DOC_CACHE = "\n".join(parts)
-    return _DB_DOC_CACHE
\ No newline at end of file
+    return "\n".join(parts)
+
+
+def compile_doc(file_path: str, output_path: Optional[str] = None) -> str:
+    # Build step: DOCX -> JSON artifact with the extracted text
+    stat = os.stat(file_path)
+    artifact = {
+        "source": os.path.basename(file_path),
+        "sha256": _sha256(file_path),
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "text": parse_docx(file_path),
+    }
+    output_path = output_path or artifact_path(file_path)
+    tmp_path = output_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(artifact, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, output_path)
+    return output_path
+
+
+def _load_artifact(file_path: str, stat: Optional[os.stat_result]) -> Optional[str]:
+    # Artifact text if it was compiled from this exact DOCX (same size+mtime, else same hash)
+    try:
+        with open(artifact_path(file_path), encoding="utf-8") as f:
+            artifact = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if stat is None:
+        return artifact.get("text")  # DOCX not deployed: the artifact is all we have
+    if artifact.get("size") == stat.st_size and artifact.get("mtime_ns") == stat.st_mtime_ns:
+        return artifact.get("text")
+    if artifact.get("size") == stat.st_size and artifact.get("sha256") == _sha256(file_path):
+        return artifact.get("text")  # e.g. a fresh checkout: same content, new mtime
+    print(f"[WARN] {artifact_path(file_path)} is stale; parsing {file_path} (rerun documentReader.py --compile)")
+    return None
+
+
+# This is to load the reference database file for context
+def load_doc_from_db(file_path) -> str:
+    # cache it globally for referrencing it for the results later;
+    # reloaded when the DOCX changes on disk (one stat() per call)
+    global _DB_DOC_CACHE, _DB_DOC_KEY
+    try:
+        stat = os.stat(file_path)
+        key = (file_path, stat.st_mtime_ns, stat.st_size)
+    except OSError:
+        stat, key = None, (file_path, 0, 0)
+    if _DB_DOC_CACHE is not None and _DB_DOC_KEY == key:
+        return _DB_DOC_CACHE
+
+    text = _load_artifact(file_path, stat)
+    if text is None:
+        text = parse_docx(file_path)
+    _DB_DOC_CACHE, _DB_DOC_KEY = text, key
+    return _DB_DOC_CACHE
+
+
+if __name__ == "__main__":
+    # python documentReader.py --compile [Beehive_DB_Context_Summary.docx]
+    parser = argparse.ArgumentParser(description="Compile the DB context DOCX into a JSON artifact.")
+    parser.add_argument("--compile", action="store_true")
+    parser.add_argument("path", nargs="?", default="Beehive_DB_Context_Summary.docx")
+    args = parser.parse_args()
+    if args.compile:
+        print(compile_doc(args.path))
+    else:
+        print(load_doc_from_db(args.path))
@@ -0,0 +1,181 @@
+import asyncio
+import time
+from typing import List, Optional
+
+from database import QueryResult
+
+# Offline stand-ins for OpenAI and Postgres, used by benchmark.py.
+# Latencies are configurable so the pipeline's own overhead can be measured
+# separately from (simulated) network and database time.
+
+DEFAULT_SQL = (
+    "SELECT region, AVG(ssp5_10yr) AS risk_score\n"
+    "FROM \"FloodRisk\"\n"
+    "WHERE region ILIKE '%north america%'\n"
+    "GROUP BY region\n"
+    "ORDER BY risk_score DESC\n"
+    "LIMIT 10"
+)
+
+DEFAULT_ANSWER = (
+    "### Flood risk\n"
+    "- **Risk score:** Moderate (0.42 on a 0-1 scale) under SSP5 for the next 10 years.\n"
+    "- Coastal areas in the region are the most exposed; inland cells are mostly low risk.\n"
+    "- Scores are averaged over the nearest mesh cells, so local conditions can differ.\n"
+)
+
+
+class _Message:
+    def __init__(self, content):
+        self.content = content
+
+
+class _Choice:
+    def __init__(self, content, stream: bool):
+        if stream:
+            self.delta = _Message(content)
+        else:
+            self.message = _Message(content)
+
+
+class _PromptDetails:
+    def __init__(self, cached_tokens: int):
+        self.cached_tokens = cached_tokens
+
+
+class _Usage:
+    def __init__(self, prompt_tokens: int, completion_tokens: int, cached_tokens: int = 0):
+        self.prompt_tokens = prompt_tokens
+        self.completion_tokens = completion_tokens
+        self.total_tokens = prompt_tokens + completion_tokens
+        self.prompt_tokens_details = _PromptDetails(cached_tokens)
+
+
+class FakeCompletion:
+    def __init__(self, content: str, prompt_tokens: int = 0, cached_tokens: int = 0):
+        self.choices = [_Choice(content, stream=False)]
+        self.usage = _Usage(prompt_tokens, max(len(content) // 4, 1), cached_tokens)
+
+
+class FakeChunk:
+    def __init__(self, content: Optional[str], usage: Optional[_Usage] = None):
+        # a usage-only chunk (stream_options include_usage) has no choices
+        self.choices = [_Choice(content, stream=True)] if usage is None else []
+        self.usage = usage
+
+
+def split_chunks(text: str, chunk_chars: int = 4) -> List[str]:
+    # Roughly one token per chunk, like the real streaming API
+    return [text[i:i + chunk_chars] for i in range(0, len(text), chunk_chars)]
+
+
+class _FakeStream:
+    def __init__(self, chunks: List[str], interval: float, usage: Optional[_Usage] = None):
+        self._chunks = chunks
+        self._interval = interval
+        self._usage = usage
+
+    def __aiter__(self):
+        return self._generate()
+
+    async def _generate(self):
+        for i, chunk in enumerate(self._chunks):
+            if i and self._interval:
+                await asyncio.sleep(self._interval)
+            yield FakeChunk(chunk)
+        if self._usage is not None:
+            yield FakeChunk(None, usage=self._usage)
+
+
+class PromptPrefixCache:
+    # Prompt caching stand-in: a system message seen before counts as cached
+    def __init__(self):
+        self._prefixes = set()
+
+    def __call__(self, messages: List[dict]) -> int:
+        if not messages or messages[0].get("role") != "system":
+            return 0
+        prefix = messages[0].get("content") or ""
+        if prefix in self._prefixes:
+            return len(prefix) // 4
+        self._prefixes.add(prefix)
+        return 0
+
+
+class _FakeCompletions:
+    def __init__(self, owner: "FakeAsyncOpenAI"):
+        self._owner = owner
+
+    async def create(self, model: str = None, messages: List[dict] = None, stream: bool = False,
+                     stream_options: Optional[dict] = None, **kwargs):
+        owner = self._owner
+        owner.calls += 1
+        prompt_chars = sum(len(m.get("content") or "") for m in messages or [])
+        cached = owner.cached_tokens(messages or [])
+        if owner.latency:
+            # time to first byte / full non-streamed response
+            await asyncio.sleep(owner.latency)
+        if stream:
+            owner.streamed += 1
+            interval = 1.0 / owner.chunk_rate if owner.chunk_rate else 0.0
+            chunks = split_chunks(owner.answer)
+            usage = _Usage(prompt_chars // 4, len(chunks), cached) if (stream_options or {}).get("include_usage") else None
+            return _FakeStream(chunks, interval, usage)
+        return FakeCompletion(owner.sql_text, prompt_tokens=prompt_chars // 4, cached_tokens=cached)
+
+
+class _FakeChat:
+    def __init__(self, owner: "FakeAsyncOpenAI"):
+        self.completions = _FakeCompletions(owner)
+
+
+class FakeAsyncOpenAI:
+    """
+    Drop-in for AsyncOpenAI's chat.completions.create.
+    Non-streamed calls (SQL generation) return sql_text after `latency` seconds;
+    streamed calls wait `latency` and then emit `answer` at `chunk_rate` chunks/second.
+    """
+
+    def __init__(self, latency: float = 0.0, chunk_rate: float = 0.0,
+                 sql_text: str = DEFAULT_SQL, answer: str = DEFAULT_ANSWER):
+        self.latency = latency
+        self.chunk_rate = chunk_rate
+        self.sql_text = sql_text
+        self.answer = answer
+        self.calls = 0
+        self.streamed = 0
+        self.cached_tokens = PromptPrefixCache()
+        self.chat = _FakeChat(self)
+
+
+class FakeDatabase:
+    """
+    Stand-in for run_sql_query / run_sql_query_async: waits `latency` seconds and
+    returns `rows` synthetic [location, hazard, region, risk_score] rows.
+    The hazard SQL is PostGIS-specific, so rows are generated rather than queried.
+    """
+
+    COLUMNS = ["location", "hazard", "region", "risk_score"]
+
+    def __init__(self, latency: float = 0.0, rows: int = 20):
+        self.latency = latency
+        self.rows = rows
+        self.queries = 0
+
+    def _result(self) -> QueryResult:
+        self.queries += 1
+        rows = [
+            [f"location {i}", "FloodRisk", "North America", round(0.9 - i * 0.9 / max(self.rows, 1), 4)]
+            for i in range(self.rows)
+        ]
+        return QueryResult(rows, self.COLUMNS)
+
+    def run(self, sql: str, use_cache: bool = True, trusted: bool = False) -> QueryResult:
+        if self.latency:
+            time.sleep(self.latency)
+        return self._result()
+
+    async def run_async(self, sql: str, use_cache: bool = True, trusted: bool = False) -> QueryResult:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self._result()
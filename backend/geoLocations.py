@@ -0,0 +1,293 @@
+import re
+from typing import List, Optional, Tuple
+
+# Offline gazetteer used by the query planner so common questions never need the
+# LLM to geocode. Coordinates are approximate city centres as (lon, lat), which is
+# the argument order of ST_MakePoint.
+
+REGIONS = ["north_america", "south_america", "europe", "asia", "oceania", "africa"]
+
+CITIES = {
+    # North America
+    "New York": (-74.006, 40.7128),
+    "Los Angeles": (-118.2437, 34.0522),
+    "Chicago": (-87.6298, 41.8781),
+    "Houston": (-95.3698, 29.7604),
+    "Phoenix": (-112.074, 33.4484),
+    "Philadelphia": (-75.1652, 39.9526),
+    "San Antonio": (-98.4936, 29.4241),
+    "San Diego": (-117.1611, 32.7157),
+    "Dallas": (-96.797, 32.7767),
+    "Austin": (-97.7431, 30.2672),
+    "San Francisco": (-122.4194, 37.7749),
+    "Seattle": (-122.3321, 47.6062),
+    "Denver": (-104.9903, 39.7392),
+    "Washington DC": (-77.0369, 38.9072),
+    "Boston": (-71.0589, 42.3601),
+    "Charlotte": (-80.8431, 35.2271),
+    "Atlanta": (-84.388, 33.749),
+    "Miami": (-80.1918, 25.7617),
+    "Tampa": (-82.4572, 27.9506),
+    "Orlando": (-81.3792, 28.5383),
+    "New Orleans": (-90.0715, 29.9511),
+    "Nashville": (-86.7816, 36.1627),
+    "Detroit": (-83.0458, 42.3314),
+    "Minneapolis": (-93.265, 44.9778),
+    "Las Vegas": (-115.1398, 36.1699),
+    "Portland": (-122.6765, 45.5231),
+    "Sacramento": (-121.4944, 38.5816),
+    "Salt Lake City": (-111.891, 40.7608),
+    "Honolulu": (-157.8583, 21.3069),
+    "Anchorage": (-149.9003, 61.2181),
+    "Toronto": (-79.3832, 43.6532),
+    "Montreal": (-73.5673, 45.5017),
+    "Vancouver": (-123.1207, 49.2827),
+    "Calgary": (-114.0719, 51.0447),
+    "Ottawa": (-75.6972, 45.4215),
+    "Mexico City": (-99.1332, 19.4326),
+    "Guadalajara": (-103.3496, 20.6597),
+    "Monterrey": (-100.3161, 25.6866),
+    "Cancun": (-86.8515, 21.1619),
+    "Havana": (-82.3666, 23.1136),
+    "San Juan": (-66.1057, 18.4655),
+    "Panama City": (-79.5199, 8.9824),
+    # South America
+    "Sao Paulo": (-46.6333, -23.5505),
+    "Rio de Janeiro": (-43.1729, -22.9068),
+    "Brasilia": (-47.8825, -15.7942),
+    "Buenos Aires": (-58.3816, -34.6037),
+    "Santiago": (-70.6693, -33.4489),
+    "Lima": (-77.0428, -12.0464),
+    "Bogota": (-74.0721, 4.711),
+    "Medellin": (-75.5636, 6.2442),
+    "Caracas": (-66.9036, 10.4806),
+    "Quito": (-78.4678, -0.1807),
+    "Montevideo": (-56.1645, -34.9011),
+    "La Paz": (-68.1193, -16.4897),
+    # Europe
+    "London": (-0.1276, 51.5072),
+    "Manchester": (-2.2426, 53.4808),
+    "Edinburgh": (-3.1883, 55.9533),
+    "Dublin": (-6.2603, 53.3498),
+    "Paris": (2.3522, 48.8566),
+    "Marseille": (5.3698, 43.2965),
+    "Berlin": (13.405, 52.52),
+    "Munich": (11.582, 48.1351),
+    "Frankfurt": (8.6821, 50.1109),
+    "Hamburg": (9.9937, 53.5511),
+    "Amsterdam": (4.9041, 52.3676),
+    "Rotterdam": (4.4777, 51.9244),
+    "Brussels": (4.3517, 50.8503),
+    "Zurich": (8.5417, 47.3769),
+    "Geneva": (6.1432, 46.2044),
+    "Vienna": (16.3738, 48.2082),
+    "Madrid": (-3.7038, 40.4168),
+    "Barcelona": (2.1734, 41.3851),
+    "Lisbon": (-9.1393, 38.7223),
+    "Rome": (12.4964, 41.9028),
+    "Milan": (9.19, 45.4642),
+    "Venice": (12.3155, 45.4408),
+    "Athens": (23.7275, 37.9838),
+    "Istanbul": (28.9784, 41.0082),
+    "Stockholm": (18.0686, 59.3293),
+    "Oslo": (10.7522, 59.9139),
+    "Copenhagen": (12.5683, 55.6761),
+    "Helsinki": (24.9384, 60.1699),
+    "Warsaw": (21.0122, 52.2297),
+    "Prague": (14.4378, 50.0755),
+    "Budapest": (19.0402, 47.4979),
+    "Bucharest": (26.1025, 44.4268),
+    "Kyiv": (30.5234, 50.4501),
+    "Moscow": (37.6173, 55.7558),
+    # Asia
+    "Tokyo": (139.6503, 35.6762),
+    "Osaka": (135.5023, 34.6937),
+    "Seoul": (126.978, 37.5665),
+    "Beijing": (116.4074, 39.9042),
+    "Shanghai": (121.4737, 31.2304),
+    "Shenzhen": (114.0579, 22.5431),
+    "Guangzhou": (113.2644, 23.1291),
+    "Hong Kong": (114.1694, 22.3193),
+    "Taipei": (121.5654, 25.033),
+    "Manila": (120.9842, 14.5995),
+    "Bangkok": (100.5018, 13.7563),
+    "Ho Chi Minh City": (106.6297, 10.8231),
+    "Hanoi": (105.8342, 21.0278),
+    "Kuala Lumpur": (101.6869, 3.139),
+    "Singapore": (103.8198, 1.3521),
+    "Jakarta": (106.8456, -6.2088),
+    "Mumbai": (72.8777, 19.076),
+    "Delhi": (77.1025, 28.7041),
+    "Bangalore": (77.5946, 12.9716),
+    "Chennai": (80.2707, 13.0827),
+    "Kolkata": (88.3639, 22.5726),
+    "Hyderabad": (78.4867, 17.385),
+    "Dhaka": (90.4125, 23.8103),
+    "Karachi": (67.0011, 24.8607),
+    "Lahore": (74.3587, 31.5204),
+    "Colombo": (79.8612, 6.9271),
+    "Kathmandu": (85.324, 27.7172),
+    "Dubai": (55.2708, 25.2048),
+    "Abu Dhabi": (54.3773, 24.4539),
+    "Doha": (51.531, 25.2854),
+    "Riyadh": (46.6753, 24.7136),
+    "Tehran": (51.389, 35.6892),
+    "Tel Aviv": (34.7818, 32.0853),
+    # Oceania
+    "Sydney": (151.2093, -33.8688),
+    "Melbourne": (144.9631, -37.8136),
+    "Brisbane": (153.0251, -27.4698),
+    "Perth": (115.8605, -31.9505),
+    "Adelaide": (138.6007, -34.9285),
+    "Auckland": (174.7633, -36.8485),
+    "Wellington": (174.7762, -41.2865),
+    # Africa
+    "Cairo": (31.2357, 30.0444),
+    "Lagos": (3.3792, 6.5244),
+    "Nairobi": (36.8219, -1.2921),
+    "Johannesburg": (28.0473, -26.2041),
+    "Cape Town": (18.4241, -33.9249),
+    "Casablanca": (-7.5898, 33.5731),
+    "Accra": (-0.187, 5.6037),
+    "Addis Ababa": (38.7578, 8.9806),
+    "Dar es Salaam": (39.2083, -6.7924),
+    "Kinshasa": (15.2663, -4.4419),
+    "Algiers": (3.0588, 36.7538),
+    "Tunis": (10.1815, 36.8065),
+}
+
+CITY_ALIASES = {
+    "nyc": "New York",
+    "new york city": "New York",
+    "la": "Los Angeles",
+    "sf": "San Francisco",
+    "washington d.c.": "Washington DC",
+    "washington, dc": "Washington DC",
+    "d.c.": "Washington DC",
+    "são paulo": "Sao Paulo",
+    "bogotá": "Bogota",
+    "medellín": "Medellin",
+    "zürich": "Zurich",
+    "new delhi": "Delhi",
+    "bengaluru": "Bangalore",
+    "bombay": "Mumbai",
+    "calcutta": "Kolkata",
+    "madras": "Chennai",
+    "saigon": "Ho Chi Minh City",
+    "peking": "Beijing",
+    "kiev": "Kyiv",
+}
+
+COUNTRIES = {
+    # North America
+    "United States": "north_america", "Canada": "north_america", "Mexico": "north_america",
+    "Cuba": "north_america", "Jamaica": "north_america", "Haiti": "north_america",
+    "Dominican Republic": "north_america", "Puerto Rico": "north_america", "Bahamas": "north_america",
+    "Guatemala": "north_america", "Honduras": "north_america", "Costa Rica": "north_america",
+    "Panama": "north_america", "Nicaragua": "north_america", "El Salvador": "north_america",
+    # South America
+    "Brazil": "south_america", "Argentina": "south_america", "Chile": "south_america",
+    "Peru": "south_america", "Colombia": "south_america", "Venezuela": "south_america",
+    "Ecuador": "south_america", "Bolivia": "south_america", "Uruguay": "south_america",
+    "Paraguay": "south_america",
+    # Europe
+    "United Kingdom": "europe", "Ireland": "europe", "France": "europe", "Germany": "europe",
+    "Netherlands": "europe", "Belgium": "europe", "Switzerland": "europe", "Austria": "europe",
+    "Spain": "europe", "Portugal": "europe", "Italy": "europe", "Greece": "europe",
+    "Sweden": "europe", "Norway": "europe", "Denmark": "europe", "Finland": "europe",
+    "Iceland": "europe", "Poland": "europe", "Czech Republic": "europe", "Hungary": "europe",
+    "Romania": "europe", "Bulgaria": "europe", "Croatia": "europe", "Serbia": "europe",
+    "Ukraine": "europe", "Russia": "europe",
+    # Asia
+    "China": "asia", "Japan": "asia", "South Korea": "asia", "North Korea": "asia",
+    "Taiwan": "asia", "Philippines": "asia", "Vietnam": "asia", "Thailand": "asia",
+    "Malaysia": "asia", "Indonesia": "asia", "Myanmar": "asia", "Cambodia": "asia",
+    "India": "asia", "Pakistan": "asia", "Bangladesh": "asia", "Sri Lanka": "asia",
+    "Nepal": "asia", "Mongolia": "asia", "Kazakhstan": "asia", "Turkey": "asia",
+    "Iran": "asia", "Iraq": "asia", "Saudi Arabia": "asia", "United Arab Emirates": "asia",
+    "Qatar": "asia", "Israel": "asia", "Jordan": "asia",
+    # Oceania
+    "Australia": "oceania", "New Zealand": "oceania", "Papua New Guinea": "oceania", "Fiji": "oceania",
+    # Africa
+    "Egypt": "africa", "Nigeria": "africa", "Kenya": "africa", "South Africa": "africa",
+    "Morocco": "africa", "Ghana": "africa", "Ethiopia": "africa", "Tanzania": "africa",
+    "Algeria": "africa", "Tunisia": "africa", "Senegal": "africa", "Uganda": "africa",
+    "Mozambique": "africa", "Madagascar": "africa", "Angola": "africa",
+    "Democratic Republic of the Congo": "africa",
+}
+
+COUNTRY_ALIASES = {
+    "us": "United States", "u.s.": "United States", "usa": "United States", "u.s.a.": "United States",
+    "america": "United States", "united states of america": "United States",
+    "uk": "United Kingdom", "u.k.": "United Kingdom", "britain": "United Kingdom",
+    "great britain": "United Kingdom", "england": "United Kingdom", "scotland": "United Kingdom",
+    "wales": "United Kingdom", "holland": "Netherlands", "korea": "South Korea",
+    "uae": "United Arab Emirates", "drc": "Democratic Republic of the Congo",
+    "czechia": "Czech Republic",
+}
+
+CONTINENTS = {
+    "north america": "north_america",
+    "south america": "south_america",
+    "latin america": "south_america",
+    "europe": "europe",
+    "asia": "asia",
+    "oceania": "oceania",
+    "africa": "africa",
+}
+
+
+def _build_index():
+    # lowercase name -> (kind, canonical label, payload)
+    index = {}
+    for name, coords in CITIES.items():
+        index[name.lower()] = ("city", name, coords)
+    for alias, name in CITY_ALIASES.items():
+        index[alias] = ("city", name, CITIES[name])
+    for name, region in COUNTRIES.items():
+        index[name.lower()] = ("region", name, region)
+    for alias, name in COUNTRY_ALIASES.items():
+        index[alias] = ("region", name, COUNTRIES[name])
+    for name, region in CONTINENTS.items():
+        index[name] = ("region", name.title(), region)
+    return index
+
+
+_INDEX = _build_index()
+# Longest names first so "new york city" wins over "new york", "south africa" over "africa"
+_PATTERN = re.compile(
+    r"(?<![\w.])(" + "|".join(re.escape(n) for n in sorted(_INDEX, key=len, reverse=True)) + r")(?![\w])"
+)
+
+# Short aliases that are also common English words are only matched in upper case.
+_CASE_SENSITIVE = {"us", "la"}
+
+
+def find_locations(text: str) -> List[Tuple[str, str, object]]:
+    """
+    Find gazetteer places in text, in order of appearance and without duplicates.
+    Returns (kind, label, payload) with kind "city" (payload (lon, lat)) or
+    "region" (payload region key).
+    """
+    found = []
+    seen = set()
+    for match in _PATTERN.finditer(text.lower()):
+        name = match.group(1)
+        original = text[match.start():match.end()]
+        if name in _CASE_SENSITIVE and not original.isupper():
+            continue
+        kind, label, payload = _INDEX[name]
+        if (kind, label) not in seen:
+            seen.add((kind, label))
+            found.append((kind, label, payload))
+    return found
+
+
+def city_coordinates(name: str) -> Optional[Tuple[float, float]]:
+    entry = _INDEX.get(name.lower())
+    return entry[2] if entry and entry[0] == "city" else None
+
+
+def region_for(name: str) -> Optional[str]:
+    entry = _INDEX.get(name.lower())
+    return entry[2] if entry and entry[0] == "region" else None
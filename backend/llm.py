@@ -1,14 +1,66 @@
+import json
 import os
+import time
 from dotenv import load_dotenv
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
 from database import HAZARD_KEYWORDS,SCHEMA,HAZARD_KEYWORDS
 import re
 from documentReader import load_doc_from_db
+from sqlCache import SqlCache, prompt_fingerprint
+from summaryCache import SummaryCache
+from resultCompactor import CompactedResult, compact_result, estimate_tokens
+from metrics import LLM_IN_FLIGHT, LLM_QUEUE_DEPTH, record_llm_call
+from llmGateway import LLMGateway, LLMOverloaded
+from functools import lru_cache
 from typing import List, Optional
 
 load_dotenv()
 
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", 30))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", 3))
+
+# The sync client (scripts, tests) relies on the SDK's own retries
+client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"), timeout=LLM_TIMEOUT_SECONDS, max_retries=LLM_MAX_RETRIES)
+# Async client for the /ask pipeline so waiting on OpenAI never holds a worker thread.
+# Retries are done by llm_gateway, so the SDK's are off.
+aclient = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), timeout=LLM_TIMEOUT_SECONDS, max_retries=0)
+
+# Admission control for every async OpenAI call (concurrency, quota, queue, retries)
+llm_gateway = LLMGateway(
+    max_concurrency=int(os.getenv("LLM_MAX_CONCURRENCY", 16)),
+    default_model_concurrency=int(os.getenv("LLM_MODEL_CONCURRENCY", 0)) or None,
+    requests_per_minute=float(os.getenv("LLM_REQUESTS_PER_MINUTE", 0)),
+    tokens_per_minute=float(os.getenv("LLM_TOKENS_PER_MINUTE", 0)),
+    max_queue=int(os.getenv("LLM_MAX_QUEUE", 64)),
+    max_retries=LLM_MAX_RETRIES,
+    backoff_base=float(os.getenv("LLM_BACKOFF_BASE_SECONDS", 0.5)),
+    backoff_max=float(os.getenv("LLM_BACKOFF_MAX_SECONDS", 8)),
+    timeout=LLM_TIMEOUT_SECONDS,
+    stream_idle_timeout=float(os.getenv("LLM_STREAM_IDLE_TIMEOUT_SECONDS", 30)),
+)
+LLM_QUEUE_DEPTH.set_function(lambda: llm_gateway.waiting)
+LLM_IN_FLIGHT.set_function(lambda: llm_gateway.in_flight)
+# Completion tokens assumed per call when charging the tokens/minute bucket
+EXPECTED_COMPLETION_TOKENS = 400
+
+
+def _acreate(**kwargs):
+    # Resolved at call time so tests and benchmarks can swap aclient
+    return aclient.chat.completions.create(**kwargs)
+
+
+def _quota_tokens(messages: List[dict]) -> int:
+    return sum(estimate_tokens(m.get("content") or "") for m in messages) + EXPECTED_COMPLETION_TOKENS
+
+# Bump when the SQL generation rules change in a way the prompt text doesn't show
+SQL_PROMPT_VERSION = "2"
+
+# NL -> SQL cache; set SQL_CACHE_PATH to persist it across restarts
+sql_cache = SqlCache(
+    max_entries=int(os.getenv("SQL_CACHE_MAX_ENTRIES", 2048)),
+    ttl=float(os.getenv("SQL_CACHE_TTL", 86400)),
+    path=os.getenv("SQL_CACHE_PATH") or None,
+)
 
 
 # Extract the SQL query from the text from the llm generated text
@@ -27,16 +79,106 @@ def extract_sql_from_text(text: str) -> Optional[str]:
     return None
 
 # Call the llm model to generate the answer
-def call_llm(messages: List[dict], model: str = "gpt-4o-mini", temperature: float = 0.0) -> str:
+def call_llm(messages: List[dict], model: str = "gpt-4o-mini", temperature: float = 0.0, call: str = "sql") -> str:
   
+    started = time.perf_counter()
     resp = client.chat.completions.create(
         model=model,
         messages=messages,
         temperature=temperature,
     )
+    record_llm_call(call, getattr(resp, "usage", None), time.perf_counter() - started)
     return resp.choices[0].message.content
 
 
+async def call_llm_async(messages: List[dict], model: str = "gpt-4o-mini", temperature: float = 0.0,
+                         call: str = "sql") -> str:
+
+    started = time.perf_counter()
+    resp = await llm_gateway.complete(
+        _acreate,
+        model=model,
+        tokens=_quota_tokens(messages),
+        messages=messages,
+        temperature=temperature,
+    )
+    record_llm_call(call, getattr(resp, "usage", None), time.perf_counter() - started)
+    return resp.choices[0].message.content
+
+
+# Prompts are assembled as a static prefix (rules + DB context) followed by the
+# per-request part. The prefix is byte-identical across requests for a given
+# version and DB context, so OpenAI's automatic prompt caching can reuse it.
+SQL_SYSTEM_RULES = """
+You are a SQL generator for a Postgres climate risk database.
+
+Use only existing tables/columns.
+Tables: "CycloneRisk", "FloodRisk", "HeatRisk", "WildfireRisk".
+
+Location rules:
+- If a specific city is mentioned in the user query:
+* Determine its approximate longitude/latitude yourself.
+* Always use those coordinates with:
+    ORDER BY geometry <-> ST_SetSRID(ST_MakePoint(lon, lat), 4326)
+    LIMIT 1
+* Do NOT put geometry <-> ... in a WHERE clause.
+* Do not use AVG() here — just return the nearest cell value.
+* Include a literal column with the city name using AS city.
+
+- If a country is mentioned (but not a specific city):
+* Infer its continent-scale region (one of: north_america, south_america, europe, asia, oceania, africa).
+* Use WHERE region ILIKE '%<region>%' to filter.
+* Apply AVG() to produce a single row per hazard.
+* Include a literal column with the country/region name using AS region.
+
+- If multiple cities or countries are mentioned:
+* Generate one SELECT per location × hazard.
+* If a SELECT contains ORDER BY or LIMIT, wrap it in parentheses.
+* Always combine SELECTs with UNION ALL.
+* Never separate SELECTs with commas.
+
+
+Hazard rules:
+- cyclone → "CycloneRisk"
+- flood → "FloodRisk"
+- heat → "HeatRisk"
+- wildfire → "WildfireRisk"
+- If the user asks about "physical risk", "climate risk", or does not specify hazards → query all four tables.
+
+Column rules:
+- Risk/severity columns follow the pattern: ssp{X}_{Y}yr
+  * Valid X values: 1, 3, 5
+  * Valid Y values: 1, 10, 30
+  * Example: ssp1_1yr, ssp3_10yr, ssp5_30yr
+- Counts/frequency:
+  * "CycloneRisk" → total_annual_freq or cat{Z}_annual_freq
+  * "FloodRisk" → ssp{X}_{Y}yr_rp050_percent_flooded, ssp{X}_{Y}yr_rp200_percent_flooded
+  * "HeatRisk" → ssp{X}_{Y}yr_ann_days_above_096f, ssp{X}_{Y}yr_ann_heat_waves_4d5percent
+  * "WildfireRisk" → ssp{X}_{Y}yr_fires_30yr
+- Prefer ssp5_10yr unless the user specifies another valid SSP or horizon.
+- If the user specifies an invalid horizon (e.g., 5 years), map it to the nearest valid horizon (1yr, 10yr, or 30yr).
+
+### Output rules:
+- Return ONLY the SQL query string.
+- Do not include markdown, code fences, or explanations.
+- Always use quoted CamelCase table names: "CycloneRisk", "FloodRisk", "HeatRisk", "WildfireRisk".
+- Never use unquoted or lowercase table names.
+- Do not use SELECT * — only select needed columns.
+- Always alias numeric values with AS risk_score.
+- Always alias hazard with a literal string using AS hazard.
+- Always alias the location with AS city (for cities) or AS region (for countries/continents).
+- The final result must always have three columns: risk_score, hazard, and either city OR region (never both).
+- Do not label a country or continent as a city.
+- Combine multiple SELECTs only with UNION ALL. Never use commas between subqueries.
+""".strip()
+
+
+@lru_cache(maxsize=4)
+def sql_system_prompt(db_context_compact: str) -> str:
+    # Static prefix for SQL generation: rules first, then the DB context document
+    return f"{SQL_SYSTEM_RULES}\n\nDatabase context:\n{db_context_compact}"
+
+
 def build_sql_prompt(
     db_context_compact: str,
     user_query: str,
@@ -64,99 +206,56 @@ def build_sql_prompt(
     if not tbls or "ALL" in tbls:
         tbls = ["CycloneRisk", "FloodRisk", "HeatRisk", "WildfireRisk"]
 
-    system = f"""
-    You are a SQL generator for a Postgres climate risk database.
-
-    Use only existing tables/columns.
-    Tables: "CycloneRisk", "FloodRisk", "HeatRisk", "WildfireRisk".
-
-    Location rules:
-    - If a specific city is mentioned in the user query:
-    * Determine its approximate longitude/latitude yourself.
-    * Always use those coordinates with:
-        ORDER BY geometry <-> ST_SetSRID(ST_MakePoint(lon, lat), 4326)
-        LIMIT 1
-    * Do NOT put geometry <-> ... in a WHERE clause.
-    * Do not use AVG() here — just return the nearest cell value.
-    * Include a literal column with the city name using AS city.
-
-    - If a country is mentioned (but not a specific city):
-    * Infer its continent-scale region (one of: north_america, south_america, europe, asia, oceania, africa).
-    * Use WHERE region ILIKE '%<region>%' to filter.
-    * Apply AVG() to produce a single row per hazard.
-    * Include a literal column with the country/region name using AS region.
-
-    - If multiple cities or countries are mentioned:
-    * Generate one SELECT per location × hazard.
-    * If a SELECT contains ORDER BY or LIMIT, wrap it in parentheses.
-    * Always combine SELECTs with UNION ALL.
-    * Never separate SELECTs with commas.
-
-
-    Hazard rules:
-    - cyclone → "CycloneRisk"
-    - flood → "FloodRisk"
-    - heat → "HeatRisk"
-    - wildfire → "WildfireRisk"
-    - If the user asks about "physical risk", "climate risk", or does not specify hazards → query all four tables.
-
-    Column rules:
-    - Risk/severity columns follow the pattern: ssp{{X}}_{{Y}}yr
-      * Valid X values: 1, 3, 5
-      * Valid Y values: 1, 10, 30
-      * Example: ssp1_1yr, ssp3_10yr, ssp5_30yr
-    - Counts/frequency:
-      * "CycloneRisk" → total_annual_freq or cat{{Z}}_annual_freq
-      * "FloodRisk" → ssp{{X}}_{{Y}}yr_rp050_percent_flooded, ssp{{X}}_{{Y}}yr_rp200_percent_flooded
-      * "HeatRisk" → ssp{{X}}_{{Y}}yr_ann_days_above_096f, ssp{{X}}_{{Y}}yr_ann_heat_waves_4d5percent
-      * "WildfireRisk" → ssp{{X}}_{{Y}}yr_fires_30yr
-    - Prefer ssp5_10yr unless the user specifies another valid SSP or horizon.
-    - If the user specifies an invalid horizon (e.g., 5 years), map it to the nearest valid horizon (1yr, 10yr, or 30yr).
-
-    ### Output rules:
-    - Return ONLY the SQL query string.
-    - Do not include markdown, code fences, or explanations.
-    - Always use quoted CamelCase table names: "CycloneRisk", "FloodRisk", "HeatRisk", "WildfireRisk".
-    - Never use unquoted or lowercase table names.
-    - Do not use SELECT * — only select needed columns.
-    - Always alias numeric values with AS risk_score.
-    - Always alias hazard with a literal string using AS hazard.
-    - Always alias the location with AS city (for cities) or AS region (for countries/continents).
-    - The final result must always have three columns: risk_score, hazard, and either city OR region (never both).
-    - Do not label a country or continent as a city.
-    - Combine multiple SELECTs only with UNION ALL. Never use commas between subqueries.
-
-    """
-
+    # Only the request-specific fields go after the cached prefix
     user = {
         "user_query": user_query,
         "region": region,
         "hazards": tbls,
-        "db_context": db_context_compact,
     }
 
     return [
-        {"role": "system", "content": system.strip()},
-        {"role": "user", "content": f"{user}"}
+        {"role": "system", "content": sql_system_prompt(db_context_compact)},
+        {"role": "user", "content": json.dumps(user, ensure_ascii=False)}
     ]
 
 
-def generate_sql(user_query: str, hazard_tables, region=None) -> str:
-    """Master SQL generator with LLM + fallback."""
+def _sql_messages(user_query: str, hazard_tables, region=None) -> List[dict]:
     database_context = load_doc_from_db('Beehive_DB_Context_Summary.docx')
 
-    # Build messages
-    messages = build_sql_prompt(
+    return build_sql_prompt(
         db_context_compact=database_context,
         user_query=user_query,
         hazards=hazard_tables,
         region=region,
     )
 
+
+@lru_cache(maxsize=4)
+def _sql_prompt_fingerprint(database_context: str) -> str:
+    static_messages = build_sql_prompt(database_context, "", [], None)
+    return prompt_fingerprint(SQL_PROMPT_VERSION, static_messages)
+
+
+def sql_prompt_fingerprint() -> str:
+    # Changes whenever build_sql_prompt's output or the DB context document changes;
+    # the document is cached, so the prompt is only rebuilt and hashed when it does
+    return _sql_prompt_fingerprint(load_doc_from_db('Beehive_DB_Context_Summary.docx'))
+
+
+def generate_sql(user_query: str, hazard_tables, region=None) -> str:
+    """Master SQL generator with LLM + fallback."""
+    fingerprint = sql_prompt_fingerprint()
+    cached = sql_cache.get(user_query, hazard_tables, region, fingerprint)
+    if cached:
+        return cached
+
+    messages = _sql_messages(user_query, hazard_tables, region)
+
     try:
         llm_text = call_llm(messages)
         sql = extract_sql_from_text(llm_text)
         if sql:
+            sql_cache.put(user_query, hazard_tables, region, fingerprint, sql)
             return sql
     except Exception as e:
         print(f"[WARN] LLM SQL generation failed: {e}")
@@ -164,6 +263,30 @@ def generate_sql(user_query: str, hazard_tables, region=None) -> str:
     # Fallback: safe deterministic minimal query
     return None
 
+
+async def generate_sql_async(user_query: str, hazard_tables, region=None) -> str:
+    """Async variant of generate_sql (same prompt, cache and fallback)."""
+    fingerprint = sql_prompt_fingerprint()
+    cached = sql_cache.get(user_query, hazard_tables, region, fingerprint)
+    if cached:
+        return cached
+
+    messages = _sql_messages(user_query, hazard_tables, region)
+
+    try:
+        llm_text = await call_llm_async(messages)
+        sql = extract_sql_from_text(llm_text)
+        if sql:
+            sql_cache.put(user_query, hazard_tables, region, fingerprint, sql)
+            return sql
+    except LLMOverloaded:
+        # shedding load: don't turn this into a second (fallback) LLM call
+        raise
+    except Exception as e:
+        print(f"[WARN] LLM SQL generation failed: {e}")
+
+    return None
+
 def detect_hazards(user_query: str) -> list:
     
     # Detect which hazard types are relevant to the user's query.
@@ -181,31 +304,61 @@ def detect_hazards(user_query: str) -> list:
     # Default: if nothing matched, assume all hazards
     return matched_hazards if matched_hazards else list(HAZARD_KEYWORDS.keys())
 
-def build_city_hazard_block(city: str, lon: float, lat: float, table: str) -> str:
+def sql_literal(value: str) -> str:
+    # Quote a label as a SQL string literal.
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def risk_columns(scenario: int = 5, horizons=(1, 10, 30), agg: str = "AVG") -> List[str]:
+    # One risk expression per horizon; a single horizon is aliased risk_score.
+    if len(horizons) == 1:
+        return [f"{agg}(ssp{scenario}_{horizons[0]}yr) AS risk_score"]
+    return [f"{agg}(ssp{scenario}_{h}yr) AS risk_{h}yr" for h in horizons]
+
+
+def build_city_hazard_block(city: str, lon: float, lat: float, table: str,
+                            scenario: int = 5, horizons=(1, 10, 30)) -> str:
     
     # Build one subquery for a given city & hazard table.
     # Injects the city name as a constant so results can be tied back to the input.
     
     hazard_name = table.strip('"')
+    columns = ", ".join(f"ssp{scenario}_{h}yr" for h in horizons)
+    risks = ",\n    ".join(risk_columns(scenario, horizons))
     return f"""
     SELECT
-    '{city}' AS city,
+    {sql_literal(city)} AS city,
     '{hazard_name}' AS hazard,
     (SELECT region
         FROM {table}
         ORDER BY geometry <-> ST_SetSRID(ST_MakePoint({lon}, {lat}), 4326)
         LIMIT 1) AS region,
-    AVG(ssp5_1yr)  AS risk_1yr,
-    AVG(ssp5_10yr) AS risk_10yr,
-    AVG(ssp5_30yr) AS risk_30yr
+    {risks}
     FROM (
-    SELECT ssp5_1yr, ssp5_10yr, ssp5_30yr
+    SELECT {columns}
     FROM {table}
     ORDER BY geometry <-> ST_SetSRID(ST_MakePoint({lon}, {lat}), 4326)
     LIMIT 20
     ) nearest
     """.strip()
 
+
+def build_region_hazard_block(label: str, region: str, table: str,
+                              scenario: int = 5, horizons=(1, 10, 30)) -> str:
+
+    # Build one aggregate subquery for a continent-scale region & hazard table.
+
+    hazard_name = table.strip('"')
+    risks = ",\n    ".join(risk_columns(scenario, horizons))
+    return f"""
+    SELECT
+    {sql_literal(label)} AS region,
+    '{hazard_name}' AS hazard,
+    {risks}
+    FROM {table}
+    WHERE region ILIKE '%{region}%'
+    """.strip()
+
 def generate_fallback_sql(user_query: str) -> str:
     
     # Ask the LLM to generate a safe SQL query when cities/coordinates
@@ -238,75 +391,191 @@ def generate_fallback_sql(user_query: str) -> str:
 
     return sql
 
-def stream_summarize_answer(user_query: str, db_result, sql_query: str, db_context: str):
+# Token budget for the DB result inside the summarizer prompt
+SUMMARY_RESULT_TOKEN_BUDGET = int(os.getenv("SUMMARY_RESULT_TOKEN_BUDGET", 1500))
+# Bump when the summary rules change in a way the prompt text doesn't show
+SUMMARY_PROMPT_VERSION = "2"
+
+# Completed summaries, replayed for repeat questions over unchanged data
+summary_cache = SummaryCache(
+    max_entries=int(os.getenv("SUMMARY_CACHE_MAX_ENTRIES", 1024)),
+    max_bytes=int(os.getenv("SUMMARY_CACHE_MAX_BYTES", 16 * 1024 * 1024)),
+    ttl=float(os.getenv("SUMMARY_CACHE_TTL", 86400)),
+)
+
+
+def compact_db_result(db_result) -> CompactedResult:
+    # CSV with column names and rounded numbers; top rows + aggregates when over budget
+    return compact_result(getattr(db_result, "columns", []), db_result, SUMMARY_RESULT_TOKEN_BUDGET)
+
+
+SUMMARY_SYSTEM_RULES = """
+Write a clear, user-friendly answer in MARKDOWN to the user's question, based on the database result they send.
+
+Rules:
+- Only include hazards that are present in the SQL query or DB result.
+- Do not output hazards that were not queried.
+- If multiple hazards are present (e.g., UNION ALL), report each one separately.
+- If only one hazard is present, output just that hazard.
+
+Interpretation rules:
+- If the column is a risk score (ssp{X}_{Y}yr, values 1–7), map it to categories:
+* 1–3 = Low
+* 4–5 = Moderate
+* 6–7 = High
+- If the column is a frequency (e.g., total_annual_freq, fires_30yr),
+explain it as "expected number of events" over the relevant period.
+- If the column is a flood extent percent (rp050/rp200),
+explain it as "proportion of area flooded".
+- If multiple horizons are present (1yr, 10yr, 30yr), describe the trend over time.
+
+Location rules:
+- Always reflect the location from the user query in the heading (city/country).
+- If DB only provides region-level data, clearly state it as:
+"<UserLocation> (data aggregated from <Region>)".
+- If DB granularity is limited, you may add general knowledge about which subregions, states, or cities are most exposed to the hazard.
+- Always clarify which parts come from the database result vs general knowledge.
+
+Output format:
+### <User location, with aggregation note if needed>
+- **<Hazard>:** <interpreted values with context + optional regional detail>
+
+### Summary
+Provide a 5–6 sentence summary:
+- Anchor on DB result first.
+- If DB result is too broad, enrich the answer with well-known geographic patterns (e.g., “In India, eastern states like Bihar and Assam are particularly flood-prone”).
+- Clearly separate database-based findings from general knowledge insights.
+""".strip()
+
+
+@lru_cache(maxsize=4)
+def summary_system_prompt(db_context: str) -> str:
+    # Static prefix for summaries: rules first, then the DB schema context
+    return f"{SUMMARY_SYSTEM_RULES}\n\nDatabase schema context (columns and their meaning):\n{db_context}"
+
+
+def build_summary_messages(user_query: str, db_result, sql_query: str, db_context: str) -> List[dict]:
     """
-    Stream a markdown-formatted summary of DB result with context:
+    Build the summarizer messages for a DB result with context:
     - Only summarize hazards that were queried
     - Distinguish between risk scores vs counts/frequencies vs percentages
     - Include SQL + DB schema context for accurate explanations
+    The static rules and DB context form the system prefix; the question, SQL and
+    rows follow in the user message. db_result may be raw rows or an already
+    compacted result.
     """
+    if not isinstance(db_result, CompactedResult):
+        db_result = compact_db_result(db_result)
+
+    user = (
+        f"User asked: {user_query}\n\n"
+        f"SQL query executed:\n{sql_query}\n\n"
+        "Database returned (CSV, numbers rounded; large results are cut to the top rows plus a summary of all rows):\n"
+        f"{db_result.text}"
+    )
+    return [
+        {"role": "system", "content": summary_system_prompt(db_context)},
+        {"role": "user", "content": user},
+    ]
 
-    prompt = f"""
-    User asked: {user_query}
 
-    SQL query executed:
-    {sql_query}
+@lru_cache(maxsize=4)
+def summary_prompt_fingerprint(db_context: str) -> str:
+    # Changes whenever the summary rules or the DB context change
+    return prompt_fingerprint(SUMMARY_PROMPT_VERSION, [summary_system_prompt(db_context)])
 
-    Database returned (raw values):
-    {db_result}
 
-    Database schema context (columns and their meaning):
-    {db_context}
+def _stream_text(call: str, stream, started: float):
+    # Answer text from a streamed completion. The final chunk carries token usage and
+    # no choices; it is recorded with the time to first token (cached vs uncached prompt).
+    first_token = None
+    for chunk in stream:
+        usage = getattr(chunk, "usage", None)
+        if usage is not None:
+            record_llm_call(call, usage, first_token)
+        if chunk.choices and chunk.choices[0].delta.content:
+            if first_token is None:
+                first_token = time.perf_counter() - started
+            yield chunk.choices[0].delta.content
 
-    Write a clear, user-friendly answer in MARKDOWN.
 
-    Rules:
-    - Only include hazards that are present in the SQL query or DB result.
-    - Do not output hazards that were not queried.
-    - If multiple hazards are present (e.g., UNION ALL), report each one separately.
-    - If only one hazard is present, output just that hazard.
-
-    Interpretation rules:
-    - If the column is a risk score (ssp{{X}}_{{Y}}yr, values 1–7), map it to categories:
-    * 1–3 = Low
-    * 4–5 = Moderate
-    * 6–7 = High
-    - If the column is a frequency (e.g., total_annual_freq, fires_30yr),
-    explain it as "expected number of events" over the relevant period.
-    - If the column is a flood extent percent (rp050/rp200),
-    explain it as "proportion of area flooded".
-    - If multiple horizons are present (1yr, 10yr, 30yr), describe the trend over time.
-
-    Location rules:
-    - Always reflect the location from the user query in the heading (city/country).
-    - If DB only provides region-level data, clearly state it as:
-    "<UserLocation> (data aggregated from <Region>)".
-    - If DB granularity is limited, you may add general knowledge about which subregions, states, or cities are most exposed to the hazard.
-    - Always clarify which parts come from the database result vs general knowledge.
-
-    Output format:
-    ### <User location, with aggregation note if needed>
-    - **<Hazard>:** <interpreted values with context + optional regional detail>
-
-    ### Summary
-    Provide a 5–6 sentence summary:
-    - Anchor on DB result first.
-    - If DB result is too broad, enrich the answer with well-known geographic patterns (e.g., “In India, eastern states like Bihar and Assam are particularly flood-prone”).
-    - Clearly separate database-based findings from general knowledge insights.
+async def _astream_text(call: str, stream, started: float):
+    # Async variant of _stream_text
+    first_token = None
+    async for chunk in stream:
+        usage = getattr(chunk, "usage", None)
+        if usage is not None:
+            record_llm_call(call, usage, first_token)
+        if chunk.choices and chunk.choices[0].delta.content:
+            if first_token is None:
+                first_token = time.perf_counter() - started
+            yield chunk.choices[0].delta.content
+
+
+def stream_summarize_answer(user_query: str, db_result, sql_query: str, db_context: str):
+    """
+    Stream a markdown-formatted summary of DB result with context.
     """
+    messages = build_summary_messages(user_query, db_result, sql_query, db_context)
 
+    started = time.perf_counter()
     stream = client.chat.completions.create(
         model="gpt-4o-mini",
-        messages=[{"role": "user", "content": prompt}],
+        messages=messages,
         stream=True,
+        stream_options={"include_usage": True},
     )
-    for chunk in stream:
-        if chunk.choices and chunk.choices[0].delta.content:
-            yield chunk.choices[0].delta.content
+    yield from _stream_text("summary", stream, started)
 
-def fallback_stream_answer(user_query):
-    answer = call_llm([
+
+async def stream_summarize_answer_async(user_query: str, db_result, sql_query: str, db_context: str):
+    """
+    Async generator variant of stream_summarize_answer.
+    """
+    messages = build_summary_messages(user_query, db_result, sql_query, db_context)
+
+    started = time.perf_counter()
+    stream = llm_gateway.stream(
+        _acreate,
+        model="gpt-4o-mini",
+        tokens=_quota_tokens(messages),
+        messages=messages,
+        stream_options={"include_usage": True},
+    )
+    async for text in _astream_text("summary", stream, started):
+        yield text
+
+
+def build_fallback_messages(user_query: str) -> List[dict]:
+    return [
         {"role": "system", "content": "Answer the user based on general climate risk knowledge."},
         {"role": "user", "content": user_query}
-    ])
-    yield answer
\ No newline at end of file
+    ]
+
+
+def fallback_stream_answer(user_query):
+    # Stream the general-knowledge answer token by token
+    started = time.perf_counter()
+    stream = client.chat.completions.create(
+        model="gpt-4o-mini",
+        messages=build_fallback_messages(user_query),
+        temperature=0.0,
+        stream=True,
+        stream_options={"include_usage": True},
+    )
+    yield from _stream_text("fallback", stream, started)
+
+
+async def fallback_stream_answer_async(user_query):
+    messages = build_fallback_messages(user_query)
+    started = time.perf_counter()
+    stream = llm_gateway.stream(
+        _acreate,
+        model="gpt-4o-mini",
+        tokens=_quota_tokens(messages),
+        messages=messages,
+        temperature=0.0,
+        stream_options={"include_usage": True},
+    )
+    async for text in _astream_text("fallback", stream, started):
+        yield text
@@ -0,0 +1,240 @@
+import asyncio
+import inspect
+import random
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, Dict, Optional
+
+import openai
+
+from metrics import LLM_QUEUE_WAIT_SECONDS, LLM_REJECTED, LLM_RETRIES
+
+# Errors worth retrying: quota (429), timeouts, dropped connections and 5xx
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APIConnectionError,      # includes APITimeoutError
+    openai.InternalServerError,
+    asyncio.TimeoutError,
+)
+
+
+class LLMUnavailable(Exception):
+    """The LLM call failed after retries (or was not admitted)."""
+
+
+class LLMOverloaded(LLMUnavailable):
+    """The gateway's wait queue is full; callers should shed load (HTTP 503)."""
+
+
+class TokenBucket:
+    """Async token bucket: `rate` tokens per second, bursts up to `capacity`."""
+
+    def __init__(self, capacity: float, rate: float):
+        self.capacity = float(capacity)
+        self.rate = float(rate)
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, amount: float = 1.0):
+        # FIFO: the lock makes later callers queue behind one that is waiting for tokens
+        amount = min(float(amount), self.capacity)
+        async with self._lock:
+            while True:
+                self._refill()
+                if self._tokens >= amount:
+                    self._tokens -= amount
+                    return
+                await asyncio.sleep((amount - self._tokens) / self.rate)
+
+    @property
+    def available(self) -> float:
+        self._refill()
+        return self._tokens
+
+
+async def _close(stream):
+    # AsyncStream.close() releases the HTTP response; plain async generators have aclose()
+    close = getattr(stream, "close", None) or getattr(stream, "aclose", None)
+    if close is not None:
+        result = close()
+        if inspect.isawaitable(result):
+            await result
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    # Honour the server's Retry-After on 429s when it sends one
+    response = getattr(error, "response", None)
+    value = getattr(response, "headers", {}).get("retry-after") if response is not None else None
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+class LLMGateway:
+    """
+    Admission control in front of OpenAI:
+    - global and per-model concurrency limits
+    - token buckets for requests/minute and tokens/minute (0 = unlimited)
+    - a bounded wait queue: when max_queue callers are already waiting, new
+      calls fail fast with LLMOverloaded
+    - per-call timeouts and retries with exponential backoff + full jitter
+    """
+
+    def __init__(self, max_concurrency: int = 16, model_concurrency: Optional[Dict[str, int]] = None,
+                 default_model_concurrency: Optional[int] = None, requests_per_minute: float = 0,
+                 tokens_per_minute: float = 0, max_queue: int = 64, max_retries: int = 3,
+                 backoff_base: float = 0.5, backoff_max: float = 8.0, timeout: float = 30.0,
+                 stream_idle_timeout: float = 30.0):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+        self.stream_idle_timeout = stream_idle_timeout
+        self._global = asyncio.Semaphore(max_concurrency)
+        self._model_limits = dict(model_concurrency or {})
+        self._default_model_limit = default_model_concurrency or max_concurrency
+        self._models: Dict[str, asyncio.Semaphore] = {}
+        self._requests = TokenBucket(requests_per_minute, requests_per_minute / 60) if requests_per_minute else None
+        self._tokens = TokenBucket(tokens_per_minute, tokens_per_minute / 60) if tokens_per_minute else None
+        self.waiting = 0
+        self.in_flight = 0
+        self.rejected = 0
+        self.retries = 0
+        self.failures = 0
+        self._waits = deque(maxlen=1000)   # recent admission waits (seconds)
+
+    def _model_semaphore(self, model: str) -> asyncio.Semaphore:
+        if model not in self._models:
+            self._models[model] = asyncio.Semaphore(self._model_limits.get(model, self._default_model_limit))
+        return self._models[model]
+
+    def saturated(self) -> bool:
+        return self.waiting >= self.max_queue
+
+    def check_capacity(self):
+        if self.saturated():
+            self.rejected += 1
+            LLM_REJECTED.inc()
+            raise LLMOverloaded(f"LLM queue full ({self.waiting} waiting)")
+
+    @asynccontextmanager
+    async def slot(self, model: str, tokens: int = 0):
+        # Wait for admission (rate limits, then concurrency); the queue itself is bounded
+        self.check_capacity()
+        self.waiting += 1
+        started = time.monotonic()
+        model_semaphore = self._model_semaphore(model)
+        acquired = []
+        try:
+            if self._requests is not None:
+                await self._requests.acquire(1)
+            if self._tokens is not None and tokens:
+                await self._tokens.acquire(tokens)
+            await self._global.acquire()
+            acquired.append(self._global)
+            await model_semaphore.acquire()
+            acquired.append(model_semaphore)
+        except BaseException:
+            for semaphore in acquired:
+                semaphore.release()
+            raise
+        finally:
+            self.waiting -= 1
+        waited = time.monotonic() - started
+        self._waits.append(waited)
+        LLM_QUEUE_WAIT_SECONDS.observe(waited, model=model)
+
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            model_semaphore.release()
+            self._global.release()
+
+    def backoff(self, attempt: int, error: Optional[Exception] = None) -> float:
+        # Full jitter: uniform(0, min(max, base * 2^attempt)); Retry-After wins when larger
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+        retry_after = _retry_after(error) if error is not None else None
+        return max(delay, min(retry_after, self.backoff_max)) if retry_after else delay
+
+    async def _retrying(self, attempt_call: Callable[[], Awaitable], model: str, label: str):
+        for attempt in range(self.max_retries + 1):
+            try:
+                return await attempt_call()
+            except RETRYABLE_ERRORS as e:
+                if attempt == self.max_retries:
+                    self.failures += 1
+                    raise LLMUnavailable(f"{label} failed after {attempt + 1} attempts: {e!r}") from e
+                self.retries += 1
+                LLM_RETRIES.inc(reason=type(e).__name__)
+                await asyncio.sleep(self.backoff(attempt, e))
+
+    async def complete(self, create: Callable[..., Awaitable], model: str, tokens: int = 0, **kwargs):
+        # Non-streaming call: each attempt is admitted separately and bounded by self.timeout
+        async def attempt():
+            async with self.slot(model, tokens):
+                return await asyncio.wait_for(create(model=model, **kwargs), self.timeout)
+
+        return await self._retrying(attempt, model, "LLM call")
+
+    async def stream(self, create: Callable[..., Awaitable], model: str, tokens: int = 0, **kwargs):
+        """
+        Streaming call as an async generator of chunks. The slot is held until the
+        stream ends. Opening the stream and reaching the first chunk are retried;
+        once chunks have been yielded an error ends the stream with LLMUnavailable.
+        Other API errors (4xx) are not retried and also raise LLMUnavailable. The
+        stream is closed when it ends, fails or the consumer stops reading.
+        """
+        for attempt in range(self.max_retries + 1):
+            yielded = False
+            try:
+                async with self.slot(model, tokens):
+                    stream = await asyncio.wait_for(create(model=model, stream=True, **kwargs), self.timeout)
+                    try:
+                        iterator = stream.__aiter__()
+                        while True:
+                            try:
+                                chunk = await asyncio.wait_for(iterator.__anext__(), self.stream_idle_timeout)
+                            except StopAsyncIteration:
+                                return
+                            yielded = True
+                            yield chunk
+                    finally:
+                        await _close(stream)
+            except RETRYABLE_ERRORS as e:
+                if yielded or attempt == self.max_retries:
+                    self.failures += 1
+                    raise LLMUnavailable(f"LLM stream failed after {attempt + 1} attempts: {e!r}") from e
+                self.retries += 1
+                LLM_RETRIES.inc(reason=type(e).__name__)
+                await asyncio.sleep(self.backoff(attempt, e))
+            except openai.OpenAIError as e:
+                self.failures += 1
+                raise LLMUnavailable(f"LLM stream failed: {e!r}") from e
+
+    def stats(self) -> dict:
+        waits = sorted(self._waits)
+        return {
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "rejected": self.rejected,
+            "retries": self.retries,
+            "failures": self.failures,
+            "wait_p50_ms": round(waits[len(waits) // 2] * 1000, 2) if waits else None,
+            "wait_p99_ms": round(waits[min(int(len(waits) * 0.99), len(waits) - 1)] * 1000, 2) if waits else None,
+            "requests_available": round(self._requests.available, 1) if self._requests else None,
+            "tokens_available": round(self._tokens.available, 1) if self._tokens else None,
+        }
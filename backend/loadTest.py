@@ -0,0 +1,469 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+from typing import Dict, Iterator, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+# Concurrency load test for /ask over real HTTP, to find where it saturates
+# (threadpool, DB connections or LLM streaming).
+#
+#   python loadTest.py local --concurrency 1,8,32,64 --save baseline.json
+#       starts mockOpenAI.py and the app (fake DB) on local ports, runs the load, stops both
+#   python mockOpenAI.py --port 8100 &
+#   python loadTest.py serve --port 8000 --openai-url http://127.0.0.1:8100/v1 --fake-db &
+#   python loadTest.py run --url http://127.0.0.1:8000 --rate 20 --compare baseline.json
+#
+# `serve` without --fake-db uses the DB_* settings, e.g. a PostGIS stand-in seeded
+# with `python dbMigrations.py seed`. The load generator only needs the standard
+# library, so it can run from any machine against a deployed app too.
+#
+# The mix has a handful of distinct questions, so `serve` runs with coalescing and
+# the SQL / result / summary caches off unless --caches is given: otherwise almost
+# every request after the first few is a replay and LLM streaming is never loaded.
+# Every report records the app's cache settings and the cache hits per level.
+
+QUESTION_MIX = {
+    # planner templates, single city
+    "city": [
+        "What is the flood risk in Miami?",
+        "Wildfire risk in Los Angeles over 30 years",
+        "What is the heat risk in Chicago by 2050?",
+    ],
+    # planner templates, region averages
+    "region": [
+        "What is the heat risk in Europe?",
+        "Flood risk across Asia under SSP1",
+        "Drought risk in Africa over the next 30 years",
+    ],
+    # planner templates, several locations (UNION ALL)
+    "multi_location": [
+        "What risks are there for offices in Boston, Charlotte, and London?",
+        "Compare flood and heat risk in Tokyo, Mumbai and Lagos",
+    ],
+    # no template: SQL generated by the LLM
+    "llm_sql": [
+        "What are the highest risk locations for flooding in the US?",
+        "Which coastal areas are most exposed to cyclones?",
+    ],
+    # the LLM returns no SQL (mockOpenAI's --no-sql-pattern): fallback answer
+    "fallback": [
+        "Explain why flood risk is increasing",
+        "What does SSP5 mean for drought?",
+    ],
+}
+
+DEFAULT_WEIGHTS = {"city": 0.35, "region": 0.2, "multi_location": 0.15, "llm_sql": 0.15, "fallback": 0.15}
+
+
+def question_mix(count: int, weights: Dict[str, float] = DEFAULT_WEIGHTS,
+                 seed: int = 0) -> Iterator[Tuple[str, str]]:
+    # (kind, question) pairs drawn by weight; seeded so runs are comparable
+    rng = random.Random(seed)
+    kinds = [k for k in weights if weights[k] > 0]
+    for _ in range(count):
+        kind = rng.choices(kinds, [weights[k] for k in kinds])[0]
+        yield kind, rng.choice(QUESTION_MIX[kind])
+
+
+def parse_weights(spec: str) -> Dict[str, float]:
+    # "city=2,fallback=1" -> only those kinds, in that proportion
+    weights = {}
+    for part in spec.split(","):
+        kind, _, weight = part.partition("=")
+        if kind.strip() not in QUESTION_MIX:
+            raise ValueError(f"unknown question kind {kind.strip()!r}")
+        weights[kind.strip()] = float(weight or 1)
+    return weights
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    if len(values) == 1:
+        return values[0]
+    # inclusive method = linear interpolation between closest ranks (same as benchmark.py)
+    return statistics.quantiles(values, n=100, method="inclusive")[round(q * 100) - 1]
+
+
+def latency_summary(samples_ms: List[float]) -> dict:
+    if not samples_ms:
+        return {"count": 0}
+    return {
+        "count": len(samples_ms),
+        "mean_ms": round(statistics.fmean(samples_ms), 1),
+        "p50_ms": round(percentile(samples_ms, 0.50), 1),
+        "p95_ms": round(percentile(samples_ms, 0.95), 1),
+        "p99_ms": round(percentile(samples_ms, 0.99), 1),
+        "max_ms": round(max(samples_ms), 1),
+    }
+
+
+async def _read_body(reader: asyncio.StreamReader, headers: Dict[str, str]):
+    # Response body pieces as they arrive (chunked, sized or read-to-close)
+    if headers.get("transfer-encoding", "").lower() == "chunked":
+        while True:
+            size = int((await reader.readline()).split(b";")[0].strip() or b"0", 16)
+            if size == 0:
+                await reader.readline()
+                return
+            data = await reader.readexactly(size)
+            await reader.readexactly(2)
+            yield data
+    elif "content-length" in headers:
+        length = int(headers["content-length"])
+        if length:
+            yield await reader.readexactly(length)
+    else:
+        while data := await reader.read(65536):
+            yield data
+
+
+async def ask_once(host: str, port: int, question: str, kind: str = "",
+                   timeout: float = 60.0, started: Optional[float] = None) -> dict:
+    """
+    One POST /ask?format=ndjson on a fresh connection. Times are measured from
+    `started` (the scheduled arrival in open-loop runs, so client-side queueing
+    counts) to the first body byte (ttfb), the first answer token (ttft) and the end.
+    """
+    loop = asyncio.get_running_loop()
+    started = loop.time() if started is None else started
+    sample = {"kind": kind, "status": None, "ttfb_ms": None, "ttft_ms": None, "total_ms": None,
+              "error": None, "fallback": None}
+
+    def elapsed() -> float:
+        return round((loop.time() - started) * 1000, 2)
+
+    async def exchange():
+        reader, writer = await asyncio.open_connection(host, port)
+        try:
+            body = json.dumps({"query": question}).encode()
+            writer.write(
+                f"POST /ask?format=ndjson HTTP/1.1\r\nHost: {host}:{port}\r\n"
+                f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n"
+                f"Connection: close\r\n\r\n".encode() + body)
+            await writer.drain()
+            sample["status"] = int((await reader.readline()).split()[1])
+            headers = {}
+            while (line := await reader.readline()) not in (b"\r\n", b""):
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+
+            buffer, done = b"", False
+            async for data in _read_body(reader, headers):
+                if sample["ttfb_ms"] is None:
+                    sample["ttfb_ms"] = elapsed()
+                if sample["status"] != 200:
+                    continue
+                buffer += data
+                *lines, buffer = buffer.split(b"\n")
+                for line in lines:
+                    if not line.strip():
+                        continue
+                    event = json.loads(line)
+                    if event["type"] == "token" and sample["ttft_ms"] is None:
+                        sample["ttft_ms"] = elapsed()
+                    elif event["type"] == "fallback":
+                        sample["fallback"] = event.get("reason")
+                    elif event["type"] == "error" and sample["error"] is None:
+                        sample["error"] = event.get("reason", "stream_error")
+                    elif event["type"] == "done":
+                        done = True
+            if sample["status"] != 200:
+                sample["error"] = f"http_{sample['status']}"
+            elif not done and sample["error"] is None:
+                sample["error"] = "incomplete"
+        finally:
+            writer.close()
+
+    try:
+        await asyncio.wait_for(exchange(), timeout)
+    except asyncio.TimeoutError:
+        sample["error"] = "timeout"
+    except (OSError, asyncio.IncompleteReadError, ValueError, IndexError) as e:
+        sample["error"] = sample["error"] or f"connection:{type(e).__name__}"
+    sample["total_ms"] = elapsed()
+    return sample
+
+
+async def run_level(host: str, port: int, questions: List[Tuple[str, str]], concurrency: int,
+                    rate: float = 0.0, timeout: float = 60.0, seed: int = 0) -> Tuple[List[dict], float]:
+    """
+    Closed loop (rate 0): `concurrency` requests in flight until all are sent.
+    Open loop: Poisson arrivals at `rate` requests/second, at most `concurrency` in flight.
+    Returns the samples and the wall-clock seconds.
+    """
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(concurrency)
+    rng = random.Random(seed)
+
+    async def one(kind: str, question: str, scheduled: Optional[float]) -> dict:
+        async with semaphore:
+            return await ask_once(host, port, question, kind, timeout, started=scheduled)
+
+    started = loop.time()
+    arrival, tasks = started, []
+    for kind, question in questions:
+        if rate:
+            arrival += rng.expovariate(rate)
+            await asyncio.sleep(max(arrival - loop.time(), 0))
+        tasks.append(asyncio.ensure_future(one(kind, question, arrival if rate else None)))
+    samples = await asyncio.gather(*tasks)
+    return samples, loop.time() - started
+
+
+def summarize_level(samples: List[dict], wall: float, concurrency: int, rate: float = 0.0) -> dict:
+    ok = [s for s in samples if s["error"] is None]
+    errors: Dict[str, int] = {}
+    for s in samples:
+        if s["error"] is not None:
+            errors[s["error"]] = errors.get(s["error"], 0) + 1
+    kinds = {}
+    for kind in sorted({s["kind"] for s in samples}):
+        of_kind = [s for s in samples if s["kind"] == kind]
+        kinds[kind] = {
+            "requests": len(of_kind),
+            "errors": sum(1 for s in of_kind if s["error"] is not None),
+            "fallbacks": sum(1 for s in of_kind if s["fallback"]),
+            "total": latency_summary([s["total_ms"] for s in of_kind if s["error"] is None]),
+        }
+    return {
+        "concurrency": concurrency,
+        "rate": rate or None,
+        "requests": len(samples),
+        "wall_s": round(wall, 3),
+        "throughput_rps": round(len(ok) / wall, 2) if wall else None,
+        "error_rate": round(1 - len(ok) / len(samples), 4) if samples else 0.0,
+        "errors": errors,
+        "fallbacks": sum(1 for s in samples if s["fallback"]),
+        "ttfb": latency_summary([s["ttfb_ms"] for s in ok if s["ttfb_ms"] is not None]),
+        "ttft": latency_summary([s["ttft_ms"] for s in ok if s["ttft_ms"] is not None]),
+        "total": latency_summary([s["total_ms"] for s in ok]),
+        "kinds": kinds,
+    }
+
+
+# /stats counter that goes up when a request skips work
+CACHE_COUNTERS = {"sql_cache": "hits", "result_cache": "hits", "summary_cache": "hits", "single_flight": "coalesced"}
+
+
+def fetch_stats(url: str) -> Optional[dict]:
+    try:
+        with urllib.request.urlopen(url.rstrip("/") + "/stats", timeout=10) as response:
+            return json.load(response)
+    except (OSError, ValueError):
+        return None
+
+
+def cache_hits(before: Optional[dict], after: Optional[dict]) -> Optional[dict]:
+    if before is None or after is None:
+        return None
+    return {name: after.get(name, {}).get(counter, 0) - before.get(name, {}).get(counter, 0)
+            for name, counter in CACHE_COUNTERS.items()}
+
+
+def run_load(url: str, levels: List[int], requests: int = 200, rate: float = 0.0,
+             timeout: float = 60.0, weights: Dict[str, float] = DEFAULT_WEIGHTS, seed: int = 0) -> dict:
+    # One level per concurrency value, same question sequence each time
+    parts = urlsplit(url)
+    host, port = parts.hostname or "127.0.0.1", parts.port or 80
+    questions = list(question_mix(requests, weights, seed))
+    stats = fetch_stats(url)
+    report = {
+        "meta": {
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "url": url,
+            "requests": requests,
+            "rate": rate or None,
+            "timeout": timeout,
+            "weights": weights,
+            "seed": seed,
+            # None when the app's /stats isn't reachable
+            "caches": stats.get("caches") if stats else None,
+        },
+        "levels": [],
+    }
+    for concurrency in levels:
+        samples, wall = asyncio.run(run_level(host, port, questions, concurrency, rate, timeout, seed))
+        level = summarize_level(samples, wall, concurrency, rate)
+        after = fetch_stats(url)
+        level["cache_hits"] = cache_hits(stats, after)
+        stats = after
+        print(f"concurrency {concurrency}: {level['throughput_rps']} req/s, "
+              f"ttfb p95 {level['ttfb'].get('p95_ms')} ms, total p95 {level['total'].get('p95_ms')} ms, "
+              f"errors {level['error_rate']:.1%}", file=sys.stderr)
+        replayed = (level["cache_hits"] or {}).get("summary_cache", 0) + (level["cache_hits"] or {}).get("single_flight", 0)
+        if replayed > len(samples) * 0.1:
+            print(f"[WARN] {replayed} of {len(samples)} answers at concurrency {concurrency} came from the summary "
+                  f"cache or a coalesced stream; run `serve` without --caches for saturation numbers", file=sys.stderr)
+        report["levels"].append(level)
+    return report
+
+
+def compare(baseline: dict, current: dict, threshold: float = 0.2, min_delta_ms: float = 5.0,
+            max_error_increase: float = 0.01) -> List[dict]:
+    """
+    Regressions per concurrency level present in both reports: p50/p95 ttfb and total
+    latency more than `threshold` slower (and by more than min_delta_ms), throughput more
+    than `threshold` lower, or an error rate up by more than max_error_increase.
+    """
+    before = {level["concurrency"]: level for level in baseline.get("levels", [])}
+    regressions = []
+    for level in current.get("levels", []):
+        old = before.get(level["concurrency"])
+        if old is None:
+            continue
+        prefix = f"c{level['concurrency']}"
+        for stat in ("ttfb", "total"):
+            for q in ("p50_ms", "p95_ms"):
+                a, b = old.get(stat, {}).get(q), level.get(stat, {}).get(q)
+                if a and b and b - a > min_delta_ms and b > a * (1 + threshold):
+                    regressions.append({"metric": f"{prefix}.{stat}.{q}", "baseline": a, "current": b,
+                                        "change": b / a - 1})
+        a, b = old.get("throughput_rps"), level.get("throughput_rps")
+        if a and b is not None and b < a * (1 - threshold):
+            regressions.append({"metric": f"{prefix}.throughput_rps", "baseline": a, "current": b,
+                                "change": b / a - 1})
+        a, b = old.get("error_rate", 0.0), level.get("error_rate", 0.0)
+        if b - a > max_error_increase:
+            regressions.append({"metric": f"{prefix}.error_rate", "baseline": a, "current": b, "change": b - a})
+    return regressions
+
+
+def serve(host: str, port: int, openai_url: str, fake_db: bool, db_latency: float, db_rows: int,
+          caches: bool = False):
+    # The app pointed at the mock OpenAI server; env has to be set before main is imported
+    os.environ["OPENAI_BASE_URL"] = openai_url
+    os.environ.setdefault("OPENAI_API_KEY", "load-test")
+    if fake_db:
+        # the region cube and spatial index are built from the real tables
+        os.environ["REGION_CUBE_ENABLED"] = "false"
+        os.environ["SPATIAL_INDEX_ENABLED"] = "false"
+    if not caches:
+        # every request pays for SQL, DB and summary instead of hitting a cache
+        for name in ("ASK_COALESCE_ENABLED", "SUMMARY_CACHE_ENABLED", "RESULT_CACHE_ENABLED"):
+            os.environ[name] = "false"
+        os.environ["SQL_CACHE_MAX_ENTRIES"] = "0"
+
+    import uvicorn
+    import main
+    from fakeServices import FakeDatabase
+
+    if fake_db:
+        main.run_sql_query_async = FakeDatabase(latency=db_latency, rows=db_rows).run_async
+        main.warm_pool = lambda: None
+    uvicorn.run(main.app, host=host, port=port, log_level="warning")
+
+
+def _wait_for_port(host: str, port: int, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection((host, port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"nothing listening on {host}:{port} after {timeout:.0f}s")
+
+
+def run_local(args) -> dict:
+    # mockOpenAI.py + `serve` as subprocesses, so the load generator competes with neither
+    here = os.path.dirname(os.path.abspath(__file__))
+    mock = [sys.executable, os.path.join(here, "mockOpenAI.py"), "--port", str(args.openai_port),
+            "--latency", str(args.llm_latency), "--chunk-rate", str(args.chunk_rate)]
+    app = [sys.executable, os.path.abspath(__file__), "serve", "--port", str(args.port),
+           "--openai-url", f"http://127.0.0.1:{args.openai_port}/v1", "--fake-db",
+           "--db-latency", str(args.db_latency), "--db-rows", str(args.db_rows)]
+    if args.caches:
+        app.append("--caches")
+    processes = [subprocess.Popen(mock, cwd=here)]
+    try:
+        _wait_for_port("127.0.0.1", args.openai_port)
+        processes.append(subprocess.Popen(app, cwd=here))
+        _wait_for_port("127.0.0.1", args.port)
+        report = run_load(f"http://127.0.0.1:{args.port}", args.levels, args.requests, args.rate,
+                          args.timeout, args.weights, args.seed)
+        report["meta"]["local"] = {"llm_latency": args.llm_latency, "chunk_rate": args.chunk_rate,
+                                   "db_latency": args.db_latency, "db_rows": args.db_rows}
+        return report
+    finally:
+        for process in reversed(processes):
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+def _add_load_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--concurrency", dest="levels", default="1,8,32,64",
+                        type=lambda s: [int(c) for c in s.split(",")], help="comma-separated levels")
+    parser.add_argument("--requests", type=int, default=200, help="requests per level")
+    parser.add_argument("--rate", type=float, default=0.0, help="Poisson arrivals per second (0 = closed loop)")
+    parser.add_argument("--timeout", type=float, default=60.0, help="per-request timeout (seconds)")
+    parser.add_argument("--mix", dest="weights", type=parse_weights, default=DEFAULT_WEIGHTS,
+                        help=f"question kinds and weights, e.g. city=2,fallback=1 ({', '.join(QUESTION_MIX)})")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--save", help="write the report to this JSON file")
+    parser.add_argument("--compare", help="baseline JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="relative change flagged as a regression")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Concurrency load test for /ask.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="drive a running app")
+    run.add_argument("--url", default="http://127.0.0.1:8000")
+    _add_load_arguments(run)
+
+    local = commands.add_parser("local", help="start the mock OpenAI server and the app, then drive it")
+    local.add_argument("--port", type=int, default=8000)
+    local.add_argument("--openai-port", type=int, default=8100)
+    local.add_argument("--llm-latency", type=float, default=0.3, help="mock OpenAI time to first byte")
+    local.add_argument("--chunk-rate", type=float, default=50.0, help="mock OpenAI chunks per second")
+    local.add_argument("--db-latency", type=float, default=0.02, help="fake DB latency (seconds)")
+    local.add_argument("--db-rows", type=int, default=20)
+    local.add_argument("--caches", action="store_true", help="keep coalescing and the app caches on")
+    _add_load_arguments(local)
+
+    app = commands.add_parser("serve", help="run the app against the mock OpenAI server")
+    app.add_argument("--host", default="127.0.0.1")
+    app.add_argument("--port", type=int, default=8000)
+    app.add_argument("--openai-url", default="http://127.0.0.1:8100/v1")
+    app.add_argument("--fake-db", action="store_true", help="fakeServices.FakeDatabase instead of DB_* Postgres")
+    app.add_argument("--db-latency", type=float, default=0.02)
+    app.add_argument("--db-rows", type=int, default=20)
+    app.add_argument("--caches", action="store_true", help="keep coalescing and the app caches on")
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        serve(args.host, args.port, args.openai_url, args.fake_db, args.db_latency, args.db_rows,
+              caches=args.caches)
+        sys.exit(0)
+
+    report = run_local(args) if args.command == "local" else run_load(
+        args.url, args.levels, args.requests, args.rate, args.timeout, args.weights, args.seed)
+    print(json.dumps(report, indent=2))
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, report, args.threshold)
+        for r in regressions:
+            print(f"[WARN] Regression in {r['metric']}: {r['baseline']} -> {r['current']} ({r['change']:+.1%})")
+        sys.exit(1 if regressions else 0)
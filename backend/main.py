@@ -1,11 +1,143 @@
-from fastapi import FastAPI
-from fastapi.responses import StreamingResponse
+import asyncio
+import json
+import os
+import time
+from contextlib import asynccontextmanager
+from decimal import Decimal
+from typing import List, Optional
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from database import run_sql_query, validate_sql
-from llm import generate_sql, stream_summarize_answer, load_doc_from_db, detect_hazards,fallback_stream_answer
+from database import (
+    run_sql_query_async, validate_sql, pool_stats, result_cache, close_pool, result_columns,
+    QueryRejected, governor_stats, warm_pool, RESULT_CACHE_ENABLED,
+)
+from llm import (
+    generate_sql_async,
+    stream_summarize_answer_async,
+    load_doc_from_db,
+    detect_hazards,
+    fallback_stream_answer_async,
+    sql_cache,
+    compact_db_result,
+    aclient,
+    sql_prompt_fingerprint,
+    llm_gateway,
+    summary_cache,
+    summary_prompt_fingerprint,
+)
+from llmGateway import LLMOverloaded, LLMUnavailable
+from resultCompactor import compaction_stats
+from metrics import DB_ROWS, RequestTrace, prompt_cache_stats, render_metrics
+from singleFlight import SingleFlight, coalesce_key
+from conversationSessions import (
+    FollowUp, SessionStore, new_session_id, plan_event_fields, plan_follow_up, valid_session_id,
+)
+from summaryCache import replay
+from resultCache import canonicalize_sql
+from portfolioScoring import (
+    csv_stream, file_chunks, guarded, input_parser, ndjson_rows, score_assets, score_columns, spool_body,
+)
+from queryPlanner import plan_query, planner, answer_in_memory
+from queryFanout import FanOut, fanout_branches
+from regionCube import refresh_region_cube, region_cube_stats, start_background_refresh, stop_background_refresh
+from spatialIndex import spatial_index_stats, start_background_build
+
+PLANNER_ENABLED = os.getenv("QUERY_PLANNER_ENABLED", "true").lower() != "false"
+REGION_CUBE_ENABLED = os.getenv("REGION_CUBE_ENABLED", "true").lower() != "false"
+# Optional: answer city questions from an in-process KD-tree instead of PostGIS KNN
+SPATIAL_INDEX_ENABLED = os.getenv("SPATIAL_INDEX_ENABLED", "false").lower() == "true"
+# Identical questions asked while one is already running share its pipeline
+COALESCE_ENABLED = os.getenv("ASK_COALESCE_ENABLED", "true").lower() != "false"
+single_flight = SingleFlight(max_bytes=int(os.getenv("ASK_COALESCE_MAX_BYTES", 1024 * 1024)))
+BATCH_MAX_QUERIES = int(os.getenv("BATCH_MAX_QUERIES", 500))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", 8))
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", 32))
+SCORE_CHUNK_SIZE = int(os.getenv("SCORE_CHUNK_SIZE", 500))
+SCORE_CONCURRENCY = int(os.getenv("SCORE_CONCURRENCY", 4))
+# Multi-hazard / multi-location queries run as parallel branches on separate connections
+FANOUT_ENABLED = os.getenv("DB_FANOUT_ENABLED", "true").lower() != "false"
+FANOUT_PARALLELISM = int(os.getenv("DB_FANOUT_PARALLELISM", 4))
+FANOUT_BRANCH_TIMEOUT = float(os.getenv("DB_FANOUT_BRANCH_TIMEOUT", 10))
+FANOUT_LOCATIONS_PER_BRANCH = int(os.getenv("DB_FANOUT_LOCATIONS_PER_BRANCH", 10))
+# Branches across all requests; defaults to the pool size so they don't queue inside the pool
+fanout_slots = asyncio.Semaphore(int(os.getenv("DB_FANOUT_MAX_BRANCHES", os.getenv("DB_POOL_MAX", 10))))
+SUMMARY_CACHE_ENABLED = os.getenv("SUMMARY_CACHE_ENABLED", "true").lower() != "false"
+# Cached answers are replayed at this many chunks/second (0 = all at once)
+SUMMARY_REPLAY_CHUNKS_PER_SECOND = float(os.getenv("SUMMARY_REPLAY_CHUNKS_PER_SECOND", 0))
+# Conversation state per session id, for follow-up questions
+SESSIONS_ENABLED = os.getenv("SESSIONS_ENABLED", "true").lower() != "false"
+sessions = SessionStore(
+    max_sessions=int(os.getenv("SESSION_MAX_SESSIONS", 10000)),
+    ttl=float(os.getenv("SESSION_TTL_SECONDS", 1800)),
+    max_rows=int(os.getenv("SESSION_MAX_ROWS", 500)),
+    max_bytes=int(os.getenv("SESSION_MAX_BYTES", 64 * 1024 * 1024)),
+)
+
+
+WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "true").lower() != "false"
+WARMUP_OPENAI = os.getenv("WARMUP_OPENAI", "true").lower() != "false"
+WARMUP_TIMEOUT_SECONDS = float(os.getenv("WARMUP_TIMEOUT_SECONDS", 10))
+DB_CONTEXT_PATH = 'Beehive_DB_Context_Summary.docx'
+warmup_stats = {}
+
 
-app = FastAPI()
+def _prime_planner():
+    # First-use costs: regexes, gazetteer lookups, SQL compilation and sqlparse
+    for question in ("What is the flood risk in Miami?", "Heat risk in Boston and London", "Flood risk in Asia"):
+        plan = plan_query(question, detect_hazards(question))
+        if plan is not None:
+            validate_sql(plan.sql)
+
+
+async def warm_up():
+    """
+    Pay the cold-start costs before the first request instead of during it:
+    DB context + SQL prompt fingerprint, planner/sqlparse, DB connections and the
+    OpenAI client's HTTPS connection. Each step is timed (see /stats) and a failing
+    step only logs a warning.
+    """
+    steps = [
+        ("db_context", lambda: asyncio.to_thread(load_doc_from_db, DB_CONTEXT_PATH)),
+        ("sql_prompt", lambda: asyncio.to_thread(sql_prompt_fingerprint)),
+        ("planner", lambda: asyncio.to_thread(_prime_planner)),
+        ("db_pool", lambda: asyncio.to_thread(warm_pool)),
+    ]
+    if WARMUP_OPENAI:
+        # one cheap authenticated call opens (and keeps) the TLS connection
+        steps.append(("openai", lambda: aclient.with_options(timeout=WARMUP_TIMEOUT_SECONDS, max_retries=0).models.list()))
+
+    started = time.perf_counter()
+    for name, step in steps:
+        step_started = time.perf_counter()
+        try:
+            await asyncio.wait_for(step(), WARMUP_TIMEOUT_SECONDS)
+            ok = True
+        except Exception as e:
+            print(f"[WARN] Warm-up step {name} failed: {e!r}")
+            ok = False
+        warmup_stats[name] = {"ok": ok, "ms": round((time.perf_counter() - step_started) * 1000, 1)}
+    warmup_stats["total_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    return warmup_stats
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if WARMUP_ENABLED:
+        await warm_up()
+    # Build the region cube in the background (and rebuild it on a schedule)
+    if REGION_CUBE_ENABLED:
+        start_background_refresh(float(os.getenv("REGION_CUBE_REFRESH_SECONDS", 0)))
+    if SPATIAL_INDEX_ENABLED:
+        start_background_build()
+    yield
+    stop_background_refresh()
+    sql_cache.flush()
+    close_pool()
+
+
+app = FastAPI(lifespan=lifespan)
 
 # Allow frontend (for dev)
 app.add_middleware(
@@ -14,53 +146,407 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Session-Id"],
 )
 
 class QueryRequest(BaseModel):
     query: str
+    # Optional conversation id (returned in X-Session-Id); follow-ups reuse the previous turn
+    session_id: Optional[str] = None
 
-# Ask Question about risk
-@app.post("/ask")
-def ask_question(req: QueryRequest):
 
-    user_query = req.query
+class BatchRequest(BaseModel):
+    queries: List[str]
+    concurrency: Optional[int] = None
+
+LLM_BUSY_MESSAGE = "⚠️ The assistant is busy right now. Please try again in a moment."
+
+
+def _event(type_: str, **fields) -> dict:
+    return {"type": type_, **fields}
+
+
+async def ask_events(user_query: str, run_query=None, follow_up: Optional[FollowUp] = None):
+    """
+    The /ask pipeline as a stream of typed events:
+    stage -> sql -> plan (planned questions) -> rows (as soon as the DB returns) -> token... -> timings -> done.
+    Queries that fan out emit partial_rows / branch_failed per branch as it completes, before rows.
+    Fallbacks emit a fallback event (with the reason) followed by tokens.
+    Stage latencies, TTFT, row counts and fallbacks are also recorded for /metrics.
+    run_query overrides run_sql_query_async (the batch endpoint shares lookups through it).
+    follow_up (from the session) replaces hazard detection and SQL generation and
+    reuses the previous turn's rows where it can.
+    """
+    trace = RequestTrace()
+    run_query = run_query or run_sql_query_async
+    overloaded = False
+    # the summary needs the previous turn's question for context ("what about 30 years?")
+    question = follow_up.question if follow_up is not None else user_query
 
     # Step 1: Detect hazards
-    hazard_tables = detect_hazards(user_query)
+    trace.stage("detect_hazards")
+    yield _event("stage", stage="detect_hazards")
+    hazard_tables = detect_hazards(user_query) if follow_up is None else []
 
-    # Step 2: Generate SQL
-    sqlQuery = generate_sql(
-        user_query=user_query,
-        hazard_tables=hazard_tables,
-    )
+    # Step 2: Build SQL from a template when the question has a common shape,
+    # otherwise generate it with the LLM
+    trace.stage("generate_sql")
+    yield _event("stage", stage="generate_sql")
+    if follow_up is not None:
+        plan, sqlQuery = follow_up.plan, follow_up.sql
+    else:
+        plan = plan_query(user_query, hazard_tables) if PLANNER_ENABLED else None
+        sqlQuery = plan.sql if plan is not None else None
+    if follow_up is None and plan is None:
+        try:
+            sqlQuery = await generate_sql_async(
+                user_query=user_query,
+                hazard_tables=hazard_tables,
+            )
+        except LLMOverloaded:
+            sqlQuery = None
+            overloaded = True
 
-    # Step 3: Validate SQL
-    if not validate_sql(sqlQuery):
+    # Step 3: Validate SQL (generation may also have failed and returned None)
+    trace.stage("validate_sql")
+    fallback_reason = None
+    if overloaded:
+        fallback_reason = "llm_overloaded"
+    elif not sqlQuery or not validate_sql(sqlQuery):
+        fallback_reason = "invalid_sql"
+    else:
+        if follow_up is not None:
+            source = follow_up.source
+        else:
+            source = "planner" if plan is not None else "llm"
+        yield _event("sql", sql=sqlQuery, source=source)
+        if plan is not None:
+            yield _event("plan", **plan_event_fields(plan))
+
+        # Step 4: Run SQL (planned questions may be answered from the region cube / spatial index)
+        trace.stage("run_sql")
+        yield _event("stage", stage="run_sql")
+        try:
+            if follow_up is not None:
+                result = await follow_up.result(run_query)
+            else:
+                result = answer_in_memory(plan) if plan is not None else None
+            branches = []
+            if result is None and follow_up is None and FANOUT_ENABLED:
+                branches = fanout_branches(plan, sqlQuery, FANOUT_LOCATIONS_PER_BRANCH)
+            # planner SQL is built from our own templates; LLM SQL goes through the governor
+            if len(branches) > 1:
+                # independent branches on separate connections, rows streamed as each completes
+                fan_out = FanOut(branches, run_query, trusted=plan is not None,
+                                 parallelism=FANOUT_PARALLELISM, timeout=FANOUT_BRANCH_TIMEOUT,
+                                 slots=fanout_slots)
+                async for branch in fan_out.run():
+                    if branch.error is not None:
+                        yield _event("branch_failed", branch=branch.branch.label, reason=branch.error)
+                    else:
+                        yield _event("partial_rows", branch=branch.branch.label,
+                                     columns=result_columns(branch.rows), rows=list(branch.rows),
+                                     completed=len(fan_out.results), total=len(branches))
+                result = fan_out.result()
+                if result.failed:
+                    # the summary describes the rows it actually got
+                    sqlQuery = result.sql
+            elif result is None:
+                result = await run_query(sqlQuery, trusted=plan is not None)
+        except QueryRejected:
+            fallback_reason = "query_rejected"
+        except Exception as error:
+            fallback_reason = "db_error"
+        else:
+            DB_ROWS.observe(len(result))
+            # Step 5: Fallback if empty result
+            if not result:
+                fallback_reason = "empty_result"
+
+    if fallback_reason is not None:
         # fallback directly to LLM narrative answer
-        return StreamingResponse(fallback_stream_answer(user_query), media_type="text/plain")
-    
-    # Step 4: Run SQL
-    try:
-        result = run_sql_query(sqlQuery)
-    except Exception as error:
-        # fallback to LLM if DB error
-        return StreamingResponse(fallback_stream_answer(user_query), media_type="text/plain")
+        yield _event("fallback", reason=fallback_reason)
+        trace.stage("summarize")
+        yield _event("stage", stage="summarize")
+        # when the LLM queue is full, don't queue a second call for the fallback answer
+        chunks = None if overloaded else fallback_stream_answer_async(question)
+        async for event in answer_events(chunks, trace, fallback_reason):
+            yield event
+        return
 
-    # Step 5: Fallback if empty result
-    if not result:
-        return StreamingResponse(fallback_stream_answer(user_query), media_type="text/plain")
+    failed = getattr(result, "failed", [])
+    yield _event("rows", columns=result_columns(result), rows=list(result),
+                 truncated=getattr(result, "truncated", False), **({"failed": failed} if failed else {}))
 
     # Step 6: Stream summarization with data
+    # Compact the rows for the prompt and report the token savings
+    trace.stage("summarize")
+    compacted = compact_db_result(result)
+    compaction_stats.record(compacted)
+    yield _event("compaction", **compacted.stats())
+
     # Add DB context + SQL so summarizer knows column meanings
-    db_context = load_doc_from_db('Beehive_DB_Context_Summary.docx')
+    yield _event("stage", stage="summarize")
+    db_context = load_doc_from_db(DB_CONTEXT_PATH)
 
-    def event_stream():
-        for chunk in stream_summarize_answer(
-            user_query=user_query,
-            db_result=result,
+    summary_key = None
+    cached = None
+    if SUMMARY_CACHE_ENABLED:
+        # Same question over the same rows and SQL: replay the stored answer instead of calling the LLM
+        summary_key = summary_cache.make_key(question, result_columns(result), result, sqlQuery,
+                                             summary_prompt_fingerprint(db_context))
+        cached = summary_cache.get(summary_key)
+    if cached is not None:
+        yield _event("summary_cache", hit=True)
+        chunks = replay(cached, SUMMARY_REPLAY_CHUNKS_PER_SECOND)
+    else:
+        chunks = stream_summarize_answer_async(
+            user_query=question,
+            db_result=compacted,
             sql_query=sqlQuery,
             db_context=db_context
-        ):
-            yield chunk
+        )
+        if summary_key is not None:
+            chunks = summary_cache.recording(summary_key, chunks)
+    async for event in answer_events(chunks, trace):
+        yield event
+
+
+async def answer_events(chunks, trace: RequestTrace, fallback_reason: Optional[str] = None):
+    # Answer tokens, then timings and done. If the LLM is unavailable (queue full,
+    # retries exhausted) or the stream fails in any other way, it still ends
+    # cleanly, with an error event.
+    try:
+        if chunks is None:
+            raise LLMOverloaded("LLM queue full")
+        async for chunk in chunks:
+            trace.first_token()
+            yield _event("token", text=chunk)
+    except LLMUnavailable as e:
+        print(f"[WARN] LLM unavailable: {e}")
+        yield _event("error", reason="llm_unavailable")
+        yield _event("token", text=LLM_BUSY_MESSAGE)
+        fallback_reason = fallback_reason or "llm_unavailable"
+    except Exception as e:
+        print(f"[WARN] Answer stream failed: {e!r}")
+        yield _event("error", reason="llm_error")
+        yield _event("token", text=LLM_BUSY_MESSAGE)
+        fallback_reason = fallback_reason or "llm_error"
+    yield _event("timings", **trace.finish(fallback_reason))
+    yield _event("done")
+
+
+def _json_default(value):
+    # DB values that json can't encode natively (NUMERIC, dates, ...)
+    if isinstance(value, Decimal):
+        return float(value)
+    return str(value)
+
+
+def to_json(event: dict) -> str:
+    return json.dumps(event, default=_json_default, separators=(",", ":"))
+
+
+async def text_stream(events):
+    # Plain-text mode: only the answer tokens (original behaviour)
+    async for event in events:
+        if event["type"] == "token":
+            yield event["text"]
+
+
+async def ndjson_stream(events):
+    async for event in events:
+        yield to_json(event) + "\n"
+
+
+async def sse_stream(events):
+    async for event in events:
+        yield f"event: {event['type']}\ndata: {to_json(event)}\n\n"
+
+
+STREAM_FORMATS = {
+    "text": (text_stream, "text/plain"),
+    "ndjson": (ndjson_stream, "application/x-ndjson"),
+    "sse": (sse_stream, "text/event-stream"),
+}
+
+
+def response_format(request: Request, requested: Optional[str]) -> str:
+    # ?format=text|ndjson|sse, else the Accept header, else plain text
+    if requested in STREAM_FORMATS:
+        return requested
+    accept = request.headers.get("accept", "")
+    if "text/event-stream" in accept:
+        return "sse"
+    if "application/x-ndjson" in accept:
+        return "ndjson"
+    return "text"
+
+
+# Ask Question about risk
+# Async end to end: LLM calls use AsyncOpenAI and DB work runs on the pool's own
+# executor, so one worker can hold many in-flight conversations.
+@app.post("/ask")
+async def ask_question(req: QueryRequest, request: Request, format: Optional[str] = None):
+    stream, media_type = STREAM_FORMATS[response_format(request, format)]
+    try:
+        # Backpressure: fail fast instead of queueing behind a full LLM queue
+        llm_gateway.check_capacity()
+    except LLMOverloaded:
+        return JSONResponse({"detail": "LLM capacity exhausted, retry shortly"}, status_code=503,
+                            headers={"Retry-After": "1"})
+    if not SESSIONS_ENABLED:
+        session_id, follow_up = None, None
+    else:
+        session_id = req.session_id if valid_session_id(req.session_id) else new_session_id()
+        follow_up = plan_follow_up(req.query, sessions.get(session_id))
+    key = coalesce_key(req.query)
+    if follow_up is not None:
+        sessions.count(follow_up)
+        # the answer depends on the previous turn, so only identical conversations share it
+        key = f"{key}|{follow_up.key}"
+    if COALESCE_ENABLED:
+        events = single_flight.subscribe(key, lambda: ask_events(req.query, follow_up=follow_up))
+    else:
+        events = ask_events(req.query, follow_up=follow_up)
+    if session_id is None:
+        return StreamingResponse(stream(events), media_type=media_type)
+    # the session keeps the base question; each follow-up is combined with it afresh
+    question = follow_up.base_question if follow_up is not None else req.query
+    events = sessions.recording(session_id, question, events)
+    return StreamingResponse(stream(events), media_type=media_type, headers={"X-Session-Id": session_id})
+
+
+def shared_lookups():
+    # Per-batch memo: identical (canonical) SQL across the batch hits the DB once
+    pending = {}
+
+    async def run_query(sql: str, trusted: bool = False):
+        key = (canonicalize_sql(sql), trusted)
+        task = pending.get(key)
+        if task is None:
+            task = pending[key] = asyncio.ensure_future(run_sql_query_async(sql, trusted=trusted))
+        return await task
+
+    return run_query
+
+
+async def answer_item(query: str, run_query) -> dict:
+    # Run one question through the pipeline and collect its events into a single result
+    item = {"query": query, "sql": None, "source": None, "fallback": None, "columns": [], "rows": []}
+    tokens = []
+    async for event in ask_events(query, run_query=run_query):
+        if event["type"] == "sql":
+            item["sql"], item["source"] = event["sql"], event["source"]
+        elif event["type"] == "rows":
+            item["columns"], item["rows"] = event["columns"], event["rows"]
+        elif event["type"] == "fallback":
+            item["fallback"] = event["reason"]
+        elif event["type"] == "token":
+            tokens.append(event["text"])
+        elif event["type"] == "timings":
+            item["timings"] = {k: v for k, v in event.items() if k != "type"}
+    item["answer"] = "".join(tokens)
+    return item
+
+
+async def batch_events(queries: List[str], concurrency: int):
+    """
+    Answer a batch of questions, at most `concurrency` pipelines at a time.
+    Duplicate questions run once; results are yielded in completion order,
+    tagged with their input index. A failing item yields an error result
+    without stopping the rest of the batch.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    run_query = shared_lookups()
+    groups = {}
+    for index, query in enumerate(queries):
+        groups.setdefault(coalesce_key(query), []).append(index)
+
+    async def run_group(indices):
+        query = queries[indices[0]]
+        async with semaphore:
+            try:
+                item = await answer_item(query, run_query)
+            except Exception as e:
+                print(f"[WARN] Batch item failed: {e}")
+                item = {"query": query, "error": str(e)}
+        return indices, item
+
+    tasks = [asyncio.ensure_future(run_group(indices)) for indices in groups.values()]
+    try:
+        for finished in asyncio.as_completed(tasks):
+            indices, item = await finished
+            for index in indices:
+                yield _event("result", index=index, **{**item, "query": queries[index]})
+        yield _event("done", count=len(queries), executed=len(groups))
+    finally:
+        # client went away: don't keep answering the rest of the batch
+        for task in tasks:
+            task.cancel()
+
+
+# Many questions in one request; NDJSON results in completion order
+@app.post("/ask/batch")
+async def ask_batch(req: BatchRequest):
+    if not req.queries:
+        raise HTTPException(status_code=422, detail="queries must not be empty")
+    if len(req.queries) > BATCH_MAX_QUERIES:
+        raise HTTPException(status_code=422, detail=f"at most {BATCH_MAX_QUERIES} queries per batch")
+    concurrency = max(1, min(req.concurrency or BATCH_CONCURRENCY, BATCH_MAX_CONCURRENCY))
+    return StreamingResponse(ndjson_stream(batch_events(req.queries, concurrency)),
+                             media_type="application/x-ndjson")
+
+
+# Bulk nearest-cell scores for (id, lon, lat) assets, no LLM involved.
+# Body: JSON array, NDJSON or CSV (by Content-Type); output: NDJSON or CSV, one row per asset.
+@app.post("/score")
+async def score(request: Request, format: Optional[str] = None):
+    parse = input_parser(request.headers.get("content-type"))
+    upload = await spool_body(request.stream())
+    rows = score_assets(guarded(parse(file_chunks(upload))), SCORE_CHUNK_SIZE, SCORE_CONCURRENCY)
+    columns = score_columns()
+    wants_csv = format == "csv" or (format is None and "text/csv" in request.headers.get("accept", ""))
+    if wants_csv:
+        return StreamingResponse(csv_stream(rows, columns), media_type="text/csv")
+    return StreamingResponse(ndjson_rows(rows, columns, to_json), media_type="application/x-ndjson")
+
+
+# Runtime stats for tuning (DB pool usage, ...)
+@app.get("/stats")
+def get_stats():
+    return {
+        "db_pool": pool_stats(),
+        "query_governor": governor_stats(),
+        "sql_cache": sql_cache.stats(),
+        "result_cache": result_cache.stats(),
+        "planner": planner.stats(),
+        "region_cube": region_cube_stats(),
+        "spatial_index": spatial_index_stats(),
+        "summary_compaction": compaction_stats.stats(),
+        "summary_cache": summary_cache.stats(),
+        "sessions": sessions.stats(),
+        "single_flight": single_flight.stats(),
+        "caches": {
+            "coalesce": COALESCE_ENABLED,
+            "summary_cache": SUMMARY_CACHE_ENABLED,
+            "result_cache": RESULT_CACHE_ENABLED,
+            "sql_cache": sql_cache.max_entries > 0,
+        },
+        "warmup": warmup_stats,
+        "llm_gateway": llm_gateway.stats(),
+        "prompt_cache": prompt_cache_stats(),
+    }
+
+
+# Prometheus scrape endpoint: stage latency histograms, TTFT, token usage, fallbacks
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
 
-    return StreamingResponse(event_stream(), media_type="text/plain")
+# Rebuild the region cube after the hazard data is reloaded (no restart needed)
+@app.post("/region-cube/refresh")
+async def refresh_cube():
+    cube = await asyncio.to_thread(refresh_region_cube)
+    return cube.stats()
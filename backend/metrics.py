@@ -0,0 +1,285 @@
+import bisect
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# Minimal Prometheus-style counters and histograms for the /ask hot path,
+# rendered in the text exposition format on GET /metrics.
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(pairs: Sequence[Tuple[str, str]]) -> str:
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric(ABC):
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> tuple:
+        unknown = set(labels) - set(self.labelnames)
+        if unknown:
+            raise ValueError(f"{self.name}: unknown labels {sorted(unknown)}")
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def _pairs(self, key: tuple) -> List[Tuple[str, str]]:
+        return list(zip(self.labelnames, key))
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"] + self._samples()
+
+    @abstractmethod
+    def _samples(self) -> List[str]:
+        """Sample lines of this metric in the text exposition format."""
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            values = dict(self._values)
+        return [f"{self.name}{_format_labels(self._pairs(k))} {_format_number(v)}" for k, v in sorted(values.items())]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # per label set: [per-bucket counts (last = +Inf), sum, count]
+        self._series: Dict[tuple, list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def count(self, **labels) -> int:
+        with self._lock:
+            series = self._series.get(self._key(labels))
+            return series[2] if series else 0
+
+    def sum(self, **labels) -> float:
+        with self._lock:
+            series = self._series.get(self._key(labels))
+            return series[1] if series else 0.0
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            snapshot = {k: ([*v[0]], v[1], v[2]) for k, v in self._series.items()}
+        lines = []
+        for key, (counts, total, count) in sorted(snapshot.items()):
+            pairs = self._pairs(key)
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                le = pairs + [("le", _format_number(bound))]
+                lines.append(f"{self.name}_bucket{_format_labels(le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(pairs)} {_format_number(total)}")
+            lines.append(f"{self.name}_count{_format_labels(pairs)} {count}")
+        return lines
+
+
+class Gauge(_Metric):
+    """Current value read from a callback at scrape time (queue depth, in-flight calls)."""
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str):
+        super().__init__(name, help)
+        self._read = lambda: 0
+
+    def set_function(self, read):
+        self._read = read
+
+    def _samples(self) -> List[str]:
+        return [f"{self.name} {_format_number(self._read())}"]
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        metric = Counter(name, help, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (), buckets=DEFAULT_BUCKETS) -> Histogram:
+        metric = Histogram(name, help, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def gauge(self, name: str, help: str) -> Gauge:
+        metric = Gauge(name, help)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+ASK_REQUESTS = REGISTRY.counter(
+    "beehive_ask_requests_total", "Completed /ask requests by outcome (answered, fallback).", ("outcome",))
+ASK_FALLBACKS = REGISTRY.counter(
+    "beehive_ask_fallbacks_total", "/ask requests answered by the general-knowledge fallback, by reason.", ("reason",))
+ASK_STAGE_SECONDS = REGISTRY.histogram(
+    "beehive_ask_stage_seconds", "Time spent in each /ask pipeline stage.", ("stage",))
+ASK_DURATION_SECONDS = REGISTRY.histogram(
+    "beehive_ask_duration_seconds", "Total /ask time, request start to last token.")
+ASK_TTFT_SECONDS = REGISTRY.histogram(
+    "beehive_ask_time_to_first_token_seconds", "Time from request start to the first answer token.")
+LLM_TOKENS = REGISTRY.counter(
+    "beehive_llm_tokens_total",
+    "OpenAI token usage by call (sql, summary, fallback) and kind (prompt, cached_prompt, completion).",
+    ("call", "kind"))
+LLM_LATENCY_SECONDS = REGISTRY.histogram(
+    "beehive_llm_latency_seconds",
+    "OpenAI latency by call and prompt cache result (hit, miss): time to first token for streams, "
+    "full response otherwise.", ("call", "prompt_cache"))
+DB_ROWS = REGISTRY.histogram(
+    "beehive_db_rows_returned", "Rows returned to /ask by the DB (or the in-memory answer paths).",
+    buckets=(0, 1, 5, 10, 25, 50, 100, 250, 500, 1000, 5000))
+DB_BRANCH_SECONDS = REGISTRY.histogram(
+    "beehive_db_branch_seconds", "Fan-out query branch latency by outcome (ok, timeout, query_rejected, db_error).",
+    ("outcome",))
+
+LLM_QUEUE_DEPTH = REGISTRY.gauge("beehive_llm_queue_depth", "LLM calls waiting for admission.")
+LLM_IN_FLIGHT = REGISTRY.gauge("beehive_llm_in_flight", "LLM calls currently running.")
+LLM_QUEUE_WAIT_SECONDS = REGISTRY.histogram(
+    "beehive_llm_queue_wait_seconds", "Time LLM calls waited for admission (rate limits + concurrency).", ("model",))
+LLM_RETRIES = REGISTRY.counter("beehive_llm_retries_total", "LLM call retries by error type.", ("reason",))
+LLM_REJECTED = REGISTRY.counter("beehive_llm_rejected_total", "LLM calls shed because the wait queue was full.")
+
+
+def _mean_ms(histogram: Histogram, **labels) -> Optional[float]:
+    count = histogram.count(**labels)
+    return round(histogram.sum(**labels) / count * 1000, 2) if count else None
+
+
+def cached_prompt_tokens(usage) -> int:
+    # Prompt tokens served from OpenAI's prompt cache (usage.prompt_tokens_details.cached_tokens)
+    details = getattr(usage, "prompt_tokens_details", None)
+    return getattr(details, "cached_tokens", 0) or 0
+
+
+def record_llm_usage(call: str, usage) -> None:
+    # usage is the OpenAI response's usage object (None when the API didn't report it)
+    if usage is None:
+        return
+    LLM_TOKENS.inc(getattr(usage, "prompt_tokens", 0) or 0, call=call, kind="prompt")
+    LLM_TOKENS.inc(cached_prompt_tokens(usage), call=call, kind="cached_prompt")
+    LLM_TOKENS.inc(getattr(usage, "completion_tokens", 0) or 0, call=call, kind="completion")
+
+
+def record_llm_call(call: str, usage, seconds: Optional[float]) -> None:
+    # Token usage plus latency, labelled by whether the prompt prefix was cached
+    record_llm_usage(call, usage)
+    if usage is not None and seconds is not None:
+        LLM_LATENCY_SECONDS.observe(seconds, call=call, prompt_cache="hit" if cached_prompt_tokens(usage) else "miss")
+
+
+def prompt_cache_stats() -> dict:
+    # Per call: prompt tokens, how many were cached, and the latency split by cache result
+    stats = {}
+    for call in ("sql", "summary", "fallback"):
+        prompt = LLM_TOKENS.value(call=call, kind="prompt")
+        cached = LLM_TOKENS.value(call=call, kind="cached_prompt")
+        stats[call] = {
+            "prompt_tokens": prompt,
+            "cached_tokens": cached,
+            "cached_ratio": round(cached / prompt, 4) if prompt else 0.0,
+            "calls_hit": LLM_LATENCY_SECONDS.count(call=call, prompt_cache="hit"),
+            "calls_miss": LLM_LATENCY_SECONDS.count(call=call, prompt_cache="miss"),
+            "mean_latency_hit_ms": _mean_ms(LLM_LATENCY_SECONDS, call=call, prompt_cache="hit"),
+            "mean_latency_miss_ms": _mean_ms(LLM_LATENCY_SECONDS, call=call, prompt_cache="miss"),
+        }
+    return stats
+
+
+class RequestTrace:
+    """
+    Timings for one /ask request. stage() closes the current stage and opens the
+    next; finish() records the request outcome and returns the per-request timings.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.timings: Dict[str, float] = {}
+        self.ttft: Optional[float] = None
+        self._stage: Optional[str] = None
+        self._stage_started = self.started
+
+    def stage(self, name: Optional[str]):
+        now = time.perf_counter()
+        if self._stage is not None:
+            elapsed = now - self._stage_started
+            ASK_STAGE_SECONDS.observe(elapsed, stage=self._stage)
+            self.timings[self._stage] = self.timings.get(self._stage, 0.0) + elapsed
+        self._stage, self._stage_started = name, now
+
+    def first_token(self):
+        if self.ttft is None:
+            self.ttft = time.perf_counter() - self.started
+            ASK_TTFT_SECONDS.observe(self.ttft)
+
+    def finish(self, fallback_reason: Optional[str] = None) -> dict:
+        self.stage(None)
+        total = time.perf_counter() - self.started
+        ASK_DURATION_SECONDS.observe(total)
+        ASK_REQUESTS.inc(outcome="fallback" if fallback_reason else "answered")
+        if fallback_reason:
+            ASK_FALLBACKS.inc(reason=fallback_reason)
+        return {
+            "stages_ms": {name: round(seconds * 1000, 2) for name, seconds in self.timings.items()},
+            "ttft_ms": round(self.ttft * 1000, 2) if self.ttft is not None else None,
+            "total_ms": round(total * 1000, 2),
+        }
+
+
+def render_metrics() -> str:
+    return REGISTRY.render()
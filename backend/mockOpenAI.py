@@ -0,0 +1,151 @@
+import argparse
+import asyncio
+import json
+import random
+import re
+import time
+import uuid
+from typing import List, Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from fakeServices import DEFAULT_ANSWER, DEFAULT_SQL, PromptPrefixCache, split_chunks
+
+# Local OpenAI-compatible stand-in for load tests (loadTest.py): the app talks to it
+# over HTTP through the real AsyncOpenAI client (OPENAI_BASE_URL), so connection
+# handling, SSE parsing and the LLM gateway are exercised, not bypassed.
+#
+#   python mockOpenAI.py --port 8100 --latency 0.4 --chunk-rate 60
+#
+# Non-streamed calls (SQL generation) return DEFAULT_SQL, or a refusal when the
+# question matches --no-sql-pattern so the app takes its fallback path.
+# Streamed calls wait --latency and then emit the answer at --chunk-rate chunks/second.
+
+NO_SQL_PATTERN = r"\b(explain|why|what does|what is climate)\b"
+NO_SQL_TEXT = "I can't answer that with a database query."
+MODEL = "gpt-4o-mini"
+
+
+def _question(messages: List[dict]) -> str:
+    # The SQL prompt sends its request data as JSON; other prompts as plain text
+    content = next((m.get("content") or "" for m in reversed(messages) if m.get("role") == "user"), "")
+    try:
+        return json.loads(content).get("user_query", content)
+    except (ValueError, AttributeError):
+        return content
+
+
+def _usage(prompt: int, completion: int, cached: int) -> dict:
+    return {
+        "prompt_tokens": prompt,
+        "completion_tokens": completion,
+        "total_tokens": prompt + completion,
+        "prompt_tokens_details": {"cached_tokens": cached},
+    }
+
+
+def create_app(latency: float = 0.3, chunk_rate: float = 50.0, jitter: float = 0.0,
+               no_sql_pattern: str = NO_SQL_PATTERN, sql_text: str = DEFAULT_SQL,
+               answer: str = DEFAULT_ANSWER, seed: Optional[int] = None) -> FastAPI:
+    """
+    latency: seconds before the first byte (streamed) or the whole response (non-streamed),
+    varied by +/- jitter (a fraction of latency). chunk_rate 0 streams without pauses.
+    """
+    app = FastAPI()
+    no_sql = re.compile(no_sql_pattern, re.IGNORECASE)
+    cached_tokens = PromptPrefixCache()
+    rng = random.Random(seed)
+    stats = {"calls": 0, "streamed": 0, "in_flight": 0, "max_in_flight": 0}
+    app.state.stats = stats
+
+    def delay() -> float:
+        return max(latency * (1 + rng.uniform(-jitter, jitter)), 0.0)
+
+    @app.get("/v1/models")
+    async def models():
+        # the app's warm-up calls this to open the connection
+        return {"object": "list", "data": [{"id": MODEL, "object": "model", "created": 0, "owned_by": "mock"}]}
+
+    @app.get("/stats")
+    async def mock_stats():
+        return stats
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        messages = body.get("messages") or []
+        prompt_tokens = sum(len(m.get("content") or "") for m in messages) // 4
+        cached = cached_tokens(messages)
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        created = int(time.time())
+        model = body.get("model") or MODEL
+        stats["calls"] += 1
+
+        if not body.get("stream"):
+            text = NO_SQL_TEXT if no_sql.search(_question(messages)) else sql_text
+            stats["in_flight"] += 1
+            stats["max_in_flight"] = max(stats["max_in_flight"], stats["in_flight"])
+            try:
+                await asyncio.sleep(delay())
+            finally:
+                stats["in_flight"] -= 1
+            return JSONResponse({
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": text},
+                             "finish_reason": "stop"}],
+                "usage": _usage(prompt_tokens, max(len(text) // 4, 1), cached),
+            })
+
+        stats["streamed"] += 1
+        include_usage = (body.get("stream_options") or {}).get("include_usage")
+        chunks = split_chunks(answer)
+        interval = 1.0 / chunk_rate if chunk_rate else 0.0
+
+        def sse(choices: list, usage: Optional[dict] = None) -> str:
+            chunk = {"id": completion_id, "object": "chat.completion.chunk", "created": created,
+                     "model": model, "choices": choices}
+            if usage is not None:
+                chunk["usage"] = usage
+            return f"data: {json.dumps(chunk)}\n\n"
+
+        async def generate():
+            stats["in_flight"] += 1
+            stats["max_in_flight"] = max(stats["max_in_flight"], stats["in_flight"])
+            try:
+                await asyncio.sleep(delay())
+                for i, text in enumerate(chunks):
+                    if i and interval:
+                        await asyncio.sleep(interval)
+                    delta = {"role": "assistant", "content": text} if i == 0 else {"content": text}
+                    yield sse([{"index": 0, "delta": delta, "finish_reason": None}])
+                yield sse([{"index": 0, "delta": {}, "finish_reason": "stop"}])
+                if include_usage:
+                    yield sse([], usage=_usage(prompt_tokens, len(chunks), cached))
+                yield "data: [DONE]\n\n"
+            finally:
+                stats["in_flight"] -= 1
+
+        return StreamingResponse(generate(), media_type="text/event-stream")
+
+    return app
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Local OpenAI-compatible chat completions stand-in.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--latency", type=float, default=0.3, help="seconds to first byte")
+    parser.add_argument("--jitter", type=float, default=0.2, help="latency variation (fraction of --latency)")
+    parser.add_argument("--chunk-rate", type=float, default=50.0, help="streamed chunks per second")
+    parser.add_argument("--no-sql-pattern", default=NO_SQL_PATTERN,
+                        help="questions matching this regex get no SQL (fallback path)")
+    args = parser.parse_args()
+
+    uvicorn.run(create_app(args.latency, args.chunk_rate, args.jitter, args.no_sql_pattern),
+                host=args.host, port=args.port, log_level="warning")
@@ -0,0 +1,287 @@
+import asyncio
+import codecs
+import csv
+import io
+import json
+import math
+import tempfile
+from collections import deque
+from typing import AsyncIterator, Dict, List, Optional, Sequence
+
+from database import ALLOWED_TABLES, RISK_COLUMNS, metric_columns, run_sql_query_async
+from queryCompiler import compile_score_chunk, hazard_prefix
+
+# Bulk scoring for asset lists (id, lon, lat) without the LLM: every scenario x
+# horizon risk score plus the hazard-specific metrics of the nearest cell in each
+# hazard table. Input is parsed incrementally and scored in chunks, with a few
+# chunks in flight on the pool, so memory stays flat for 100k+ assets.
+
+SCORE_TABLE_COLUMNS: Dict[str, List[str]] = {table: RISK_COLUMNS + metric_columns(table) for table in ALLOWED_TABLES}
+
+
+def score_columns(tables: Sequence[str] = ALLOWED_TABLES) -> List[str]:
+    header = ["id", "lon", "lat"]
+    for table in tables:
+        prefix = hazard_prefix(table)
+        header.append(f"{prefix}_region")
+        header.extend(f"{prefix}_{c}" for c in SCORE_TABLE_COLUMNS[table])
+    return header
+
+
+class InvalidAsset(ValueError):
+    pass
+
+
+def parse_asset(record, line: int) -> dict:
+    # {"id": .., "lon": .., "lat": ..} or [id, lon, lat]
+    try:
+        if isinstance(record, dict):
+            asset_id, lon, lat = record.get("id"), record["lon"], record["lat"]
+        else:
+            asset_id, lon, lat = record
+        lon, lat = float(lon), float(lat)
+    except (KeyError, TypeError, ValueError):
+        raise InvalidAsset(f"asset {line}: expected id, lon, lat")
+    if not (-180 <= lon <= 180 and -90 <= lat <= 90) or math.isnan(lon) or math.isnan(lat):
+        raise InvalidAsset(f"asset {line}: coordinates out of range")
+    return {"id": str(asset_id if asset_id not in (None, "") else line), "lon": lon, "lat": lat}
+
+
+async def spool_body(body: AsyncIterator[bytes], max_memory: int = 8 * 1024 * 1024):
+    # The request body has to be read before the streaming response starts (the response
+    # shares the receive channel); large uploads spill to a temp file instead of memory.
+    upload = tempfile.SpooledTemporaryFile(max_size=max_memory)
+    async for chunk in body:
+        upload.write(chunk)
+    upload.seek(0)
+    return upload
+
+
+async def file_chunks(upload, size: int = 64 * 1024):
+    try:
+        while True:
+            chunk = upload.read(size)
+            if not chunk:
+                return
+            yield chunk
+    finally:
+        upload.close()
+
+
+async def _decoded(chunks: AsyncIterator[bytes]):
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    async for chunk in chunks:
+        text = decoder.decode(chunk)
+        if text:
+            yield text
+    tail = decoder.decode(b"", final=True)
+    if tail:
+        yield tail
+
+
+async def _lines(chunks: AsyncIterator[bytes]):
+    buffer = ""
+    async for text in _decoded(chunks):
+        buffer += text
+        *lines, buffer = buffer.split("\n")
+        for line in lines:
+            yield line.rstrip("\r")
+    if buffer.strip():
+        yield buffer.rstrip("\r")
+
+
+async def iter_csv_assets(chunks: AsyncIterator[bytes]):
+    # Header row with id, lon, lat (any order, extra columns ignored)
+    header = None
+    line_no = 0
+    async for line in _lines(chunks):
+        if not line.strip():
+            continue
+        values = next(csv.reader([line]))
+        if header is None:
+            header = [v.strip().lower() for v in values]
+            if not {"lon", "lat"} <= set(header):
+                raise InvalidAsset("CSV header must include lon and lat (and usually id)")
+            continue
+        line_no += 1
+        yield _safe_parse(dict(zip(header, values)), line_no)
+
+
+async def iter_ndjson_assets(chunks: AsyncIterator[bytes]):
+    line_no = 0
+    async for line in _lines(chunks):
+        if line.strip():
+            line_no += 1
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                yield {"id": str(line_no), "error": f"asset {line_no}: invalid JSON"}
+                continue
+            yield _safe_parse(record, line_no)
+
+
+def _element_end(text: str, start: int) -> Optional[int]:
+    # End of the array element starting at `start` (after its closing bracket, or at
+    # the "," / "]" that ends a scalar), or None when it isn't complete yet
+    depth, quoted, escaped = 0, False, False
+    for i in range(start, len(text)):
+        c = text[i]
+        if quoted:
+            if escaped:
+                escaped = False
+            elif c == "\\":
+                escaped = True
+            elif c == '"':
+                quoted = False
+        elif c == '"':
+            quoted = True
+        elif c in "[{":
+            depth += 1
+        elif c in "]}":
+            if depth == 0:
+                return i
+            depth -= 1
+            if depth == 0:
+                return i + 1
+        elif c == "," and depth == 0:
+            return i
+    return None
+
+
+async def iter_json_array_assets(chunks: AsyncIterator[bytes]):
+    # Incremental parse of a top-level JSON array of objects/arrays. Elements are cut at
+    # their closing bracket first, so a malformed one becomes an error row and the rest
+    # of the array is still read.
+    buffer, started, line_no = "", False, 0
+    async for text in _decoded(chunks):
+        buffer += text
+        position = 0
+        while True:
+            while position < len(buffer) and buffer[position] in " \t\r\n,":
+                position += 1
+            if position >= len(buffer):
+                break
+            if not started:
+                if buffer[position] != "[":
+                    raise InvalidAsset("expected a JSON array")
+                started, position = True, position + 1
+                continue
+            if buffer[position] == "]":
+                return
+            end = _element_end(buffer, position)
+            if end is None:
+                break  # incomplete element: wait for more input
+            line_no += 1
+            try:
+                record = json.loads(buffer[position:end])
+            except json.JSONDecodeError:
+                yield {"id": str(line_no), "error": f"asset {line_no}: invalid JSON"}
+            else:
+                yield _safe_parse(record, line_no)
+            position = end
+        buffer = buffer[position:]
+    if buffer.strip():
+        raise InvalidAsset(f"asset {line_no + 1}: incomplete JSON at the end of the upload")
+
+
+def _safe_parse(record, line: int) -> dict:
+    # Bad rows are reported in the output instead of failing the whole upload
+    try:
+        return parse_asset(record, line)
+    except InvalidAsset as e:
+        return {"id": str(record.get("id", line)) if isinstance(record, dict) else str(line), "error": str(e)}
+
+
+async def guarded(assets: AsyncIterator[dict]):
+    # A malformed upload (bad header, not an array) ends the stream with an error row
+    try:
+        async for asset in assets:
+            yield asset
+    except InvalidAsset as e:
+        yield {"id": "", "error": str(e)}
+
+
+async def score_assets(assets: AsyncIterator[dict], chunk_size: int = 500, concurrency: int = 4,
+                       tables: Sequence[str] = ALLOWED_TABLES, run_query=None):
+    """
+    Yield one output row (list, score_columns order) or error dict per input asset,
+    in input order. Chunks of chunk_size assets are scored with one set-based query
+    each; up to `concurrency` chunks run at once on pooled connections. A chunk whose
+    query fails (pool or statement timeout, ...) yields an error dict per asset, so
+    the response stream still covers every asset.
+    """
+    run_query = run_query or (lambda sql: run_sql_query_async(sql, use_cache=False, trusted=True))
+    in_flight = deque()
+
+    def failed(chunk, error: str):
+        return [asset if "error" in asset else {"id": asset["id"], "error": error} for asset in chunk]
+
+    async def score(chunk):
+        valid = [a for a in chunk if "error" not in a]
+        if not valid:
+            return chunk
+        sql = compile_score_chunk([a["id"] for a in valid], [a["lon"] for a in valid],
+                                  [a["lat"] for a in valid], tables, SCORE_TABLE_COLUMNS)
+        try:
+            rows = list(await run_query(sql))
+        except Exception as e:
+            print(f"[WARN] Scoring chunk of {len(valid)} assets failed: {e}")
+            return failed(chunk, f"scoring failed ({type(e).__name__})")
+        if len(rows) != len(valid):
+            print(f"[WARN] Scoring chunk returned {len(rows)} rows for {len(valid)} assets")
+            return failed(chunk, f"scoring returned {len(rows)} rows for {len(valid)} assets")
+        scored = iter(rows)
+        return [asset if "error" in asset else list(next(scored)) for asset in chunk]
+
+    try:
+        chunk = []
+        async for asset in assets:
+            chunk.append(asset)
+            if len(chunk) >= chunk_size:
+                in_flight.append(asyncio.ensure_future(score(chunk)))
+                chunk = []
+                if len(in_flight) >= concurrency:
+                    for row in await in_flight.popleft():
+                        yield row
+        if chunk:
+            in_flight.append(asyncio.ensure_future(score(chunk)))
+        while in_flight:
+            for row in await in_flight.popleft():
+                yield row
+    finally:
+        for task in in_flight:
+            task.cancel()
+
+
+def _csv_value(value):
+    return "" if value is None else value
+
+
+async def csv_stream(rows: AsyncIterator, columns: List[str]):
+    # Header, then one line per asset; rows with errors carry the message in the error column
+    out = io.StringIO()
+    writer = csv.writer(out, lineterminator="\n")
+    writer.writerow(columns + ["error"])
+    yield out.getvalue()
+    async for row in rows:
+        out.seek(0)
+        out.truncate()
+        if isinstance(row, dict):
+            writer.writerow([row["id"]] + [""] * (len(columns) - 1) + [row["error"]])
+        else:
+            writer.writerow([_csv_value(v) for v in row] + [""])
+        yield out.getvalue()
+
+
+async def ndjson_rows(rows: AsyncIterator, columns: List[str], to_json):
+    async for row in rows:
+        yield to_json(row if isinstance(row, dict) else dict(zip(columns, row))) + "\n"
+
+
+def input_parser(content_type: Optional[str]):
+    content_type = (content_type or "").split(";")[0].strip().lower()
+    if content_type in ("text/csv", "application/csv"):
+        return iter_csv_assets
+    if content_type in ("application/x-ndjson", "application/jsonl"):
+        return iter_ndjson_assets
+    return iter_json_array_assets
@@ -0,0 +1,146 @@
+from typing import List, Sequence, Tuple
+
+from llm import risk_columns, sql_literal
+
+# Set-based SQL for many locations at once. Instead of one KNN subquery per
+# location x hazard glued with UNION ALL, every hazard table gets a single
+# statement: the locations are an inline row set and each one is matched to its
+# nearest cells with CROSS JOIN LATERAL, so the GiST index is probed once per
+# location inside one plan.
+#
+# The row set is unnest() over array literals rather than a VALUES list: each
+# array is a single string token, so the statement stays cheap for validate_sql
+# (sqlparse caps the number of tokens it will group) at hundreds of locations.
+
+
+def _point(lon_expr: str, lat_expr: str) -> str:
+    return f"ST_SetSRID(ST_MakePoint({lon_expr}, {lat_expr}), 4326)"
+
+
+def text_array(values: Sequence[str]) -> str:
+    # '{"Boston","Xi''an"}'::text[]
+    items = ('"' + str(v).replace("\\", "\\\\").replace('"', '\\"') + '"' for v in values)
+    return sql_literal("{" + ",".join(items) + "}") + "::text[]"
+
+
+def float_array(values: Sequence[float]) -> str:
+    # '{-71.0589,42.3601}'::float8[]
+    return "'{" + ",".join(repr(float(v)) for v in values) + "}'::float8[]"
+
+
+def compile_city_batch_block(locations: Sequence[Tuple[str, float, float]], table: str,
+                             scenario: int = 5, horizons=(1, 10, 30), k: int = 20) -> str:
+    """
+    One statement for all (label, lon, lat) locations against one hazard table.
+    Same semantics and columns as build_city_hazard_block: city, hazard, region of
+    the nearest cell, and the average over the k nearest cells per horizon.
+    """
+    hazard_name = table.strip('"')
+    columns = ", ".join(f"ssp{scenario}_{h}yr" for h in horizons)
+    risks = ",\n    ".join(risk_columns(scenario, horizons))
+    labels, lons, lats = zip(*locations)
+    point = _point("loc.lon", "loc.lat")
+    return f"""
+    SELECT
+    loc.city,
+    '{hazard_name}' AS hazard,
+    (array_agg(nearest.region ORDER BY nearest.dist))[1] AS region,
+    {risks}
+    FROM unnest(
+    {text_array(labels)},
+    {float_array(lons)},
+    {float_array(lats)}
+    ) WITH ORDINALITY AS loc(city, lon, lat, ord)
+    CROSS JOIN LATERAL (
+    SELECT region, {columns}, geometry <-> {point} AS dist
+    FROM {table}
+    ORDER BY geometry <-> {point}
+    LIMIT {int(k)}
+    ) nearest
+    GROUP BY loc.ord, loc.city
+    ORDER BY loc.ord
+    """.strip()
+
+
+def compile_region_batch_block(locations: Sequence[Tuple[str, str]], table: str,
+                               scenario: int = 5, horizons=(1, 10, 30)) -> str:
+    """
+    One statement for all (label, region_key) locations against one hazard table.
+    Same columns as build_region_hazard_block: region, hazard and the regional averages.
+    """
+    hazard_name = table.strip('"')
+    risks = ",\n    ".join(risk_columns(scenario, horizons))
+    labels, regions = zip(*locations)
+    return f"""
+    SELECT
+    loc.label AS region,
+    '{hazard_name}' AS hazard,
+    {risks}
+    FROM unnest(
+    {text_array(labels)},
+    {text_array(regions)}
+    ) WITH ORDINALITY AS loc(label, region_key, ord)
+    LEFT JOIN LATERAL (
+    SELECT {", ".join(f"ssp{scenario}_{h}yr" for h in horizons)}
+    FROM {table}
+    WHERE region ILIKE '%' || loc.region_key || '%'
+    ) cells ON true
+    GROUP BY loc.ord, loc.label
+    ORDER BY loc.ord
+    """.strip()
+
+
+def compile_batch_blocks(kind: str, locations: Sequence[Tuple], tables: Sequence[str],
+                         scenario: int = 5, horizons=(1, 10, 30)) -> List[str]:
+    # One set-based statement per hazard table.
+    if kind == "city":
+        return [compile_city_batch_block(locations, table, scenario, horizons) for table in tables]
+    return [compile_region_batch_block(locations, table, scenario, horizons) for table in tables]
+
+
+def compile_batch_query(kind: str, locations: Sequence[Tuple], tables: Sequence[str],
+                        scenario: int = 5, horizons=(1, 10, 30)) -> str:
+    # All hazard tables in one round trip.
+    blocks = compile_batch_blocks(kind, locations, tables, scenario, horizons)
+    if len(blocks) == 1:
+        return blocks[0]
+    return "\nUNION ALL\n".join(f"({block})" for block in blocks)
+
+
+def hazard_prefix(table: str) -> str:
+    # '"FloodRisk"' -> 'flood'
+    name = table.strip('"')
+    return (name[:-4] if name.endswith("Risk") else name).lower()
+
+
+def compile_score_chunk(ids: Sequence[str], lons: Sequence[float], lats: Sequence[float],
+                        tables: Sequence[str], columns: dict) -> str:
+    """
+    Nearest cell in every hazard table for a chunk of assets, in one statement.
+    Each table is a LEFT JOIN LATERAL KNN probe (LIMIT 1) on the unnest()ed asset
+    list; output is id, lon, lat, then <hazard>_region and <hazard>_<column> for
+    each table's columns, in input order.
+    """
+    point = _point("loc.lon", "loc.lat")
+    selects, joins = ["loc.id", "loc.lon", "loc.lat"], []
+    for t, table in enumerate(tables):
+        alias, prefix = f"h{t}", hazard_prefix(table)
+        selects.append(f"{alias}.region AS {prefix}_region")
+        selects.extend(f"{alias}.{c} AS {prefix}_{c}" for c in columns[table])
+        joins.append(
+            f"LEFT JOIN LATERAL (\n    SELECT region, {', '.join(columns[table])}\n    FROM {table}\n"
+            f"    ORDER BY geometry <-> {point}\n    LIMIT 1\n    ) {alias} ON true"
+        )
+    select_list = ",\n    ".join(selects)
+    join_list = "\n    ".join(joins)
+    return f"""
+    SELECT
+    {select_list}
+    FROM unnest(
+    {text_array(ids)},
+    {float_array(lons)},
+    {float_array(lats)}
+    ) WITH ORDINALITY AS loc(id, lon, lat, ord)
+    {join_list}
+    ORDER BY loc.ord
+    """.strip()
@@ -0,0 +1,238 @@
+import asyncio
+import contextlib
+import re
+import time
+from dataclasses import dataclass
+from typing import List, Optional
+
+from database import QueryRejected, QueryResult, result_columns, validate_sql
+from llm import build_city_hazard_block, build_region_hazard_block
+from metrics import DB_BRANCH_SECONDS
+from queryCompiler import compile_batch_blocks
+from queryPlanner import QueryPlan
+
+# Parallel fan-out for multi-hazard / multi-location questions. Postgres runs the
+# branches of one UNION ALL statement one after another on a single backend, so
+# the answer waits for the sum of all branches. Here the statement is split into
+# independent branches (per hazard table and location chunk for planned questions,
+# the top-level UNION ALL branches for LLM SQL) that run concurrently on separate
+# pooled connections. Rows are merged back in branch order, which is the order of
+# the original statement, so the shape (city|region, hazard, risk columns) is unchanged.
+
+_UNION = re.compile(r"UNION(\s+ALL)?\b", re.IGNORECASE)
+_TABLE = re.compile(r'\b(?:FROM|JOIN)\s+"([A-Za-z0-9_]+)"')
+
+
+@dataclass
+class Branch:
+    label: str
+    sql: str
+
+
+@dataclass
+class BranchResult:
+    index: int
+    branch: Branch
+    rows: Optional[QueryResult] = None
+    error: Optional[str] = None     # "timeout", "query_rejected" or "db_error"
+    ms: float = 0.0
+
+
+class FanOutFailed(Exception):
+    """Raised by FanOut.result() when every branch failed."""
+
+
+def _top_level(sql: str):
+    # (index, char, depth) for every character outside string literals and quoted identifiers;
+    # a closing parenthesis reports the depth after it
+    quote, depth = None, 0
+    for i, c in enumerate(sql):
+        if quote:
+            if c == quote:
+                quote = None
+            continue
+        if c in "'\"":
+            quote = c
+            continue
+        if c == "(":
+            depth += 1
+        elif c == ")":
+            depth -= 1
+        yield i, c, depth
+
+
+def _parenthesized(part: str) -> bool:
+    # "(...)" where the first parenthesis closes at the very end
+    if not part.startswith("("):
+        return False
+    for i, c, depth in _top_level(part):
+        if c == ")" and depth == 0:
+            return i == len(part) - 1
+    return False
+
+
+def split_union_all(sql: str) -> List[str]:
+    """
+    Branches of a top-level "(...) UNION ALL (...)" statement, or [sql] when it
+    can't be split safely: plain UNION (deduplicates), unparenthesized branches
+    (a trailing ORDER BY / LIMIT would apply to the whole union) or anything else.
+    """
+    sql = sql.strip().rstrip(";").strip()
+    parts, start = [], 0
+    for i, c, depth in _top_level(sql):
+        if depth or c not in "uU" or i < start or (i and (sql[i - 1].isalnum() or sql[i - 1] == "_")):
+            continue
+        match = _UNION.match(sql, i)
+        if match is None:
+            continue
+        if not match.group(1):
+            return [sql]
+        parts.append(sql[start:i].strip())
+        start = match.end()
+    parts.append(sql[start:].strip())
+    if len(parts) < 2 or not all(_parenthesized(part) for part in parts):
+        return [sql]
+    return [part[1:-1].strip() for part in parts]
+
+
+def _labelled(branches: List[Branch]) -> List[Branch]:
+    # Make repeated labels unique ("FloodRisk", "FloodRisk #2", ...)
+    seen = {}
+    for branch in branches:
+        seen[branch.label] = seen.get(branch.label, 0) + 1
+        if seen[branch.label] > 1:
+            branch.label = f"{branch.label} #{seen[branch.label]}"
+    return branches
+
+
+def plan_branches(plan: QueryPlan, locations_per_branch: int = 10) -> List[Branch]:
+    # Same SQL the planner builds, cut per hazard table and per chunk of locations
+    branches = []
+    for table in plan.hazard_tables:
+        hazard = table.strip('"')
+        if len(plan.locations) == 1:
+            location = plan.locations[0]
+            if plan.kind == "city":
+                sql = build_city_hazard_block(*location, table, plan.scenario, plan.horizons)
+            else:
+                sql = build_region_hazard_block(*location, table, plan.scenario, plan.horizons)
+            branches.append(Branch(f"{hazard}: {location[0]}", sql))
+            continue
+        size = max(locations_per_branch, 1)
+        for start in range(0, len(plan.locations), size):
+            chunk = plan.locations[start:start + size]
+            sql = compile_batch_blocks(plan.kind, chunk, [table], plan.scenario, plan.horizons)[0]
+            branches.append(Branch(f"{hazard}: {', '.join(location[0] for location in chunk)}", sql))
+    return _labelled(branches)
+
+
+def sql_branches(sql: str) -> List[Branch]:
+    # LLM SQL: the top-level UNION ALL branches, each of which must validate on its own
+    parts = split_union_all(sql)
+    if len(parts) < 2 or not all(validate_sql(part) for part in parts):
+        return [Branch("query", sql)]
+    branches = []
+    for part in parts:
+        tables = list(dict.fromkeys(_TABLE.findall(part)))
+        branches.append(Branch(", ".join(tables) or "query", part))
+    return _labelled(branches)
+
+
+def fanout_branches(plan: Optional[QueryPlan], sql: str, locations_per_branch: int = 10) -> List[Branch]:
+    if plan is not None:
+        return plan_branches(plan, locations_per_branch)
+    return sql_branches(sql)
+
+
+def _discard(task: asyncio.Future):
+    # Retrieve the outcome of a branch nobody waits for anymore (no "never retrieved" warnings)
+    if not task.cancelled():
+        task.exception()
+
+
+class FanOut:
+    """
+    Run branches with run_query(sql, trusted=...) at most `parallelism` at a time.
+    slots, when given, is a semaphore shared by every FanOut in the process so
+    concurrent requests together never run more branches than the pool has
+    connections. run() yields a BranchResult per branch as it completes
+    (successes and failures); result() then merges the rows in branch order.
+    A failed or timed out branch only drops its own rows.
+    """
+
+    def __init__(self, branches: List[Branch], run_query, trusted: bool = False,
+                 parallelism: int = 4, timeout: Optional[float] = None,
+                 slots: Optional[asyncio.Semaphore] = None):
+        self.branches = branches
+        self.run_query = run_query
+        self.trusted = trusted
+        self.parallelism = max(parallelism, 1)
+        self.timeout = timeout or None
+        self.slots = slots
+        self.results: List[BranchResult] = []
+
+    async def _query(self, branch: Branch):
+        # the shared slot is held until the query finishes, even after a timeout
+        async with self.slots if self.slots is not None else contextlib.nullcontext():
+            return await self.run_query(branch.sql, trusted=self.trusted)
+
+    async def _run(self, index: int, branch: Branch, semaphore: asyncio.Semaphore) -> BranchResult:
+        async with semaphore:
+            started = time.perf_counter()
+            result = BranchResult(index, branch)
+            # shielded: a timeout must not cancel a lookup other requests share (batch
+            # endpoint), and the DB thread can't be interrupted anyway; it finishes in
+            # the background, bounded by the statement timeout
+            task = asyncio.ensure_future(self._query(branch))
+            try:
+                result.rows = await asyncio.wait_for(asyncio.shield(task), self.timeout)
+            except asyncio.TimeoutError:
+                task.add_done_callback(_discard)
+                result.error = "timeout"
+            except QueryRejected:
+                result.error = "query_rejected"
+            except Exception as e:
+                print(f"[WARN] Query branch {branch.label} failed: {e}")
+                result.error = "db_error"
+            result.ms = round((time.perf_counter() - started) * 1000, 2)
+            DB_BRANCH_SECONDS.observe(result.ms / 1000, outcome=result.error or "ok")
+            return result
+
+    async def run(self):
+        semaphore = asyncio.Semaphore(self.parallelism)
+        tasks = [asyncio.ensure_future(self._run(i, branch, semaphore)) for i, branch in enumerate(self.branches)]
+        try:
+            for completed in asyncio.as_completed(tasks):
+                result = await completed
+                self.results.append(result)
+                yield result
+        finally:
+            # the client went away: don't start the branches still waiting for a slot
+            for task in tasks:
+                task.cancel()
+
+    @property
+    def failed(self) -> List[BranchResult]:
+        return sorted((r for r in self.results if r.error is not None), key=lambda r: r.index)
+
+    def result(self) -> QueryResult:
+        """
+        Rows of the successful branches in branch order. .sql is the UNION ALL of
+        those branches (what the rows actually answer) and .failed lists the labels
+        of the branches that are missing. Raises QueryRejected / FanOutFailed when
+        no branch succeeded.
+        """
+        succeeded = sorted((r for r in self.results if r.error is None), key=lambda r: r.index)
+        if not succeeded:
+            if self.results and all(r.error == "query_rejected" for r in self.results):
+                raise QueryRejected("every query branch was rejected")
+            raise FanOutFailed(", ".join(f"{r.branch.label}: {r.error}" for r in self.failed))
+        columns = next((result_columns(r.rows) for r in succeeded if result_columns(r.rows)), [])
+        merged = QueryResult([row for r in succeeded for row in r.rows], columns)
+        merged.truncated = any(getattr(r.rows, "truncated", False) for r in succeeded)
+        merged.failed = [r.branch.label for r in self.failed]
+        if len(succeeded) == 1:
+            merged.sql = succeeded[0].branch.sql
+        else:
+            merged.sql = "\nUNION ALL\n".join(f"({r.branch.sql})" for r in succeeded)
+        return merged
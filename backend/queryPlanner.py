@@ -0,0 +1,199 @@
+import re
+import threading
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
+
+from database import QueryResult
+from geoLocations import find_locations
+from llm import build_city_hazard_block, build_region_hazard_block, detect_hazards
+from queryCompiler import compile_batch_query
+from regionCube import get_region_cube
+from spatialIndex import get_spatial_index
+
+VALID_SCENARIOS = (1, 3, 5)
+VALID_HORIZONS = (1, 10, 30)
+
+# Question shapes the templates can't express (rankings, counts, comparisons over
+# unnamed places, ...). These go to the LLM SQL generator.
+_UNSUPPORTED = re.compile(
+    r"\b(highest|lowest|most|least|worst|safest|riskiest|top|rank\w*|where|how many|number of|count|"
+    r"frequency|percent\w*|days|waves|exposure|loss|compare to average|vs average)\b"
+)
+# "SSP1", "ssp 3", and the forcing-level forms "ssp126", "SSP1-26", "SSP5-8.5"
+_SCENARIO = re.compile(r"\bssp\s*-?\s*(\d)(?:\s*-?\s*\d\.?\d)?\b")
+_HORIZON = re.compile(r"\b(\d+)\s*-?\s*(?:years?|yrs?)\b")
+_DECADE = re.compile(r"\b(?:next|coming)\s+decade\b")
+_YEAR = re.compile(r"\b(?:19|20|21)\d\d\b")
+
+
+@dataclass
+class QueryPlan:
+    """
+    A question resolved without the LLM.
+    kind is "city" (locations are (label, lon, lat)) or "region"
+    (locations are (label, region_key)).
+    """
+    kind: str
+    locations: List[Tuple]
+    hazard_tables: List[str]
+    scenario: int = 5
+    horizons: Tuple[int, ...] = VALID_HORIZONS
+    sql: str = field(default="", repr=False)
+
+
+def nearest_horizon(years: int) -> int:
+    # Map any horizon to the closest valid one (e.g. 5 -> 1, 20 -> 30)
+    return min(VALID_HORIZONS, key=lambda h: (abs(h - years), -h))
+
+
+def needs_llm(question: str) -> bool:
+    # Rankings, counts and other shapes the templates can't express
+    return bool(_UNSUPPORTED.search(question.lower()))
+
+
+def mentions_scenario(question: str) -> bool:
+    return "ssp" in question.lower()
+
+
+def parse_scenario(question: str) -> Optional[int]:
+    # Returns the single SSP asked for, 5 when none, or None if unsupported/ambiguous.
+    text = question.lower()
+    scenarios = {int(s) for s in _SCENARIO.findall(text)}
+    if not scenarios:
+        # an SSP written some other way is left to the LLM rather than read as the default
+        return None if mentions_scenario(text) else 5
+    if len(scenarios) > 1 or not scenarios <= set(VALID_SCENARIOS):
+        return None
+    return scenarios.pop()
+
+
+def requested_horizons(question: str) -> Tuple[int, ...]:
+    # The horizons the question names, mapped to valid ones; empty when it names none
+    text = question.lower()
+    horizons = {nearest_horizon(int(n)) for n in _HORIZON.findall(text)}
+    if _DECADE.search(text):
+        horizons.add(10)
+    return tuple(sorted(horizons))
+
+
+def parse_horizons(question: str) -> Optional[Tuple[int, ...]]:
+    # Returns the horizons asked for, all three when none, or None for calendar years.
+    if _YEAR.search(question.lower()):
+        return None
+    return requested_horizons(question) or VALID_HORIZONS
+
+
+def build_plan_sql(plan: QueryPlan) -> str:
+    if len(plan.locations) > 1:
+        # Several locations: one set-based statement per hazard table
+        return compile_batch_query(plan.kind, plan.locations, plan.hazard_tables, plan.scenario, plan.horizons)
+
+    blocks = []
+    for location in plan.locations:
+        for table in plan.hazard_tables:
+            if plan.kind == "city":
+                label, lon, lat = location
+                block = build_city_hazard_block(label, lon, lat, table, plan.scenario, plan.horizons)
+            else:
+                label, region = location
+                block = build_region_hazard_block(label, region, table, plan.scenario, plan.horizons)
+            blocks.append(block)
+    if len(blocks) == 1:
+        return blocks[0]
+    return "\nUNION ALL\n".join(f"({block})" for block in blocks)
+
+
+class QueryPlanner:
+    """
+    Rule-based planner for the common question shapes:
+    cities or regions x hazards x SSP scenario x horizon.
+    Returns None whenever the question needs the LLM.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.planned = 0
+        self.unplanned = 0
+
+    def _count(self, planned: bool):
+        with self._lock:
+            if planned:
+                self.planned += 1
+            else:
+                self.unplanned += 1
+
+    def plan(self, question: str, hazard_tables: Optional[List[str]] = None) -> Optional[QueryPlan]:
+        plan = self._plan(question, hazard_tables)
+        self._count(plan is not None)
+        return plan
+
+    def _plan(self, question: str, hazard_tables: Optional[List[str]]) -> Optional[QueryPlan]:
+        if needs_llm(question):
+            return None
+
+        places = find_locations(question)
+        if not places:
+            return None
+        kinds = {kind for kind, _, _ in places}
+        if len(kinds) > 1:
+            # Mixed city/region questions produce different row shapes
+            return None
+
+        scenario = parse_scenario(question)
+        horizons = parse_horizons(question)
+        if scenario is None or horizons is None:
+            return None
+
+        kind = kinds.pop()
+        if kind == "city":
+            locations = [(label, lon, lat) for _, label, (lon, lat) in places]
+        else:
+            locations = [(label, region) for _, label, region in places]
+
+        plan = QueryPlan(
+            kind=kind,
+            locations=locations,
+            hazard_tables=list(hazard_tables or detect_hazards(question)),
+            scenario=scenario,
+            horizons=horizons,
+        )
+        plan.sql = build_plan_sql(plan)
+        return plan
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.planned + self.unplanned
+            return {
+                "planned": self.planned,
+                "unplanned": self.unplanned,
+                "hit_rate": round(self.planned / total, 4) if total else 0.0,
+            }
+
+
+planner = QueryPlanner()
+
+
+def plan_query(question: str, hazard_tables: Optional[List[str]] = None) -> Optional[QueryPlan]:
+    return planner.plan(question, hazard_tables)
+
+
+def plan_columns(plan: QueryPlan) -> List[str]:
+    # Result column names of the plan's SQL
+    if len(plan.horizons) == 1:
+        risks = ["risk_score"]
+    else:
+        risks = [f"risk_{h}yr" for h in plan.horizons]
+    if plan.kind == "city":
+        return ["city", "hazard", "region"] + risks
+    return ["region", "hazard"] + risks
+
+
+def answer_in_memory(plan: QueryPlan):
+    # Rows for the plan from in-process data (region cube / spatial index) when loaded, else None.
+    cube = get_region_cube()
+    if plan.kind == "region" and cube is not None:
+        return QueryResult(cube.rows_for_plan(plan), plan_columns(plan))
+    index = get_spatial_index()
+    if plan.kind == "city" and index is not None:
+        return QueryResult(index.rows_for_plan(plan), plan_columns(plan))
+    return None
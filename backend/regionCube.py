@@ -0,0 +1,154 @@
+import math
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from database import ALLOWED_TABLES, RISK_COLUMNS, metric_columns, run_sql_query
+from geoLocations import REGIONS
+
+SCENARIOS = (1, 3, 5)
+HORIZONS = (1, 10, 30)
+
+
+class RegionCube:
+    """
+    Precomputed region x hazard x scenario x horizon averages held in NumPy arrays.
+
+    Built from one GROUP BY region query per hazard table (sums and non-null counts,
+    so averages over several raw regions are exact). Canonical regions use the same
+    matching as the SQL path: a raw region belongs to "asia" if it contains "asia"
+    case-insensitively (WHERE region ILIKE '%asia%').
+    """
+
+    def __init__(self, built_at: float, raw_regions: Dict[str, np.ndarray],
+                 sums: Dict[str, np.ndarray], counts: Dict[str, np.ndarray]):
+        self.built_at = built_at
+        self.tables = list(sums)
+        self._raw_regions = raw_regions
+        self._sums = sums
+        self._counts = counts
+        self._columns = {table: RISK_COLUMNS + metric_columns(table) for table in self.tables}
+
+        # risk[region, table, scenario, horizon] for the canonical regions
+        self.risk = np.full((len(REGIONS), len(self.tables), len(SCENARIOS), len(HORIZONS)), np.nan, dtype=np.float32)
+        # metrics[table][region, metric] for the hazard-specific columns
+        self.metrics = {}
+        for t, table in enumerate(self.tables):
+            n_metrics = len(self._columns[table]) - len(RISK_COLUMNS)
+            self.metrics[table] = np.full((len(REGIONS), n_metrics), np.nan, dtype=np.float32)
+            for r, region in enumerate(REGIONS):
+                averages = self._average(table, region)
+                self.risk[r, t] = averages[:len(RISK_COLUMNS)].reshape(len(SCENARIOS), len(HORIZONS))
+                self.metrics[table][r] = averages[len(RISK_COLUMNS):]
+
+    @classmethod
+    def build(cls, execute: Callable[[str], list] = None, tables: List[str] = ALLOWED_TABLES) -> "RegionCube":
+        execute = execute or (lambda sql: run_sql_query(sql, use_cache=False, trusted=True))
+        raw_regions, sums, counts = {}, {}, {}
+        for table in tables:
+            columns = RISK_COLUMNS + metric_columns(table)
+            aggregates = ", ".join(f"SUM({c}), COUNT({c})" for c in columns)
+            rows = execute(f"SELECT region, {aggregates} FROM {table} GROUP BY region")
+
+            raw_regions[table] = np.array([str(row[0] or "").lower() for row in rows], dtype=object)
+            values = np.array([[float(v) if v is not None else 0.0 for v in row[1:]] for row in rows],
+                              dtype=np.float64).reshape(len(rows), 2 * len(columns))
+            sums[table] = values[:, 0::2]
+            counts[table] = values[:, 1::2].astype(np.int64)
+        return cls(time.time(), raw_regions, sums, counts)
+
+    def _average(self, table: str, region: str) -> np.ndarray:
+        # Column averages over every raw region matching ILIKE '%region%'.
+        mask = np.array([region.lower() in raw for raw in self._raw_regions[table]], dtype=bool)
+        sums = self._sums[table][mask].sum(axis=0)
+        counts = self._counts[table][mask].sum(axis=0)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(counts > 0, sums / np.maximum(counts, 1), np.nan)
+
+    def lookup(self, region: str, table: str) -> Dict[str, Optional[float]]:
+        # All averaged columns for one region and hazard table (any raw region substring works).
+        if region in REGIONS:
+            r, t = REGIONS.index(region), self.tables.index(table)
+            values = np.concatenate([self.risk[r, t].ravel(), self.metrics[table][r]])
+        else:
+            values = self._average(table, region)
+        return {column: to_float(v) for column, v in zip(self._columns[table], values)}
+
+    def risk_scores(self, region: str, table: str, scenario: int, horizons) -> List[Optional[float]]:
+        if region in REGIONS:
+            r, t, s = REGIONS.index(region), self.tables.index(table), SCENARIOS.index(scenario)
+            return [to_float(self.risk[r, t, s, HORIZONS.index(h)]) for h in horizons]
+        values = self.lookup(region, table)
+        return [values[f"ssp{scenario}_{h}yr"] for h in horizons]
+
+    def rows_for_plan(self, plan) -> list:
+        # Same rows (and order) as the region plan's SQL: [label, hazard, risk...]
+        rows = []
+        if len(plan.locations) > 1:
+            # compiled batch: table-major order
+            pairs = [(location, table) for table in plan.hazard_tables for location in plan.locations]
+        else:
+            pairs = [(location, table) for location in plan.locations for table in plan.hazard_tables]
+        for (label, region), table in pairs:
+            rows.append([label, table.strip('"')] + self.risk_scores(region, table, plan.scenario, plan.horizons))
+        return rows
+
+    def stats(self) -> dict:
+        return {
+            "built_at": self.built_at,
+            "tables": len(self.tables),
+            "raw_regions": {table: len(regions) for table, regions in self._raw_regions.items()},
+            "bytes": int(self.risk.nbytes + sum(m.nbytes for m in self.metrics.values())),
+        }
+
+
+def to_float(value) -> Optional[float]:
+    # NumPy value -> JSON-friendly float, NaN (SQL NULL) -> None
+    value = float(value)
+    return None if math.isnan(value) else round(value, 6)
+
+
+_CUBE: Optional[RegionCube] = None
+_REFRESH_LOCK = threading.Lock()
+_STOP = threading.Event()
+
+
+def get_region_cube() -> Optional[RegionCube]:
+    return _CUBE
+
+
+def refresh_region_cube() -> RegionCube:
+    # Rebuild from the DB and swap in atomically; readers keep the old cube until then.
+    global _CUBE
+    with _REFRESH_LOCK:
+        cube = RegionCube.build()
+        _CUBE = cube
+    return cube
+
+
+def start_background_refresh(interval: float):
+    # Build now (off the request path) and then every interval seconds (0 = build once).
+    _STOP.clear()
+
+    def loop():
+        while not _STOP.is_set():
+            try:
+                refresh_region_cube()
+            except Exception as e:
+                print(f"[WARN] Region cube build failed: {e}")
+            if interval <= 0 or _STOP.wait(interval):
+                return
+
+    thread = threading.Thread(target=loop, name="region-cube-refresh", daemon=True)
+    thread.start()
+    return thread
+
+
+def stop_background_refresh():
+    _STOP.set()
+
+
+def region_cube_stats() -> dict:
+    return _CUBE.stats() if _CUBE is not None else {"built_at": None}
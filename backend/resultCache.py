@@ -0,0 +1,141 @@
+import hashlib
+import re
+import sys
+from typing import Callable, Iterable, Optional
+
+import sqlparse
+from sqlparse import tokens as T
+
+from lruCache import LRUCache
+
+
+def _normalize_number(value: str) -> str:
+    # 10 / 10.0 / 10.000 -> 10 ; -80.1900 -> -80.19
+    try:
+        number = float(value)
+    except ValueError:
+        return value
+    if number.is_integer() and abs(number) < 1e15:
+        return str(int(number))
+    return repr(number)
+
+
+def canonicalize_sql(sql: str, keep_literals: bool = True) -> str:
+    """
+    Canonical form of a query for cache keys: comments and whitespace dropped,
+    keywords upper-cased, unquoted identifiers lower-cased (as Postgres folds them),
+    numeric literals normalized and the trailing semicolon removed.
+    With keep_literals=False every literal becomes "?" (the query's shape).
+    The canonical text is only used as a key, never executed.
+    """
+    parts = []
+    for statement in sqlparse.parse(sql):
+        for token in statement.flatten():
+            ttype = token.ttype
+            if ttype in T.Whitespace or ttype in T.Newline or ttype in T.Comment:
+                continue
+            value = token.value
+            if ttype in T.Keyword:
+                value = value.upper()
+            elif ttype in T.Name and not value.startswith('"'):
+                value = value.lower()
+            elif not keep_literals and (ttype in T.Number or ttype in T.String.Single):
+                value = "?"
+            elif ttype in T.Number:
+                value = _normalize_number(value)
+            parts.append(value)
+    while parts and parts[-1] == ";":
+        parts.pop()
+    return " ".join(parts)
+
+
+def estimate_rows_size(rows) -> int:
+    # Approximate memory held by a result set (containers + scalar values).
+    size = sys.getsizeof(rows)
+    for row in rows:
+        size += sys.getsizeof(row)
+        for value in row:
+            size += sys.getsizeof(value)
+    return size
+
+
+class CachedResult:
+    __slots__ = ("sql", "rows", "tables", "size")
+
+    def __init__(self, sql: str, rows, tables: frozenset):
+        self.sql = sql
+        self.rows = rows
+        self.tables = tables
+        self.size = estimate_rows_size(rows) + sys.getsizeof(sql)
+
+
+class ResultCache:
+    """
+    Cache of query results keyed on canonicalized SQL.
+
+    Memory is bounded by max_bytes (estimated size of cached rows) and max_entries.
+    Entries expire after ttl seconds and can be invalidated or refreshed per table
+    when the hazard data is reloaded.
+    """
+
+    def __init__(self, table_names: Iterable[str], max_entries: int = 10000,
+                 max_bytes: int = 64 * 1024 * 1024, ttl: Optional[float] = 3600):
+        self._tables = list(table_names)
+        self._cache = LRUCache(
+            max_entries=max_entries, ttl=ttl, max_bytes=max_bytes, sizeof=lambda entry: entry.size
+        )
+
+    @staticmethod
+    def key(sql: str) -> str:
+        return hashlib.sha256(canonicalize_sql(sql).encode("utf-8")).hexdigest()
+
+    def _tables_in(self, sql: str) -> frozenset:
+        return frozenset(t for t in self._tables if re.search(re.escape(t), sql))
+
+    def get(self, sql: str):
+        entry = self._cache.get(self.key(sql))
+        return entry.rows if entry is not None else None
+
+    def put(self, sql: str, rows) -> bool:
+        # Empty results are not cached: they usually mean a bad query, not stable data.
+        if not rows:
+            return False
+        return self._cache.set(self.key(sql), CachedResult(sql, rows, self._tables_in(sql)))
+
+    def _matching(self, tables: Optional[Iterable[str]]):
+        wanted = None if tables is None else set(tables)
+        return [
+            (key, entry) for key, entry, _ in self._cache.items()
+            if wanted is None or entry.tables & wanted
+        ]
+
+    def invalidate(self, tables: Optional[Iterable[str]] = None) -> int:
+        # Drop cached results touching any of the given tables (all results if None).
+        if tables is None:
+            count = len(self._cache)
+            self._cache.clear()
+            return count
+        matching = self._matching(tables)
+        for key, _ in matching:
+            self._cache.delete(key)
+        return len(matching)
+
+    def refresh(self, execute: Callable[[str], list], tables: Optional[Iterable[str]] = None) -> int:
+        # Re-run cached queries (e.g. after a data reload) and replace their results.
+        refreshed = 0
+        for key, entry in self._matching(tables):
+            try:
+                rows = execute(entry.sql)
+            except Exception as e:
+                print(f"[WARN] Result cache refresh failed, dropping entry: {e}")
+                self._cache.delete(key)
+                continue
+            if rows:
+                self._cache.set(key, CachedResult(entry.sql, rows, entry.tables))
+                refreshed += 1
+            else:
+                self._cache.delete(key)
+        return refreshed
+
+    def stats(self) -> dict:
+        return {**self._cache.stats(), "max_bytes": self._cache.max_bytes}
@@ -0,0 +1,176 @@
+import csv
+import io
+import math
+import threading
+from dataclasses import dataclass
+from decimal import Decimal
+from typing import Optional, Sequence
+
+try:
+    import tiktoken
+    _ENCODING = tiktoken.get_encoding("o200k_base")
+except Exception:  # optional: fall back to a character heuristic
+    _ENCODING = None
+
+# Columns preferred for ranking rows when the result has to be cut down
+SCORE_COLUMNS = ("risk_score", "risk_30yr", "risk_10yr", "risk_1yr")
+
+
+def estimate_tokens(text: str) -> int:
+    # Exact with tiktoken when installed, else ~4 characters per token
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text))
+    return math.ceil(len(text) / 4)
+
+
+def _format_value(value, decimals: int):
+    if isinstance(value, Decimal):
+        value = float(value)
+    if isinstance(value, float):
+        if math.isnan(value):
+            return ""
+        return format(round(value, decimals), "g")
+    if value is None:
+        return ""
+    return value
+
+
+def encode_rows(columns: Sequence[str], rows, decimals: int = 2) -> str:
+    # CSV with a header row; numbers rounded to `decimals` places
+    width = max((len(row) for row in rows), default=len(columns))
+    header = list(columns) if len(columns) == width else [f"col{i + 1}" for i in range(width)]
+    out = io.StringIO()
+    writer = csv.writer(out, lineterminator="\n")
+    writer.writerow(header)
+    for row in rows:
+        writer.writerow([_format_value(v, decimals) for v in row])
+    return out.getvalue()
+
+
+def _numeric(value) -> Optional[float]:
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float, Decimal)):
+        value = float(value)
+        return None if math.isnan(value) else value
+    return None
+
+
+def _score_index(columns: Sequence[str], rows) -> Optional[int]:
+    for name in SCORE_COLUMNS:
+        if name in columns:
+            return list(columns).index(name)
+    # else the last numeric column
+    first = rows[0] if rows else []
+    for i in range(len(first) - 1, -1, -1):
+        if _numeric(first[i]) is not None:
+            return i
+    return None
+
+
+def summarize_rows(columns: Sequence[str], rows, decimals: int = 2) -> str:
+    # Aggregate summary of the full result: row count, per-column min/mean/max, counts per hazard
+    names = list(columns) if columns and len(columns) == len(rows[0]) else [f"col{i + 1}" for i in range(len(rows[0]))]
+    lines = [f"rows: {len(rows)}"]
+    for i, name in enumerate(names):
+        values = [v for v in (_numeric(row[i]) for row in rows) if v is not None]
+        if values:
+            mean = sum(values) / len(values)
+            lines.append(
+                f"{name}: min {_format_value(min(values), decimals)}, "
+                f"mean {_format_value(mean, decimals)}, max {_format_value(max(values), decimals)}"
+            )
+    if "hazard" in names:
+        h = names.index("hazard")
+        counts = {}
+        for row in rows:
+            counts[row[h]] = counts.get(row[h], 0) + 1
+        lines.append("rows per hazard: " + ", ".join(f"{k}={v}" for k, v in counts.items()))
+    return "\n".join(lines)
+
+
+@dataclass
+class CompactedResult:
+    text: str
+    tokens_before: int
+    tokens_after: int
+    rows_total: int
+    rows_kept: int
+
+    @property
+    def truncated(self) -> bool:
+        return self.rows_kept < self.rows_total
+
+    def stats(self) -> dict:
+        return {
+            "tokens_before": self.tokens_before,
+            "tokens_after": self.tokens_after,
+            "rows_total": self.rows_total,
+            "rows_kept": self.rows_kept,
+        }
+
+
+def compact_result(columns: Sequence[str], rows, token_budget: int = 1500, decimals: int = 2) -> CompactedResult:
+    """
+    Encode a result set for the summarizer prompt within token_budget.
+    Small results are sent whole as CSV; larger ones as the top-K rows by score
+    plus an aggregate summary of all rows, with K shrunk until it fits.
+    tokens_before is the size of the old repr() encoding.
+    """
+    rows = list(rows or [])
+    columns = list(columns or [])
+    tokens_before = estimate_tokens(str(rows))
+
+    text = encode_rows(columns, rows, decimals)
+    tokens = estimate_tokens(text)
+    if tokens <= token_budget or not rows:
+        return CompactedResult(text, tokens_before, tokens, len(rows), len(rows))
+
+    score = _score_index(columns, rows)
+    if score is not None:
+        ranked = sorted(rows, key=lambda row: _numeric(row[score]) if _numeric(row[score]) is not None else -math.inf,
+                        reverse=True)
+    else:
+        ranked = rows
+    summary = summarize_rows(columns, rows, decimals)
+
+    # Rough first guess from the average row size, then shrink until it fits
+    per_row = max(tokens / (len(rows) + 1), 1)
+    k = max(int((token_budget - estimate_tokens(summary)) / per_row), 1)
+    while True:
+        top = encode_rows(columns, ranked[:k], decimals)
+        text = f"Top {k} of {len(rows)} rows:\n{top}\nSummary of all rows:\n{summary}\n"
+        tokens = estimate_tokens(text)
+        if tokens <= token_budget or k == 1:
+            return CompactedResult(text, tokens_before, tokens, len(rows), k)
+        k = max(k * 3 // 4, 1)
+
+
+class CompactionStats:
+    """Running totals of summarizer prompt savings, for /stats."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.truncated = 0
+        self.tokens_before = 0
+        self.tokens_after = 0
+
+    def record(self, compacted: CompactedResult):
+        with self._lock:
+            self.requests += 1
+            self.truncated += int(compacted.truncated)
+            self.tokens_before += compacted.tokens_before
+            self.tokens_after += compacted.tokens_after
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "truncated": self.truncated,
+                "tokens_before": self.tokens_before,
+                "tokens_after": self.tokens_after,
+            }
+
+
+compaction_stats = CompactionStats()
@@ -0,0 +1,168 @@
+import asyncio
+import re
+from typing import AsyncIterator, Callable, Dict, List, Optional
+
+
+def coalesce_key(question: str) -> str:
+    # Case, punctuation and spacing don't matter; word order does
+    return " ".join(re.findall(r"[a-z0-9]+", question.lower()))
+
+
+def _event_size(event) -> int:
+    # Rough size of a buffered event (rows events dominate)
+    return len(repr(event))
+
+
+class StreamOverflow(Exception):
+    """A subscriber fell so far behind that its unread events no longer fit the buffer."""
+
+
+class SharedStream:
+    """
+    One pipeline execution fanned out to many subscribers.
+
+    Events are buffered from the start so late joiners get a replay of what was
+    already emitted. The buffer is bounded by max_bytes: once the replay would
+    exceed it the stream stops accepting joiners and only keeps events that some
+    subscriber has not read yet; a subscriber that lags behind by more than
+    max_bytes is dropped with StreamOverflow while others are still reading.
+    The last subscriber is never dropped: its buffer may overshoot max_bytes.
+    """
+
+    def __init__(self, source: AsyncIterator, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.joinable = True
+        self.subscribers = 0
+        self._events: List = []
+        self._sizes: List[int] = []
+        self._offset = 0          # index of self._events[0] in the full stream
+        self._bytes = 0
+        self._cursors: Dict[int, int] = {}    # subscriber -> next event position
+        self._evicted = set()
+        self._next_id = 0
+        self._done = False
+        self._error: Optional[BaseException] = None
+        self._changed = asyncio.Event()
+        self._task = asyncio.create_task(self._pump(source))
+
+    async def _pump(self, source: AsyncIterator):
+        try:
+            async for event in source:
+                self._append(event)
+        except asyncio.CancelledError:
+            self._error = asyncio.CancelledError()
+            raise
+        except Exception as e:
+            self._error = e
+        finally:
+            self._done = True
+            self._wake()
+
+    def _wake(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def _append(self, event):
+        size = _event_size(event)
+        self._events.append(event)
+        self._sizes.append(size)
+        self._bytes += size
+        if self._bytes > self.max_bytes:
+            self.joinable = False
+            self._trim()
+        self._wake()
+
+    def _trim(self):
+        # Drop events every subscriber has read, then evict the most lagging subscribers
+        # (the newest event is always kept, and so is the last subscriber: a lone /ask
+        # with a large rows event still gets its answer)
+        self._drop_until(self._read_by_all())
+        while self._bytes > self.max_bytes and len(self._events) > 1 and len(self._cursors) > 1:
+            slowest = min(self._cursors, key=self._cursors.get)
+            del self._cursors[slowest]
+            self._evicted.add(slowest)
+            self._drop_until(self._read_by_all())
+
+    def _read_by_all(self) -> int:
+        return min(self._cursors.values(), default=self._offset + len(self._events))
+
+    def _drop_until(self, position: int):
+        count = max(position - self._offset, 0)
+        if count:
+            self._bytes -= sum(self._sizes[:count])
+            del self._events[:count]
+            del self._sizes[:count]
+            self._offset += count
+
+    def subscribe(self) -> AsyncIterator:
+        # Register now (not on first iteration) so the replay starts from what is buffered at join time
+        subscriber = self._next_id
+        self._next_id += 1
+        self._cursors[subscriber] = self._offset
+        self.subscribers += 1
+        return self._follow(subscriber)
+
+    async def _follow(self, subscriber: int):
+        try:
+            while True:
+                if subscriber in self._evicted:
+                    raise StreamOverflow("subscriber fell too far behind the shared stream")
+                position = self._cursors[subscriber]
+                if position - self._offset < len(self._events):
+                    event = self._events[position - self._offset]
+                    self._cursors[subscriber] = position + 1
+                    if not self.joinable:
+                        self._trim()
+                    yield event
+                elif self._done:
+                    if self._error is not None and not isinstance(self._error, asyncio.CancelledError):
+                        raise self._error
+                    return
+                else:
+                    await self._changed.wait()
+        finally:
+            self._cursors.pop(subscriber, None)
+            self._evicted.discard(subscriber)
+            self.subscribers -= 1
+            if not self.joinable:
+                self._trim()
+            if self.subscribers == 0 and not self._done:
+                # Everyone disconnected: stop paying for the LLM/DB work
+                self._task.cancel()
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent /ask requests with the same key onto one execution.
+    The first request starts the pipeline; requests arriving while it is still
+    running (and its replay buffer is within max_bytes) attach to it.
+    """
+
+    def __init__(self, max_bytes: int = 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._inflight: Dict[str, SharedStream] = {}
+        self.executions = 0
+        self.coalesced = 0
+
+    def subscribe(self, key: str, start: Callable[[], AsyncIterator]) -> AsyncIterator:
+        stream = self._inflight.get(key)
+        if stream is not None and stream.joinable and not stream._done:
+            self.coalesced += 1
+        else:
+            stream = SharedStream(start(), self.max_bytes)
+            self._inflight[key] = stream
+            self.executions += 1
+            stream._task.add_done_callback(lambda _: self._release(key, stream))
+        return stream.subscribe()
+
+    def _release(self, key: str, stream: SharedStream):
+        if self._inflight.get(key) is stream:
+            del self._inflight[key]
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": len(self._inflight),
+            "executions": self.executions,
+            "coalesced": self.coalesced,
+            "max_bytes": self.max_bytes,
+        }
@@ -0,0 +1,183 @@
+import argparse
+import json
+import threading
+import time
+import warnings
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+from database import ALLOWED_TABLES, RISK_COLUMNS, run_sql_query
+from llm import build_city_hazard_block
+from regionCube import to_float
+
+# In-process alternative to the PostGIS KNN lookups used for city questions.
+# Each hazard table is loaded once as cell centroids + risk columns, indexed with
+# a KD-tree on (lon, lat). Distances are planar degrees like `geometry <-> point`
+# on SRID 4326; measuring to centroids instead of polygon edges is the one
+# approximation, which verify_against_postgis() quantifies.
+
+
+class HazardTableIndex:
+    def __init__(self, table: str, coords: np.ndarray, regions: np.ndarray, values: np.ndarray):
+        self.table = table
+        self.coords = coords        # [N, 2] float64 (lon, lat)
+        self.regions = regions      # [N] object
+        self.values = values        # [N, len(RISK_COLUMNS)] float32, NaN for NULL
+        self.tree = cKDTree(coords)
+
+    @classmethod
+    def load(cls, table: str, execute: Callable[[str], list]) -> "HazardTableIndex":
+        columns = ", ".join(RISK_COLUMNS)
+        rows = execute(
+            f"SELECT ST_X(ST_Centroid(geometry)), ST_Y(ST_Centroid(geometry)), region, {columns} FROM {table}"
+        )
+        coords = np.array([(float(r[0]), float(r[1])) for r in rows], dtype=np.float64).reshape(len(rows), 2)
+        regions = np.array([r[2] for r in rows], dtype=object)
+        values = np.array(
+            [[np.nan if v is None else float(v) for v in r[3:]] for r in rows], dtype=np.float32
+        ).reshape(len(rows), len(RISK_COLUMNS))
+        return cls(table, coords, regions, values)
+
+    def knn(self, points: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        # Vectorized k-nearest lookup for a batch of (lon, lat) points -> ([Q, k] distances, [Q, k] indices)
+        k = min(k, len(self.coords))
+        if k == 0:
+            # empty table (cKDTree rejects k=0): no neighbours
+            return np.empty((len(points), 0)), np.empty((len(points), 0), dtype=np.intp)
+        distances, indices = self.tree.query(points, k=k)
+        return distances.reshape(len(points), k), indices.reshape(len(points), k)
+
+    def nearest_averages(self, points: np.ndarray, columns: Sequence[int], k: int = 20):
+        # Region of the nearest cell and AVG of each column over the k nearest (NULLs ignored).
+        _, indices = self.knn(points, k)
+        if indices.shape[1] == 0:
+            # like the SQL over an empty table: NULL region and NULL averages
+            return np.full(len(points), None, dtype=object), np.full((len(points), len(columns)), np.nan)
+        regions = self.regions[indices[:, 0]]
+        with warnings.catch_warnings():
+            # all-NULL neighbourhoods become NaN (NULL), like SQL AVG
+            warnings.simplefilter("ignore", category=RuntimeWarning)
+            averages = np.nanmean(self.values[indices][:, :, columns], axis=1)
+        return regions, averages
+
+    def __len__(self):
+        return len(self.coords)
+
+
+class SpatialIndex:
+    def __init__(self, tables: Dict[str, HazardTableIndex], built_at: float):
+        self.tables = tables
+        self.built_at = built_at
+
+    @classmethod
+    def build(cls, execute: Callable[[str], list] = None, tables: List[str] = ALLOWED_TABLES) -> "SpatialIndex":
+        execute = execute or (lambda sql: run_sql_query(sql, use_cache=False, trusted=True))
+        return cls({table: HazardTableIndex.load(table, execute) for table in tables}, time.time())
+
+    def city_rows(self, locations: Sequence[Tuple[str, float, float]], table: str,
+                  scenario: int = 5, horizons=(1, 10, 30), k: int = 20) -> list:
+        # Same columns as build_city_hazard_block: [city, hazard, region, risk...]
+        points = np.array([(lon, lat) for _, lon, lat in locations], dtype=np.float64)
+        columns = [RISK_COLUMNS.index(f"ssp{scenario}_{h}yr") for h in horizons]
+        regions, averages = self.tables[table].nearest_averages(points, columns, k)
+        hazard = table.strip('"')
+        return [
+            [label, hazard, region] + [to_float(v) for v in row]
+            for (label, _, _), region, row in zip(locations, regions, averages)
+        ]
+
+    def rows_for_plan(self, plan) -> list:
+        # Same row order as the plan's SQL (table-major, locations in input order).
+        rows = []
+        for table in plan.hazard_tables:
+            rows.extend(self.city_rows(plan.locations, table, plan.scenario, plan.horizons))
+        return rows
+
+    def stats(self) -> dict:
+        return {
+            "built_at": self.built_at,
+            "cells": {table: len(index) for table, index in self.tables.items()},
+        }
+
+
+def verify_against_postgis(index: SpatialIndex, locations: Sequence[Tuple[str, float, float]],
+                           execute: Callable[[str], list] = None, tolerance: float = 0.05) -> dict:
+    """
+    Compare index answers with build_city_hazard_block run in PostGIS.
+    A location x table pair matches when the nearest region is the same and every
+    horizon average is within tolerance.
+    """
+    execute = execute or (lambda sql: run_sql_query(sql, use_cache=False, trusted=True))
+    checked, mismatches = 0, []
+    for table in index.tables:
+        ours = index.city_rows(locations, table)
+        for (label, lon, lat), row in zip(locations, ours):
+            theirs = list(execute(build_city_hazard_block(label, lon, lat, table))[0])
+            checked += 1
+            same_region = row[2] == theirs[2]
+            close = all(
+                (a is None and b is None) or (a is not None and b is not None and abs(a - float(b)) <= tolerance)
+                for a, b in zip(row[3:], theirs[3:])
+            )
+            if not (same_region and close):
+                mismatches.append({"location": label, "table": table, "index": row[2:], "postgis": [
+                    v if v is None or isinstance(v, str) else float(v) for v in theirs[2:]
+                ]})
+    return {
+        "checked": checked,
+        "mismatches": len(mismatches),
+        "match_rate": round(1 - len(mismatches) / checked, 4) if checked else 1.0,
+        "details": mismatches,
+    }
+
+
+_INDEX: Optional[SpatialIndex] = None
+_LOCK = threading.Lock()
+
+
+def get_spatial_index() -> Optional[SpatialIndex]:
+    return _INDEX
+
+
+def refresh_spatial_index() -> SpatialIndex:
+    global _INDEX
+    with _LOCK:
+        index = SpatialIndex.build()
+        _INDEX = index
+    return index
+
+
+def start_background_build():
+    def build():
+        try:
+            refresh_spatial_index()
+        except Exception as e:
+            print(f"[WARN] Spatial index build failed: {e}")
+
+    thread = threading.Thread(target=build, name="spatial-index-build", daemon=True)
+    thread.start()
+    return thread
+
+
+def spatial_index_stats() -> dict:
+    return _INDEX.stats() if _INDEX is not None else {"built_at": None}
+
+
+if __name__ == "__main__":
+    # python spatialIndex.py --verify  -> consistency report against PostGIS for the gazetteer cities
+    from geoLocations import CITIES
+
+    parser = argparse.ArgumentParser(description="Build the spatial index and check it against PostGIS.")
+    parser.add_argument("--verify", action="store_true")
+    parser.add_argument("--sample", type=int, default=25, help="number of gazetteer cities to check")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    index = refresh_spatial_index()
+    print(json.dumps({**index.stats(), "build_seconds": round(time.perf_counter() - started, 2)}))
+    if args.verify:
+        sample = [(name, lon, lat) for name, (lon, lat) in list(CITIES.items())[:args.sample]]
+        report = verify_against_postgis(index, sample)
+        print(json.dumps(report, indent=2, default=str))
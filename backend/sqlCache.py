@@ -0,0 +1,139 @@
+import hashlib
+import json
+import os
+import re
+import threading
+from typing import List, Optional
+
+from database import validate_sql
+from lruCache import LRUCache
+
+# Words that don't change which SQL a question needs.
+# Keep words like "how many" / "highest" — they change the query shape.
+STOPWORDS = {
+    "a", "an", "the", "in", "at", "of", "for", "is", "are", "was", "what", "whats",
+    "me", "please", "tell", "show", "give", "to", "on", "there", "s", "about",
+}
+
+
+def normalize_question(question: str) -> str:
+    # "What is the flood risk in Miami?" and "flood risk in Miami" -> "flood risk miami".
+    # Word order and repeats are kept: "10 years under SSP1 vs 30 years under SSP5"
+    # needs different SQL than the same words with the numbers swapped.
+    tokens = re.findall(r"[a-z0-9]+", question.lower())
+    return " ".join(token for token in tokens if token not in STOPWORDS)
+
+
+class SqlCache:
+    """
+    Natural-language -> SQL cache in front of the LLM SQL generator.
+
+    Entries are keyed on the normalized question, detected hazards and region.
+    The whole cache is tied to a prompt fingerprint (prompt version + rendered
+    static prompt + DB context); when the fingerprint changes every entry is dropped.
+    When a path is given, entries are persisted as JSON and reloaded on startup;
+    writes are debounced (save_delay seconds) and done on a background thread,
+    so put() never rewrites the file on the caller's (event loop) thread.
+    """
+
+    def __init__(self, max_entries: int = 2048, ttl: Optional[float] = 86400, path: Optional[str] = None,
+                 save_delay: float = 2.0):
+        self._cache = LRUCache(max_entries=max_entries, ttl=ttl)
+        self.path = path
+        self.save_delay = save_delay
+        self.fingerprint: Optional[str] = None
+        self._lock = threading.Lock()
+        self._save_timer: Optional[threading.Timer] = None
+        self.invalidations = 0
+        if path:
+            self._load()
+
+    @property
+    def max_entries(self) -> int:
+        return self._cache.max_entries
+
+    @staticmethod
+    def make_key(question: str, hazards: List[str], region: Optional[str]) -> str:
+        return json.dumps([normalize_question(question), sorted(hazards or []), region])
+
+    def _check_fingerprint(self, fingerprint: str):
+        with self._lock:
+            if fingerprint == self.fingerprint:
+                return
+            if self.fingerprint is not None:
+                self.invalidations += 1
+            self._cache.clear()
+            self.fingerprint = fingerprint
+
+    def get(self, question: str, hazards: List[str], region: Optional[str], fingerprint: str) -> Optional[str]:
+        self._check_fingerprint(fingerprint)
+        return self._cache.get(self.make_key(question, hazards, region))
+
+    def put(self, question: str, hazards: List[str], region: Optional[str], fingerprint: str, sql: str) -> bool:
+        # Only SQL that would actually be executed is worth caching.
+        if not sql or not validate_sql(sql):
+            return False
+        self._check_fingerprint(fingerprint)
+        self._cache.set(self.make_key(question, hazards, region), sql)
+        if self.path:
+            self._schedule_save()
+        return True
+
+    def clear(self):
+        self._cache.clear()
+        if self.path:
+            self._schedule_save()
+
+    def _schedule_save(self):
+        # One pending write at a time; inserts during the delay are picked up by it
+        with self._lock:
+            if self._save_timer is not None:
+                return
+            self._save_timer = threading.Timer(self.save_delay, self._scheduled_save)
+            self._save_timer.daemon = True
+            self._save_timer.start()
+
+    def _scheduled_save(self):
+        with self._lock:
+            self._save_timer = None
+        self._save()
+
+    def flush(self):
+        # Write a pending save now (shutdown, tests)
+        with self._lock:
+            timer, self._save_timer = self._save_timer, None
+        if timer is not None:
+            timer.cancel()
+            self._save()
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        self.fingerprint = data.get("fingerprint")
+        for key, sql, expires_at in data.get("entries", []):
+            self._cache.set(key, sql, expires_at=expires_at)
+
+    def _save(self):
+        data = {
+            "fingerprint": self.fingerprint,
+            "entries": [[key, sql, expires_at] for key, sql, expires_at in self._cache.items()],
+        }
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"[WARN] Could not persist SQL cache to {self.path}: {e}")
+
+    def stats(self) -> dict:
+        return {**self._cache.stats(), "invalidations": self.invalidations}
+
+
+def prompt_fingerprint(version: str, messages: List[dict]) -> str:
+    # Hash of everything that shapes the generated SQL apart from the question itself.
+    payload = json.dumps([version, messages], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
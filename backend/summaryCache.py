@@ -0,0 +1,78 @@
+import asyncio
+import hashlib
+import json
+from typing import AsyncIterator, List, Optional
+
+from lruCache import LRUCache
+from singleFlight import coalesce_key
+
+
+def rows_fingerprint(columns, rows) -> str:
+    # Same question + same rows -> same summary; any change in the data is a new key
+    payload = json.dumps([list(columns or []), [list(row) for row in rows]], default=str, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _chunks_size(chunks: List[str]) -> int:
+    return sum(len(chunk.encode("utf-8")) for chunk in chunks)
+
+
+class SummaryCache:
+    """
+    Completed /ask summaries keyed on the normalized question, a fingerprint of
+    the result rows, the SQL and the summary prompt version (which covers the DB
+    context). Answers are stored as the original chunks so a hit can be replayed
+    token by token; only streams that ran to completion are stored.
+    """
+
+    def __init__(self, max_entries: int = 1024, max_bytes: Optional[int] = 16 * 1024 * 1024,
+                 ttl: Optional[float] = 86400):
+        self._cache = LRUCache(max_entries=max_entries, ttl=ttl, max_bytes=max_bytes, sizeof=_chunks_size)
+        self.stored = 0
+        self.abandoned = 0
+
+    @staticmethod
+    def make_key(question: str, columns, rows, sql: str, prompt_version: str) -> str:
+        parts = [coalesce_key(question), rows_fingerprint(columns, rows), " ".join(sql.split()), prompt_version]
+        return hashlib.sha256(json.dumps(parts).encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[List[str]]:
+        return self._cache.get(key)
+
+    def put(self, key: str, chunks: List[str]) -> bool:
+        if not chunks:
+            return False
+        stored = self._cache.set(key, list(chunks))
+        self.stored += stored
+        return stored
+
+    async def recording(self, key: str, chunks: AsyncIterator[str]):
+        # Pass the live stream through and store it once it has ended normally;
+        # errors and client disconnects (generator closed early) store nothing.
+        collected = []
+        completed = False
+        try:
+            async for chunk in chunks:
+                collected.append(chunk)
+                yield chunk
+            completed = True
+        finally:
+            if completed:
+                self.put(key, collected)
+            else:
+                self.abandoned += 1
+
+    def clear(self):
+        self._cache.clear()
+
+    def stats(self) -> dict:
+        return {**self._cache.stats(), "stored": self.stored, "abandoned": self.abandoned}
+
+
+async def replay(chunks: List[str], chunks_per_second: float = 0):
+    # Cached answer as a token stream; paced like a live answer when chunks_per_second > 0
+    delay = 1 / chunks_per_second if chunks_per_second > 0 else 0
+    for index, chunk in enumerate(chunks):
+        if delay and index:
+            await asyncio.sleep(delay)
+        yield chunk
@@ -1,29 +1,83 @@
 from fastapi.testclient import TestClient
 from main import app
 
-print(">>> stream_summarize_answer currently:", "main.stream_summarize_answer")
+print(">>> stream_summarize_answer currently:", "main.stream_summarize_answer_async")
 
 client = TestClient(app)
 
 # A proper fake stream generator
-def fake_stream(*a, **k):
+async def fake_stream(*a, **k):
     yield "Fallback answer"
 
 
+async def fake_generate_sql(*a, **k):
+    return "SELECT 1;"
+
+
+async def fake_run_sql_query(*a, **k):
+    return [(5,)]  # fake DB result
+
+
 def test_ask_endpoint_valid(monkeypatch):
     # Patch functions as imported inside main.py
-    monkeypatch.setattr("main.generate_sql", lambda *a, **k: "SELECT 1;")
+    monkeypatch.setattr("main.generate_sql_async", fake_generate_sql)
     monkeypatch.setattr("main.validate_sql", lambda *a, **k: True)
-    monkeypatch.setattr("main.run_sql_query", lambda *a, **k: [(5,)])  # fake DB result
-    monkeypatch.setattr("main.stream_summarize_answer", fake_stream)
+    monkeypatch.setattr("main.run_sql_query_async", fake_run_sql_query)
+    monkeypatch.setattr("main.stream_summarize_answer_async", fake_stream)
 
     response = client.post("/ask", json={"query": "What is flood risk in Asia?"})
     assert response.status_code == 200
     assert "Fallback answer" in response.text
 
 
+def test_ask_endpoint_falls_back_when_sql_generation_fails(monkeypatch):
+    async def no_sql(*a, **k):
+        return None
+
+    monkeypatch.setattr("main.generate_sql_async", no_sql)
+    monkeypatch.setattr("main.fallback_stream_answer_async", fake_stream)
+
+    response = client.post("/ask", json={"query": "What is flood risk in Asia?"})
+    assert response.status_code == 200
+    assert "Fallback answer" in response.text
 
 
+def test_ask_endpoint_ndjson_sends_rows_before_tokens(monkeypatch):
+    import json
+    from database import QueryResult
 
+    async def fake_rows(*a, **k):
+        return QueryResult([[5, "FloodRisk", "Asia"]], ["risk_score", "hazard", "region"])
+
+    monkeypatch.setattr("main.generate_sql_async", fake_generate_sql)
+    monkeypatch.setattr("main.validate_sql", lambda *a, **k: True)
+    monkeypatch.setattr("main.PLANNER_ENABLED", False)
+    monkeypatch.setattr("main.run_sql_query_async", fake_rows)
+    monkeypatch.setattr("main.stream_summarize_answer_async", fake_stream)
+
+    response = client.post("/ask?format=ndjson", json={"query": "What is flood risk in Asia?"})
+    events = [json.loads(line) for line in response.text.splitlines()]
+    types = [event["type"] for event in events]
+
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    assert types.index("sql") < types.index("rows") < types.index("token")
+    rows = events[types.index("rows")]
+    assert rows["columns"] == ["risk_score", "hazard", "region"]
+    assert rows["rows"] == [[5, "FloodRisk", "Asia"]]
+    assert types[-1] == "done"
+
+
+def test_ask_endpoint_reports_fallback_reason(monkeypatch):
+    async def empty(*a, **k):
+        return []
+
+    monkeypatch.setattr("main.generate_sql_async", fake_generate_sql)
+    monkeypatch.setattr("main.validate_sql", lambda *a, **k: True)
+    monkeypatch.setattr("main.PLANNER_ENABLED", False)
+    monkeypatch.setattr("main.run_sql_query_async", empty)
+    monkeypatch.setattr("main.fallback_stream_answer_async", fake_stream)
 
+    response = client.post("/ask", json={"query": "What is flood risk in Asia?"}, headers={"Accept": "text/event-stream"})
 
+    assert "event: fallback" in response.text
+    assert '"reason":"empty_result"' in response.text
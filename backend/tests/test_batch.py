@@ -0,0 +1,60 @@
+import json
+
+from fastapi.testclient import TestClient
+
+from database import QueryResult
+from main import app
+
+client = TestClient(app)
+
+
+def _setup(monkeypatch, queries_seen):
+    async def fake_generate_sql(user_query, hazard_tables, region=None):
+        if "broken" in user_query:
+            return "DROP TABLE x"
+        if "boom" in user_query:
+            return 'SELECT 1 FROM "HeatRisk"'
+        return 'SELECT ssp5_10yr AS risk_score FROM "FloodRisk"'
+
+    async def fake_rows(sql, **k):
+        queries_seen.append(sql)
+        if "HeatRisk" in sql:
+            raise RuntimeError("connection reset")
+        return QueryResult([[0.5]], ["risk_score"])
+
+    async def fake_stream(*a, **k):
+        yield "answer"
+
+    monkeypatch.setattr("main.PLANNER_ENABLED", False)
+    monkeypatch.setattr("main.generate_sql_async", fake_generate_sql)
+    monkeypatch.setattr("main.run_sql_query_async", fake_rows)
+    monkeypatch.setattr("main.stream_summarize_answer_async", fake_stream)
+    monkeypatch.setattr("main.fallback_stream_answer_async", fake_stream)
+
+
+def test_batch_streams_indexed_results_and_shares_lookups(monkeypatch):
+    seen = []
+    _setup(monkeypatch, seen)
+    queries = ["Flood risk in Miami?", "flood risk in miami", "Flood risk in Boston", "broken question", "boom"]
+
+    response = client.post("/ask/batch", json={"queries": queries, "concurrency": 2})
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    results = {line["index"]: line for line in lines if line["type"] == "result"}
+
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    assert sorted(results) == [0, 1, 2, 3, 4]
+    assert lines[-1] == {"type": "done", "count": 5, "executed": 4}
+    # same SQL for the Miami and Boston questions -> one DB lookup (plus the failing one)
+    assert seen.count('SELECT ssp5_10yr AS risk_score FROM "FloodRisk"') == 1
+    assert results[1]["query"] == "flood risk in miami"
+    assert results[0]["rows"] == [[0.5]] and results[0]["answer"] == "answer"
+    # failures fall back per item
+    assert results[3]["fallback"] == "invalid_sql"
+    assert results[4]["fallback"] == "db_error"
+    assert results[2]["fallback"] is None
+
+
+def test_batch_rejects_empty_and_oversized(monkeypatch):
+    assert client.post("/ask/batch", json={"queries": []}).status_code == 422
+    monkeypatch.setattr("main.BATCH_MAX_QUERIES", 2)
+    assert client.post("/ask/batch", json={"queries": ["a", "b", "c"]}).status_code == 422
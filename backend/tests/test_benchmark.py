@@ -0,0 +1,37 @@
+from benchmark import compare, percentile, run_ask_benchmark, summarize
+
+
+def test_summarize_percentiles():
+    stats = summarize([float(i) for i in range(1, 101)])
+    assert stats["count"] == 100
+    assert stats["p50_ms"] == 50.5
+    assert stats["min_ms"] == 1.0 and stats["max_ms"] == 100.0
+    assert percentile([], 0.5) == 0.0
+
+
+def test_compare_flags_slower_stages_and_lower_throughput():
+    baseline = {"micro": {"validate_sql.simple": {"p50_ms": 0.1}},
+                "ask": {"stages": {"run_sql": {"count": 5, "p50_ms": 10.0, "p90_ms": 12.0}}, "throughput_rps": 100}}
+    current = {"micro": {"validate_sql.simple": {"p50_ms": 0.11}},
+               "ask": {"stages": {"run_sql": {"count": 5, "p50_ms": 15.0, "p90_ms": 12.5}}, "throughput_rps": 70}}
+    flagged = {r["metric"] for r in compare(baseline, current, threshold=0.2)}
+    # +10% on a 0.1 ms helper is timer noise, +50% on run_sql and -30% throughput are not
+    assert flagged == {"ask.stage.run_sql.p50_ms", "ask.throughput_rps"}
+    assert compare(baseline, baseline) == []
+
+
+def test_ask_benchmark_runs_offline():
+    report = run_ask_benchmark(requests=6, concurrency=3)
+    assert set(report["stages"]) >= {"detect_hazards", "generate_sql", "run_sql", "summarize"}
+    assert report["total"]["count"] == 6
+    assert report["ttft"]["count"] == 6
+    # one query per question, plus one per extra branch of the multi-hazard question that fans out
+    assert report["db_queries"] == 9
+    assert report["throughput_rps"] > 0
+
+
+def test_ask_benchmark_summarizes_every_request_unless_caches_are_on():
+    report = run_ask_benchmark(requests=12, concurrency=1, questions=["What is the flood risk in Miami?"])
+    assert report["cache_hits"]["summary_cache"] == 0
+    cached = run_ask_benchmark(requests=12, concurrency=1, questions=["What is the flood risk in Miami?"], caches=True)
+    assert cached["cache_hits"]["summary_cache"] == 11
@@ -0,0 +1,92 @@
+import threading
+import pytest
+from connectionPool import ConnectionPool, PoolTimeout
+
+
+class FakeStatement:
+    def __init__(self, conn, sql):
+        self.conn = conn
+        self.sql = sql
+        self.columns = [{"name": "risk_score"}]
+
+    def run(self, **params):
+        self.conn.executed.append(self.sql)
+        return [[5]]
+
+    def close(self):
+        self.conn.closed_statements += 1
+
+
+class FakeConnection:
+    def __init__(self):
+        self.executed = []
+        self.prepared = 0
+        self.closed_statements = 0
+        self.closed = False
+        self.columns = None
+
+    def prepare(self, sql):
+        self.prepared += 1
+        return FakeStatement(self, sql)
+
+    def run(self, sql, **params):
+        return [[1]]
+
+    def close(self):
+        self.closed = True
+
+
+def test_connections_are_reused():
+    opened = []
+    pool = ConnectionPool(lambda: opened.append(FakeConnection()) or opened[-1], min_size=1, max_size=2)
+
+    for _ in range(5):
+        rows, columns = pool.run('SELECT ssp5_10yr FROM "FloodRisk" LIMIT 1')
+
+    assert rows == [[5]]
+    assert columns[0]["name"] == "risk_score"
+    assert len(opened) == 1
+    # Same SQL shape is prepared once (on its second run) and reused
+    assert opened[0].prepared == 1
+    assert len(opened[0].executed) == 4
+    assert pool.stats()["created"] == 1
+    assert pool.stats()["in_use"] == 0
+
+
+def test_one_off_sql_is_not_prepared():
+    conn = FakeConnection()
+    pool = ConnectionPool(lambda: conn, min_size=1, max_size=1)
+
+    for i in range(10):
+        assert pool.run(f"SELECT {i}") == ([[1]], None)
+
+    assert conn.prepared == 0 and conn.closed_statements == 0
+
+
+def test_pool_respects_max_size():
+    pool = ConnectionPool(FakeConnection, min_size=0, max_size=1, checkout_timeout=0.05)
+    held = pool.acquire()
+
+    with pytest.raises(PoolTimeout):
+        pool.acquire()
+
+    # A waiter gets the connection once it is released
+    got = []
+    waiter = threading.Thread(target=lambda: got.append(pool.acquire()))
+    pool.checkout_timeout = 2
+    waiter.start()
+    pool.release(held)
+    waiter.join()
+    assert got == [held]
+    assert pool.stats()["created"] == 1
+
+
+def test_idle_connections_are_recycled():
+    pool = ConnectionPool(FakeConnection, min_size=0, max_size=2, idle_timeout=0)
+    first = pool.acquire()
+    pool.release(first)
+    second = pool.acquire()
+
+    assert second is not first
+    assert first.raw.closed
+    assert pool.stats()["closed"] == 1
@@ -0,0 +1,85 @@
+from dbMigrations import all_migrations, apply_migrations, check_plans, seed_statements, seq_scans
+
+
+def _fake_run(present=(), fail=()):
+    executed = []
+
+    def run(sql):
+        if sql.startswith("SELECT 1 FROM"):
+            return [[1]] if any(name in sql for name in present) else []
+        if any(name in sql for name in fail):
+            raise RuntimeError("permission denied")
+        executed.append(sql)
+        return []
+
+    return run, executed
+
+
+def test_migrations_are_idempotent_statements():
+    for migration in all_migrations():
+        for statement in migration.statements:
+            assert "IF NOT EXISTS" in statement
+            if statement.startswith("CREATE INDEX"):
+                assert "CONCURRENTLY" in statement
+
+
+def test_apply_skips_present_and_analyzes_changed_tables():
+    run, executed = _fake_run(present=["pg_trgm", "floodrisk_geometry_gist"])
+    report = apply_migrations(run, tables=['"FloodRisk"'])
+    status = {r["name"]: r["status"] for r in report}
+
+    assert status["pg_trgm"] == "present" and status["floodrisk_geometry_gist"] == "present"
+    assert status["floodrisk_region_trgm"] == "applied"
+    assert not any("geometry_gist" in sql and "CREATE" in sql for sql in executed)
+    assert 'CREATE INDEX CONCURRENTLY IF NOT EXISTS floodrisk_region_trgm ON "FloodRisk" USING gin (region gin_trgm_ops)' in executed
+    assert executed[-1] == 'ANALYZE "FloodRisk"'
+
+
+def test_failed_migration_is_reported_and_dry_run_executes_nothing():
+    run, executed = _fake_run(fail=["pg_trgm"])
+    report = apply_migrations(run, tables=['"HeatRisk"'])
+    assert report[0] == {"name": "pg_trgm", "status": "failed", "error": "permission denied"}
+    assert report[1]["status"] == "applied"
+
+    run, executed = _fake_run()
+    report = apply_migrations(run, tables=['"HeatRisk"'], dry_run=True)
+    assert executed == [] and {r["status"] for r in report} == {"pending"}
+
+
+def test_seq_scans_are_found_anywhere_in_the_plan():
+    plan = {"Node Type": "Aggregate", "Plans": [
+        {"Node Type": "Limit", "Plans": [{"Node Type": "Index Scan", "Relation Name": "FloodRisk"}]},
+        {"Node Type": "Seq Scan", "Relation Name": "HeatRisk"},
+        {"Node Type": "Function Scan", "Plans": [{"Node Type": "Seq Scan", "Relation Name": "unrelated"}]},
+    ]}
+    assert seq_scans(plan, ["FloodRisk", "HeatRisk"]) == ["HeatRisk"]
+
+
+def test_check_flags_queries_that_scan_sequentially():
+    def explain(sql):
+        if "ILIKE" in sql:
+            return {"Node Type": "Aggregate", "Total Cost": 900.0,
+                    "Plans": [{"Node Type": "Seq Scan", "Relation Name": "FloodRisk"}]}
+        return {"Node Type": "Limit", "Total Cost": 8.5,
+                "Plans": [{"Node Type": "Index Scan", "Relation Name": "FloodRisk"}]}
+
+    results = check_plans(explain, tables=['"FloodRisk"'])
+    failed = {r["query"] for r in results if not r["ok"]}
+    assert failed == {"region_block", "region_batch", "prompt_region"}
+    assert {r["query"] for r in results} >= {"city_block", "city_batch", "prompt_city"}
+
+
+def test_seed_creates_the_schema_columns():
+    create, insert, analyze = seed_statements('"WildfireRisk"', cells=100)
+    assert create.startswith('CREATE TABLE "WildfireRisk"')
+    assert "ssp5_30yr_ann_arid_waves double precision" in create
+    assert "generate_series(0, 99)" in insert and analyze == 'ANALYZE "WildfireRisk"'
+
+
+def test_column_migrations_are_marked_blocking(capsys):
+    run, executed = _fake_run()
+    pending = apply_migrations(run, tables=['"FloodRisk"'], dry_run=True)
+    assert {r["name"] for r in pending if r["blocking"]} == {"floodrisk_centroid"}
+
+    apply_migrations(run, tables=['"FloodRisk"'])
+    assert capsys.readouterr().out.count("ACCESS EXCLUSIVE") == 1
@@ -0,0 +1,180 @@
+import asyncio
+import json
+import time
+
+import openai
+import pytest
+from fastapi.testclient import TestClient
+
+from llmGateway import LLMGateway, LLMOverloaded, LLMUnavailable, TokenBucket
+from main import app
+
+client = TestClient(app)
+
+
+def test_concurrency_limit_and_fast_rejection_when_queue_is_full():
+    async def scenario():
+        gateway = LLMGateway(max_concurrency=2, max_queue=2)
+        active, peak = 0, 0
+
+        async def create(**kwargs):
+            nonlocal active, peak
+            active += 1
+            peak = max(peak, active)
+            await asyncio.sleep(0.02)
+            active -= 1
+            return "ok"
+
+        calls = [asyncio.create_task(gateway.complete(create, model="m")) for _ in range(4)]
+        await asyncio.sleep(0.005)          # 2 running, 2 waiting: the queue is full
+        assert gateway.stats()["waiting"] == 2
+        with pytest.raises(LLMOverloaded):
+            await gateway.complete(create, model="m")
+        assert await asyncio.gather(*calls) == ["ok"] * 4
+        return peak, gateway.stats()
+
+    peak, stats = asyncio.run(scenario())
+    assert peak == 2
+    assert stats["rejected"] == 1 and stats["waiting"] == 0 and stats["in_flight"] == 0
+
+
+def test_retries_retryable_errors_with_backoff():
+    async def scenario():
+        gateway = LLMGateway(max_retries=3, backoff_base=0.001, backoff_max=0.002)
+        attempts = []
+
+        async def flaky(**kwargs):
+            attempts.append(1)
+            if len(attempts) < 3:
+                raise asyncio.TimeoutError()
+            return "ok"
+
+        async def broken(**kwargs):
+            raise ValueError("not retryable")
+
+        assert await gateway.complete(flaky, model="m") == "ok"
+        with pytest.raises(ValueError):
+            await gateway.complete(broken, model="m")
+        return len(attempts), gateway.stats()
+
+    attempts, stats = asyncio.run(scenario())
+    assert attempts == 3 and stats["retries"] == 2
+
+
+def test_timeouts_exhaust_retries():
+    async def scenario():
+        gateway = LLMGateway(max_retries=1, backoff_base=0, timeout=0.01)
+
+        async def slow(**kwargs):
+            await asyncio.sleep(1)
+
+        with pytest.raises(LLMUnavailable):
+            await gateway.complete(slow, model="m")
+        return gateway.stats()
+
+    assert asyncio.run(scenario())["failures"] == 1
+
+
+def test_stream_is_retried_before_the_first_chunk():
+    async def scenario():
+        gateway = LLMGateway(max_retries=2, backoff_base=0)
+        opened = []
+
+        async def chunks():
+            yield "a"
+            yield "b"
+
+        async def create(**kwargs):
+            opened.append(kwargs["stream"])
+            if len(opened) == 1:
+                raise asyncio.TimeoutError()
+            return chunks()
+
+        return [c async for c in gateway.stream(create, model="m")], opened
+
+    chunks, opened = asyncio.run(scenario())
+    assert chunks == ["a", "b"] and opened == [True, True]
+
+
+def test_token_bucket_paces_requests():
+    async def scenario():
+        bucket = TokenBucket(capacity=2, rate=100)
+        started = time.monotonic()
+        for _ in range(4):
+            await bucket.acquire()
+        return time.monotonic() - started
+
+    assert asyncio.run(scenario()) >= 0.015
+
+
+def test_ask_returns_503_when_llm_queue_is_full(monkeypatch):
+    from llm import llm_gateway
+
+    monkeypatch.setattr(llm_gateway, "waiting", llm_gateway.max_queue)
+    response = client.post("/ask", json={"query": "What is flood risk in Asia?"})
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "1"
+
+
+def test_unavailable_llm_ends_stream_cleanly(monkeypatch):
+    async def failing(*a, **k):
+        raise LLMUnavailable("retries exhausted")
+        yield
+
+    async def no_sql(*a, **k):
+        return None
+
+    monkeypatch.setattr("main.generate_sql_async", no_sql)
+    monkeypatch.setattr("main.fallback_stream_answer_async", failing)
+    response = client.post("/ask?format=ndjson", json={"query": "What is flood risk in Asia?"})
+    types = [json.loads(line)["type"] for line in response.text.splitlines()]
+    assert types[-3:] == ["token", "timings", "done"]
+    assert "error" in types
+
+
+def test_stream_wraps_api_errors_and_closes_the_stream():
+    closed = []
+
+    class Stream:
+        def __init__(self, fail):
+            self.fail = fail
+
+        def __aiter__(self):
+            return self
+
+        async def __anext__(self):
+            if self.fail:
+                raise openai.APIError("bad request", request=None, body=None)
+            return "a"
+
+        async def close(self):
+            closed.append(self.fail)
+
+    async def scenario():
+        gateway = LLMGateway(max_retries=2, backoff_base=0)
+        with pytest.raises(LLMUnavailable):
+            [c async for c in gateway.stream(lambda **k: asyncio.sleep(0, Stream(True)), model="m")]
+        # the consumer stops reading after the first chunk
+        stream = gateway.stream(lambda **k: asyncio.sleep(0, Stream(False)), model="m")
+        assert await stream.__anext__() == "a"
+        await stream.aclose()
+        return gateway
+
+    gateway = asyncio.run(scenario())
+    assert closed == [True, False] and gateway.retries == 0 and gateway.in_flight == 0
+
+
+def test_unexpected_stream_error_still_ends_with_done(monkeypatch):
+    async def broken(*a, **k):
+        raise RuntimeError("boom")
+        yield
+
+    async def no_sql(*a, **k):
+        return None
+
+    monkeypatch.setattr("main.generate_sql_async", no_sql)
+    monkeypatch.setattr("main.fallback_stream_answer_async", broken)
+    response = client.post("/ask?format=ndjson", json={"query": "What is flood risk in Asia?"})
+    events = [json.loads(line) for line in response.text.splitlines()]
+    assert [e["type"] for e in events][-3:] == ["token", "timings", "done"]
+    assert {"type": "error", "reason": "llm_error"} in events
@@ -0,0 +1,90 @@
+import asyncio
+import json
+
+from fastapi.testclient import TestClient
+
+from loadTest import ask_once, cache_hits, compare, percentile, question_mix, summarize_level
+from mockOpenAI import NO_SQL_TEXT, create_app
+
+
+def test_question_mix_is_seeded_and_weighted():
+    first = list(question_mix(200, {"city": 3, "fallback": 1}, seed=1))
+    assert first == list(question_mix(200, {"city": 3, "fallback": 1}, seed=1))
+    kinds = [kind for kind, _ in first]
+    assert set(kinds) == {"city", "fallback"} and kinds.count("city") > kinds.count("fallback")
+
+
+def test_percentile_interpolates():
+    values = [float(v) for v in range(1, 101)]
+    assert percentile(values, 0.5) == 50.5
+    assert round(percentile(values, 0.95), 2) == 95.05
+    assert percentile([7.0], 0.99) == 7.0
+
+
+def test_mock_openai_streams_and_refuses_sql():
+    client = TestClient(create_app(latency=0, chunk_rate=0, answer="abcdefgh"))
+    messages = [{"role": "system", "content": "rules"},
+                {"role": "user", "content": json.dumps({"user_query": "Explain why it floods"})}]
+    refused = client.post("/v1/chat/completions", json={"model": "m", "messages": messages}).json()
+    assert refused["choices"][0]["message"]["content"] == NO_SQL_TEXT
+
+    streamed = client.post("/v1/chat/completions", json={
+        "model": "m", "messages": messages, "stream": True, "stream_options": {"include_usage": True}})
+    data = [line[6:] for line in streamed.text.splitlines() if line.startswith("data: ")]
+    chunks = [json.loads(d) for d in data[:-1]]
+    assert data[-1] == "[DONE]"
+    assert "".join(c["choices"][0]["delta"].get("content", "") for c in chunks if c["choices"]) == "abcdefgh"
+    # the system prefix was seen by the first call, so it counts as cached
+    assert chunks[-1]["usage"]["prompt_tokens_details"]["cached_tokens"] > 0
+
+
+def test_ask_once_reads_a_chunked_ndjson_stream():
+    events = [{"type": "fallback", "reason": "invalid_sql"}, {"type": "token", "text": "hi"}, {"type": "done"}]
+    body = "".join(json.dumps(e) + "\n" for e in events).encode()
+
+    async def handle(reader, writer):
+        while (await reader.readline()) != b"\r\n":
+            pass
+        writer.write(b"HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n")
+        for i in range(0, len(body), 10):
+            piece = body[i:i + 10]
+            writer.write(f"{len(piece):x}\r\n".encode() + piece + b"\r\n")
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+        writer.close()
+
+    async def scenario():
+        server = await asyncio.start_server(handle, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        async with server:
+            return await ask_once("127.0.0.1", port, "q", kind="fallback", timeout=5)
+
+    sample = asyncio.run(scenario())
+    assert sample["status"] == 200 and sample["error"] is None
+    assert sample["fallback"] == "invalid_sql"
+    assert sample["ttfb_ms"] <= sample["ttft_ms"] <= sample["total_ms"]
+
+
+def _level(concurrency, total_p95, throughput, errors=0):
+    samples = [{"kind": "city", "error": None, "fallback": None, "ttfb_ms": 10.0, "ttft_ms": 20.0,
+                "total_ms": total_p95} for _ in range(10 - errors)]
+    samples += [{"kind": "city", "error": "timeout", "fallback": None, "ttfb_ms": None, "ttft_ms": None,
+                 "total_ms": 1000.0} for _ in range(errors)]
+    return summarize_level(samples, wall=(10 - errors) / throughput, concurrency=concurrency)
+
+
+def test_compare_flags_regressions_per_concurrency_level():
+    baseline = {"levels": [_level(8, 100.0, 40.0), _level(32, 200.0, 80.0)]}
+    current = {"levels": [_level(8, 105.0, 39.0), _level(32, 400.0, 50.0, errors=2), _level(64, 900.0, 10.0)]}
+
+    metrics = {r["metric"] for r in compare(baseline, current)}
+    assert metrics == {"c32.total.p50_ms", "c32.total.p95_ms", "c32.throughput_rps", "c32.error_rate"}
+    assert current["levels"][1]["errors"] == {"timeout": 2}
+
+
+def test_cache_hits_are_per_level_deltas():
+    before = {"sql_cache": {"hits": 5}, "summary_cache": {"hits": 1}, "single_flight": {"coalesced": 0}}
+    after = {"sql_cache": {"hits": 9}, "summary_cache": {"hits": 41}, "single_flight": {"coalesced": 3},
+             "result_cache": {"hits": 2}}
+    assert cache_hits(before, after) == {"sql_cache": 4, "result_cache": 2, "summary_cache": 40, "single_flight": 3}
+    assert cache_hits(None, after) is None
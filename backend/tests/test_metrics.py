@@ -0,0 +1,72 @@
+import json
+
+from fastapi.testclient import TestClient
+
+import metrics
+from main import app
+
+client = TestClient(app)
+
+
+def test_histogram_renders_cumulative_buckets():
+    registry = metrics.Registry()
+    hist = registry.histogram("demo_seconds", "Demo.", ("stage",), buckets=(0.1, 1.0))
+    hist.observe(0.05, stage="run_sql")
+    hist.observe(0.5, stage="run_sql")
+    hist.observe(5.0, stage="run_sql")
+    counter = registry.counter("demo_total", "Demo.", ("reason",))
+    counter.inc(reason='bad "sql"')
+
+    text = registry.render()
+    assert '# TYPE demo_seconds histogram' in text
+    assert 'demo_seconds_bucket{stage="run_sql",le="0.1"} 1' in text
+    assert 'demo_seconds_bucket{stage="run_sql",le="1"} 2' in text
+    assert 'demo_seconds_bucket{stage="run_sql",le="+Inf"} 3' in text
+    assert 'demo_seconds_count{stage="run_sql"} 3' in text
+    assert 'demo_total{reason="bad \\"sql\\""} 1' in text
+
+
+def test_ask_records_fallback_and_sends_timings(monkeypatch):
+    async def fake_generate_sql(*a, **k):
+        return "SELECT 1 FROM \"FloodRisk\""
+
+    async def empty(*a, **k):
+        return []
+
+    async def fake_stream(*a, **k):
+        yield "Fallback answer"
+
+    monkeypatch.setattr("main.generate_sql_async", fake_generate_sql)
+    monkeypatch.setattr("main.PLANNER_ENABLED", False)
+    monkeypatch.setattr("main.run_sql_query_async", empty)
+    monkeypatch.setattr("main.fallback_stream_answer_async", fake_stream)
+    before = metrics.ASK_FALLBACKS.value(reason="empty_result")
+
+    response = client.post("/ask?format=ndjson", json={"query": "What is flood risk in Asia?"})
+    events = [json.loads(line) for line in response.text.splitlines()]
+    timings = next(e for e in events if e["type"] == "timings")
+
+    assert events[-1]["type"] == "done"
+    assert {"detect_hazards", "generate_sql", "validate_sql", "run_sql", "summarize"} <= set(timings["stages_ms"])
+    assert timings["ttft_ms"] is not None
+    assert metrics.ASK_FALLBACKS.value(reason="empty_result") == before + 1
+
+    scrape = client.get("/metrics")
+    assert scrape.status_code == 200
+    assert 'beehive_ask_fallbacks_total{reason="empty_result"}' in scrape.text
+    assert 'beehive_ask_stage_seconds_bucket{stage="run_sql",le="+Inf"}' in scrape.text
+
+
+def test_llm_usage_is_counted(monkeypatch):
+    import asyncio
+    import llm
+    from fakeServices import FakeAsyncOpenAI
+
+    monkeypatch.setattr(llm, "aclient", FakeAsyncOpenAI())
+    before = metrics.LLM_TOKENS.value(call="summary", kind="completion")
+
+    async def collect():
+        return [c async for c in llm.stream_summarize_answer_async("q", [[1]], "SELECT 1", "ctx")]
+
+    assert "".join(asyncio.run(collect()))
+    assert metrics.LLM_TOKENS.value(call="summary", kind="completion") > before
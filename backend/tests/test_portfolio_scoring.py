@@ -0,0 +1,118 @@
+import asyncio
+import csv
+import io
+import json
+import re
+
+from fastapi.testclient import TestClient
+
+from main import app
+from portfolioScoring import (
+    guarded, iter_csv_assets, iter_json_array_assets, score_assets, score_columns,
+)
+
+client = TestClient(app)
+
+
+async def _chunks(data: bytes, size: int = 7):
+    for i in range(0, len(data), size):
+        yield data[i:i + size]
+
+
+async def _collect(iterator):
+    return [item async for item in iterator]
+
+
+def _ids_in(sql):
+    return re.search(r"'\{(.*?)\}'::text\[\]", sql).group(1).replace('"', "").split(",")
+
+
+async def fake_query(sql, **kwargs):
+    width = len(score_columns()) - 3
+    return [[asset_id, 0.0, 0.0] + [0.5] * width for asset_id in _ids_in(sql)]
+
+
+def test_json_array_is_parsed_incrementally():
+    body = json.dumps([{"id": "a", "lon": -80.19, "lat": 25.76}, ["b", 2, 3], {"id": "c", "lon": 500, "lat": 0}])
+    assets = asyncio.run(_collect(iter_json_array_assets(_chunks(body.encode()))))
+    assert [a["id"] for a in assets] == ["a", "b", "c"]
+    assert assets[1] == {"id": "b", "lon": 2.0, "lat": 3.0}
+    assert "out of range" in assets[2]["error"]
+
+
+def test_malformed_json_element_does_not_drop_the_rest():
+    body = '[{"id": "a", "lon": 1, "lat": 2}, {"id": "b", "lon": }, {"id": "c,]", "lon": 3, "lat": 4}]'
+    assets = asyncio.run(_collect(iter_json_array_assets(_chunks(body.encode()))))
+    assert [a["id"] for a in assets] == ["a", "2", "c,]"]
+    assert assets[1]["error"] == "asset 2: invalid JSON"
+
+    truncated = asyncio.run(_collect(guarded(iter_json_array_assets(_chunks(b'[{"id": "a", "lon": 1, "lat": 2}, {"id": "b"')))))
+    assert truncated[0]["id"] == "a" and "incomplete JSON" in truncated[1]["error"]
+
+
+def test_csv_assets_with_header():
+    body = b"\xef\xbb\xbfid,lat,lon\r\nhq,42.36,-71.05\r\nbad,x,y\r\n"
+    assets = asyncio.run(_collect(iter_csv_assets(_chunks(body, 5))))
+    assert assets[0] == {"id": "hq", "lon": -71.05, "lat": 42.36}
+    assert "error" in assets[1]
+
+
+def test_score_assets_keeps_input_order_across_chunks():
+    assets = [{"id": str(i), "lon": 1.0, "lat": 2.0} for i in range(23)]
+    assets.insert(5, {"id": "bad", "error": "asset 6: expected id, lon, lat"})
+    queries = []
+
+    async def run_query(sql):
+        queries.append(sql)
+        await asyncio.sleep(0.001 * (len(queries) % 3))  # chunks finish out of order
+        return await fake_query(sql)
+
+    async def source():
+        for asset in assets:
+            yield asset
+
+    rows = asyncio.run(_collect(score_assets(source(), chunk_size=5, concurrency=3, run_query=run_query)))
+    assert len(queries) == 5
+    assert [r["id"] if isinstance(r, dict) else r[0] for r in rows] == [a["id"] for a in assets]
+    assert all(len(r) == len(score_columns()) for r in rows if not isinstance(r, dict))
+
+
+def test_failed_chunks_become_error_rows():
+    assets = [{"id": str(i), "lon": 1.0, "lat": 2.0} for i in range(6)]
+    calls = []
+
+    async def run_query(sql):
+        calls.append(sql)
+        if len(calls) == 1:
+            raise TimeoutError("canceling statement due to statement timeout")
+        rows = await fake_query(sql)
+        return rows[:-1] if len(calls) == 2 else rows
+
+    async def source():
+        for asset in assets:
+            yield asset
+
+    rows = asyncio.run(_collect(score_assets(source(), chunk_size=2, concurrency=1, run_query=run_query)))
+    assert [r["id"] if isinstance(r, dict) else r[0] for r in rows] == [a["id"] for a in assets]
+    assert rows[0] == {"id": "0", "error": "scoring failed (TimeoutError)"}
+    assert rows[2] == {"id": "2", "error": "scoring returned 1 rows for 2 assets"}
+    assert all(isinstance(r, list) for r in rows[4:])
+
+
+def test_score_endpoint_streams_csv(monkeypatch):
+    monkeypatch.setattr("portfolioScoring.run_sql_query_async", fake_query)
+    body = "id,lon,lat\n" + "".join(f"site{i},-80.19,25.76\n" for i in range(3))
+    response = client.post("/score?format=csv", content=body, headers={"Content-Type": "text/csv"})
+
+    table = list(csv.reader(io.StringIO(response.text)))
+    assert response.headers["content-type"].startswith("text/csv")
+    assert table[0] == score_columns() + ["error"]
+    assert [row[0] for row in table[1:]] == ["site0", "site1", "site2"]
+    assert "flood_ssp5_30yr" in table[0] and "wildfire_hist_avg_loss_rate" in table[0]
+
+
+def test_score_endpoint_ndjson_reports_bad_upload(monkeypatch):
+    monkeypatch.setattr("portfolioScoring.run_sql_query_async", fake_query)
+    response = client.post("/score", content=b'{"id": 1}', headers={"Content-Type": "application/json"})
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert lines == [{"id": "", "error": "expected a JSON array"}]
@@ -0,0 +1,60 @@
+import asyncio
+import json
+
+import llm
+import metrics
+from fakeServices import FakeAsyncOpenAI
+
+
+def test_sql_prompt_has_a_stable_prefix():
+    first = llm.build_sql_prompt("DB CONTEXT", "Flood risk in Miami?", ["flood"], None)
+    second = llm.build_sql_prompt("DB CONTEXT", "Heat in Paris and Rome", ["heat", "wildfire"], "europe")
+
+    assert first[0] == second[0]
+    assert first[0]["content"].startswith(llm.SQL_SYSTEM_RULES)
+    assert first[0]["content"].endswith("DB CONTEXT")
+    assert "DB CONTEXT" not in first[1]["content"]
+    assert json.loads(second[1]["content"]) == {
+        "user_query": "Heat in Paris and Rome", "region": "europe", "hazards": ["HeatRisk", "WildfireRisk"]}
+
+
+def test_sql_prompt_fingerprint_is_built_once_per_context(monkeypatch):
+    built = []
+    build = llm.build_sql_prompt
+    monkeypatch.setattr(llm, "build_sql_prompt", lambda *a: built.append(a[0]) or build(*a))
+    llm._sql_prompt_fingerprint.cache_clear()
+    monkeypatch.setattr(llm, "load_doc_from_db", lambda path: "DB CONTEXT")
+
+    assert llm.sql_prompt_fingerprint() == llm.sql_prompt_fingerprint()
+    monkeypatch.setattr(llm, "load_doc_from_db", lambda path: "NEW CONTEXT")
+    llm.sql_prompt_fingerprint()
+    assert built == ["DB CONTEXT", "NEW CONTEXT"]
+    llm._sql_prompt_fingerprint.cache_clear()
+
+
+def test_summary_prompt_puts_request_data_after_the_prefix():
+    first = llm.build_summary_messages("Flood risk in Miami?", [[4]], "SELECT 1", "DB CONTEXT")
+    second = llm.build_summary_messages("Heat in Paris", [[6], [7]], "SELECT 2", "DB CONTEXT")
+
+    assert first[0] == second[0] and first[0]["role"] == "system"
+    assert "Miami" not in first[0]["content"] and first[0]["content"].endswith("DB CONTEXT")
+    assert "User asked: Flood risk in Miami?" in first[1]["content"] and "SELECT 1" in first[1]["content"]
+
+
+def test_cached_prompt_tokens_are_recorded(monkeypatch):
+    monkeypatch.setattr(llm, "aclient", FakeAsyncOpenAI())
+    cached_before = metrics.LLM_TOKENS.value(call="summary", kind="cached_prompt")
+    hits_before = metrics.LLM_LATENCY_SECONDS.count(call="summary", prompt_cache="hit")
+    misses_before = metrics.LLM_LATENCY_SECONDS.count(call="summary", prompt_cache="miss")
+
+    async def ask(question):
+        return [c async for c in llm.stream_summarize_answer_async(question, [[1]], "SELECT 1", "unique ctx")]
+
+    asyncio.run(ask("first question"))
+    asyncio.run(ask("second question"))
+
+    assert metrics.LLM_TOKENS.value(call="summary", kind="cached_prompt") > cached_before
+    assert metrics.LLM_LATENCY_SECONDS.count(call="summary", prompt_cache="miss") == misses_before + 1
+    assert metrics.LLM_LATENCY_SECONDS.count(call="summary", prompt_cache="hit") == hits_before + 1
+    stats = metrics.prompt_cache_stats()["summary"]
+    assert stats["cached_tokens"] > 0 and 0 < stats["cached_ratio"] < 1
@@ -0,0 +1,32 @@
+from database import validate_sql
+from queryCompiler import compile_batch_blocks, compile_batch_query
+
+TABLES = ['"CycloneRisk"', '"FloodRisk"', '"HeatRisk"', '"WildfireRisk"']
+
+
+def test_city_batch_is_one_statement_per_table():
+    locations = [("Boston", -71.0589, 42.3601), ("Xi'an", 108.94, 34.34)]
+    blocks = compile_batch_blocks("city", locations, TABLES, scenario=5, horizons=(10,))
+
+    assert len(blocks) == 4
+    assert all("CROSS JOIN LATERAL" in block for block in blocks)
+    assert "AS risk_score" in blocks[0] and "AS hazard" in blocks[0] and "loc.city" in blocks[0]
+    assert ''''{"Boston","Xi''an"}'::text[]''' in blocks[0]
+
+
+def test_batched_sql_passes_validation_at_scale():
+    locations = [(f"Site {i}", -100 + i * 0.1, 30 + i * 0.05) for i in range(500)]
+    sql = compile_batch_query("city", locations, TABLES)
+
+    assert validate_sql(sql)
+    assert sql.count("UNION ALL") == 3
+    assert sql.count("ST_MakePoint(loc.lon, loc.lat)") == 8
+
+
+def test_region_batch():
+    sql = compile_batch_query("region", [("India", "asia"), ("Brazil", "south_america")], ['"FloodRisk"'])
+
+    assert validate_sql(sql)
+    assert "loc.label AS region" in sql
+    assert ''''{"India","Brazil"}'::text[]''' in sql
+    assert "LEFT JOIN LATERAL" in sql
@@ -0,0 +1,125 @@
+import asyncio
+import json
+
+from fastapi.testclient import TestClient
+
+from database import QueryRejected, QueryResult
+from main import app
+from queryFanout import Branch, FanOut, plan_branches, split_union_all, sql_branches
+from queryPlanner import plan_query
+
+client = TestClient(app)
+
+
+def test_split_union_all_only_splits_parenthesized_branches():
+    assert split_union_all('(SELECT 1 FROM "A")\nUNION ALL\n(SELECT 2 FROM "B");') == [
+        'SELECT 1 FROM "A"', 'SELECT 2 FROM "B"']
+    # the trailing LIMIT belongs to the whole union; UNION deduplicates across branches
+    assert len(split_union_all('(SELECT 1) UNION ALL (SELECT 2) LIMIT 1')) == 1
+    assert len(split_union_all('(SELECT 1) UNION (SELECT 2)')) == 1
+    assert len(split_union_all("SELECT 'a) UNION ALL (b' AS x")) == 1
+
+
+def test_plan_branches_rebuild_the_plan_sql():
+    single = plan_query("Flood and heat risk in Miami")
+    branches = plan_branches(single)
+    assert [b.label for b in branches] == ["FloodRisk: Miami", "HeatRisk: Miami"]
+    assert "\nUNION ALL\n".join(f"({b.sql})" for b in branches) == single.sql
+
+    several = plan_query("Compare flood and heat risk in Tokyo, Mumbai and Lagos")
+    assert "\nUNION ALL\n".join(f"({b.sql})" for b in plan_branches(several)) == several.sql
+    assert len(plan_branches(several, locations_per_branch=2)) == 4
+
+
+def test_llm_union_branches_are_labelled_by_table():
+    sql = '(SELECT 1 AS r FROM "FloodRisk") UNION ALL (SELECT 2 AS r FROM "FloodRisk") UNION ALL (SELECT 3 FROM "HeatRisk")'
+    assert [b.label for b in sql_branches(sql)] == ["FloodRisk", "FloodRisk #2", "HeatRisk"]
+    assert sql_branches('(SELECT 1 FROM "FloodRisk") UNION ALL (SELECT 2 FROM "Secrets")')[0].label == "query"
+
+
+def test_fan_out_limits_parallelism_and_degrades_per_branch():
+    running, peak = 0, 0
+
+    async def run_query(sql, trusted=False):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        try:
+            await asyncio.sleep(0.5 if sql == "slow" else 0.01)
+            if sql == "broken":
+                raise RuntimeError("connection reset")
+            if sql == "rejected":
+                raise QueryRejected("too expensive")
+            return QueryResult([[sql]], ["value"])
+        finally:
+            running -= 1
+
+    async def scenario():
+        names = ["a", "slow", "b", "broken", "rejected", "c"]
+        fan_out = FanOut([Branch(n, n) for n in names], run_query, parallelism=2, timeout=0.1)
+        completed = [r.branch.label async for r in fan_out.run()]
+        return fan_out, completed
+
+    fan_out, completed = asyncio.run(scenario())
+    merged = fan_out.result()
+    assert peak == 2 and completed.index("a") < completed.index("slow")
+    assert merged == [["a"], ["b"], ["c"]] and merged.columns == ["value"]
+    assert merged.failed == ["slow", "broken", "rejected"]
+    assert {r.branch.label: r.error for r in fan_out.failed} == {
+        "slow": "timeout", "broken": "db_error", "rejected": "query_rejected"}
+    assert merged.sql == "(a)\nUNION ALL\n(b)\nUNION ALL\n(c)"
+
+
+def test_ask_streams_branches_and_survives_a_failed_one(monkeypatch):
+    async def fake_rows(sql, **k):
+        if '"HeatRisk"' in sql:
+            raise RuntimeError("canceling statement due to statement timeout")
+        return QueryResult([["Miami", "FloodRisk", "North America", 4, 5, 6]],
+                           ["city", "hazard", "region", "risk_1yr", "risk_10yr", "risk_30yr"])
+
+    summarized = {}
+
+    async def fake_stream(user_query, sql_query, **k):
+        summarized["sql"] = sql_query
+        yield "ok"
+
+    monkeypatch.setattr("main.answer_in_memory", lambda plan: None)
+    monkeypatch.setattr("main.run_sql_query_async", fake_rows)
+    monkeypatch.setattr("main.stream_summarize_answer_async", fake_stream)
+    monkeypatch.setattr("main.SUMMARY_CACHE_ENABLED", False)
+
+    response = client.post("/ask?format=ndjson", json={"query": "Flood and heat risk in Miami"})
+    events = [json.loads(line) for line in response.text.splitlines()]
+    types = [e["type"] for e in events]
+
+    assert "fallback" not in types
+    assert types.index("partial_rows") < types.index("rows") and "branch_failed" in types
+    rows = next(e for e in events if e["type"] == "rows")
+    assert rows["rows"] == [["Miami", "FloodRisk", "North America", 4, 5, 6]]
+    assert rows["failed"] == ["HeatRisk: Miami"]
+    assert '"HeatRisk"' not in summarized["sql"]
+
+
+def test_shared_slots_limit_branches_across_fan_outs():
+    running, peak = 0, 0
+
+    async def run_query(sql, trusted=False):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        return QueryResult([[sql]], ["value"])
+
+    async def scenario():
+        slots = asyncio.Semaphore(3)
+        fan_outs = [FanOut([Branch(f"{i}{n}", "x") for n in "abcd"], run_query, parallelism=4, slots=slots)
+                    for i in range(3)]
+        async def drain(fan_out):
+            return [r async for r in fan_out.run()]
+
+        await asyncio.gather(*(drain(fan_out) for fan_out in fan_outs))
+        return fan_outs
+
+    fan_outs = asyncio.run(scenario())
+    assert peak == 3 and all(len(fan_out.result()) == 4 for fan_out in fan_outs)
@@ -0,0 +1,102 @@
+import pytest
+
+import database
+from database import QueryRejected, governed_execute, strip_heavy_columns
+
+
+def test_strip_heavy_columns_keeps_knn_ordering():
+    sql = ('SELECT region, geometry, ST_AsGeoJSON(geometry) AS shape, ssp5_10yr AS risk_score FROM "FloodRisk" '
+           'ORDER BY geometry <-> ST_SetSRID(ST_MakePoint(-80.19, 25.76), 4326) LIMIT 20')
+    stripped, removed = strip_heavy_columns(sql)
+    assert removed == 2
+    assert "ST_AsGeoJSON" not in stripped
+    assert "SELECT region, ssp5_10yr AS risk_score FROM" in stripped
+    assert "ORDER BY geometry <->" in stripped
+
+
+def test_strip_heavy_columns_in_subquery_and_untouched_sql():
+    sql = 'SELECT AVG(risk_score) FROM (SELECT t.geometry, ssp5_10yr AS risk_score FROM "HeatRisk" t) sub'
+    stripped, removed = strip_heavy_columns(sql)
+    assert removed == 1 and "t.geometry" not in stripped
+
+    plain = 'SELECT AVG(ssp5_10yr) FROM "HeatRisk"'
+    assert strip_heavy_columns(plain) == (plain, 0)
+
+
+def test_geometry_only_query_is_rejected():
+    with pytest.raises(QueryRejected):
+        strip_heavy_columns('SELECT geometry FROM "FloodRisk"')
+
+
+class FakeRaw:
+    def __init__(self, plan, total_rows):
+        self.plan = plan
+        self.remaining = total_rows
+        self.columns = None
+        self.statements = []
+
+    def run(self, sql):
+        self.statements.append(sql)
+        if sql.startswith("EXPLAIN"):
+            return [[[{"Plan": self.plan}]]]
+        if sql.startswith("FETCH"):
+            n = min(int(sql.split()[2]), self.remaining)
+            self.remaining -= n
+            self.columns = [{"name": "risk_score"}]
+            return [[1.0]] * n
+        return []
+
+
+class FakeConn:
+    def __init__(self, raw):
+        self.raw = raw
+
+
+class FakePool:
+    def __init__(self, raw):
+        self.conn = FakeConn(raw)
+        self.released_with = []
+
+    def connection(self):
+        pool = self
+
+        class Ctx:
+            def __enter__(self):
+                return pool.conn
+
+            def __exit__(self, exc_type, *exc):
+                # the real pool discards a connection released with a non-DB exception
+                pool.released_with.append(exc_type)
+                return False
+        return Ctx()
+
+
+@pytest.fixture
+def fresh_explain_cache(monkeypatch):
+    monkeypatch.setattr(database, "_explain_cache", database.LRUCache(max_entries=16))
+
+
+def test_expensive_query_is_rejected(monkeypatch, fresh_explain_cache):
+    raw = FakeRaw({"Total Cost": 1e9, "Plan Rows": 10}, 10)
+    pool = FakePool(raw)
+    monkeypatch.setattr(database, "get_pool", lambda: pool)
+    with pytest.raises(QueryRejected):
+        governed_execute('SELECT ssp5_10yr FROM "FloodRisk" a, "HeatRisk" b')
+    assert pool.released_with == [None]
+    assert not any(s.startswith("DECLARE") for s in raw.statements)
+
+
+def test_large_result_is_fetched_in_batches_and_capped(monkeypatch, fresh_explain_cache):
+    monkeypatch.setattr(database, "MAX_RESULT_ROWS", 1200)
+    monkeypatch.setattr(database, "FETCH_SIZE", 500)
+    raw = FakeRaw({"Total Cost": 100.0, "Plan Rows": 50000}, 50000)
+    monkeypatch.setattr(database, "get_pool", lambda: FakePool(raw))
+
+    result = governed_execute('SELECT ssp5_10yr AS risk_score FROM "FloodRisk"')
+    assert len(result) == 1200 and result.truncated
+    assert result.columns == ["risk_score"]
+    assert raw.statements[1] == "BEGIN READ ONLY"
+    assert "LIMIT 1201" in next(s for s in raw.statements if s.startswith("DECLARE"))
+    assert [s for s in raw.statements if s.startswith("FETCH")][:3] == [
+        "FETCH FORWARD 500 FROM governed", "FETCH FORWARD 500 FROM governed", "FETCH FORWARD 200 FROM governed"]
+    assert raw.statements[-1] == "COMMIT"
@@ -0,0 +1,55 @@
+from database import validate_sql
+from queryPlanner import QueryPlanner, parse_horizons, parse_scenario
+
+
+def test_city_question_is_planned_without_llm():
+    plan = QueryPlanner().plan("What is the flood risk in Miami under SSP3 in 30 years?")
+
+    assert plan.kind == "city"
+    assert plan.locations[0][0] == "Miami"
+    assert plan.hazard_tables == ['"FloodRisk"']
+    assert plan.scenario == 3 and plan.horizons == (30,)
+    assert "ssp3_30yr" in plan.sql and "ssp5" not in plan.sql
+    assert validate_sql(plan.sql)
+
+
+def test_multiple_cities_and_hazards():
+    plan = QueryPlanner().plan("Heat and wildfire risk for offices in Boston, Charlotte and London")
+
+    assert [label for label, _, _ in plan.locations] == ["Boston", "Charlotte", "London"]
+    # One batched statement per hazard table
+    assert plan.sql.count("UNION ALL") == 1
+    assert plan.sql.count("CROSS JOIN LATERAL") == 2
+    assert validate_sql(plan.sql)
+
+
+def test_country_maps_to_region():
+    plan = QueryPlanner().plan("Flood risk in India?")
+
+    assert plan.kind == "region"
+    assert plan.locations == [("India", "asia")]
+    assert "ILIKE '%asia%'" in plan.sql
+
+
+def test_unsupported_shapes_fall_back_and_are_counted():
+    planner = QueryPlanner()
+    assert planner.plan("What are the highest risk locations for flooding in the US?") is None
+    assert planner.plan("Flood risk in Springfield?") is None
+    assert planner.plan("Flood risk in Boston and India") is None
+    planner.plan("Flood risk in Boston")
+
+    assert planner.stats() == {"planned": 1, "unplanned": 3, "hit_rate": 0.25}
+
+
+def test_scenario_and_horizon_parsing():
+    assert parse_scenario("flood risk") == 5
+    assert parse_scenario("ssp 1 flood risk") == 1
+    assert parse_scenario("ssp2 flood risk") is None
+    assert parse_scenario("flood risk under ssp126") == 1
+    assert parse_scenario("flood risk under SSP1-26") == 1
+    assert parse_scenario("SSP5-8.5 heat risk") == 5
+    assert parse_scenario("SSP2-4.5 heat risk") is None
+    assert parse_scenario("ssp12 heat risk") is None
+    assert parse_horizons("in the next 5 years") == (1,)
+    assert parse_horizons("next decade") == (10,)
+    assert parse_horizons("by 2050") is None
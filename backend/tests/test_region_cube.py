@@ -0,0 +1,37 @@
+from queryPlanner import QueryPlanner
+from regionCube import RegionCube
+
+TABLES = ['"FloodRisk"', '"HeatRisk"']
+
+
+def fake_execute(sql):
+    # Two raw regions per table; the aggregates are (SUM, COUNT) pairs per column
+    n_columns = sql.count("SUM(")
+    south = ["south_east_asia"] + [12.0, 4] * n_columns
+    west = ["west_asia"] + [3.0, 1] * n_columns
+    europe = ["europe"] + [5.0, 5] * n_columns
+    return [south, west, europe]
+
+
+def test_region_averages_are_exact_across_raw_regions():
+    cube = RegionCube.build(fake_execute, TABLES)
+
+    # (12 + 3) / (4 + 1)
+    assert cube.risk_scores("asia", '"FloodRisk"', 5, (10,)) == [3.0]
+    assert cube.risk_scores("europe", '"HeatRisk"', 1, (1, 30)) == [1.0, 1.0]
+    assert cube.lookup("asia", '"FloodRisk"')["ssp1_30yr_rp200_percent_flooded"] == 3.0
+    # Regions with no data stay empty instead of becoming zero
+    assert cube.risk_scores("africa", '"FloodRisk"', 5, (10,)) == [None]
+
+
+def test_rows_for_plan_match_sql_shape():
+    cube = RegionCube.build(fake_execute, TABLES)
+    plan = QueryPlanner().plan("Flood and heat risk in India and Germany over 10 years")
+
+    rows = cube.rows_for_plan(plan)
+    assert rows == [
+        ["India", "FloodRisk", 3.0],
+        ["Germany", "FloodRisk", 1.0],
+        ["India", "HeatRisk", 3.0],
+        ["Germany", "HeatRisk", 1.0],
+    ]
@@ -0,0 +1,62 @@
+import asyncio
+
+from resultCache import ResultCache, canonicalize_sql
+
+TABLES = ['"CycloneRisk"', '"FloodRisk"', '"HeatRisk"', '"WildfireRisk"']
+
+
+def test_formatting_does_not_fragment_cache():
+    a = 'SELECT ssp5_10yr AS risk_score FROM "FloodRisk"\nORDER BY geometry <-> ST_SetSRID(ST_MakePoint(-80.1900, 25.76), 4326) LIMIT 20;'
+    b = 'select SSP5_10YR as risk_score from "FloodRisk" order by geometry <-> st_setsrid(st_makepoint(-80.19, 25.760), 4326) limit 20'
+    assert canonicalize_sql(a) == canonicalize_sql(b)
+    # Quoted identifiers and string literals stay case-sensitive
+    assert canonicalize_sql('SELECT 1 FROM "FloodRisk"') != canonicalize_sql('SELECT 1 FROM "floodrisk"')
+
+
+def test_byte_budget_evicts_oldest():
+    cache = ResultCache(TABLES, max_bytes=2000)
+    for i in range(50):
+        cache.put(f'SELECT {i} FROM "FloodRisk"', [[float(i), "Flood", "Miami"]])
+
+    stats = cache.stats()
+    assert stats["bytes"] <= 2000
+    assert stats["evictions"] > 0
+    assert cache.get('SELECT 49 FROM "FloodRisk"') is not None
+    assert cache.get('SELECT 0 FROM "FloodRisk"') is None
+
+
+def test_invalidate_and_refresh_by_table():
+    cache = ResultCache(TABLES)
+    cache.put('SELECT 1 FROM "FloodRisk"', [[1]])
+    cache.put('SELECT 1 FROM "HeatRisk"', [[1]])
+
+    assert cache.refresh(lambda sql: [[2]], tables=['"HeatRisk"']) == 1
+    assert cache.get('SELECT 1 FROM "HeatRisk"') == [[2]]
+
+    assert cache.invalidate(['"FloodRisk"']) == 1
+    assert cache.get('SELECT 1 FROM "FloodRisk"') is None
+    assert cache.get('SELECT 1 FROM "HeatRisk"') == [[2]]
+
+
+def test_run_sql_query_hits_cache(monkeypatch):
+    import database
+
+    calls = []
+    monkeypatch.setattr(database, "result_cache", ResultCache(TABLES))
+    monkeypatch.setattr(database, "_execute", lambda sql: calls.append(sql) or [[5]])
+
+    assert database.run_sql_query('SELECT ssp5_10yr FROM "FloodRisk" LIMIT 1') == [[5]]
+    assert database.run_sql_query('select ssp5_10yr from "FloodRisk" limit 1;') == [[5]]
+    assert len(calls) == 1
+
+
+def test_async_miss_checks_the_cache_once(monkeypatch):
+    import database
+
+    monkeypatch.setattr(database, "result_cache", ResultCache(TABLES))
+    monkeypatch.setattr(database, "_execute", lambda sql: [[5]])
+
+    sql = 'SELECT ssp5_10yr FROM "FloodRisk" LIMIT 1'
+    assert asyncio.run(database.run_sql_query_async(sql)) == [[5]]
+    assert asyncio.run(database.run_sql_query_async(sql)) == [[5]]
+    assert database.result_cache.stats()["misses"] == 1 and database.result_cache.stats()["hits"] == 1
@@ -0,0 +1,34 @@
+from resultCompactor import compact_result, encode_rows
+
+COLUMNS = ["city", "hazard", "risk_score"]
+
+
+def test_small_results_are_sent_whole_as_csv():
+    compacted = compact_result(COLUMNS, [["Boston", "FloodRisk", 3.14159265]], token_budget=500)
+
+    assert compacted.text == "city,hazard,risk_score\nBoston,FloodRisk,3.14\n"
+    assert compacted.rows_kept == compacted.rows_total == 1
+
+
+def test_csv_encoding_is_smaller_than_repr():
+    rows = [[f"Site {i}", "FloodRisk", 3.14159265 + i] for i in range(50)]
+    compacted = compact_result(COLUMNS, rows, token_budget=5000)
+
+    assert compacted.rows_kept == 50
+    assert compacted.tokens_after < compacted.tokens_before
+
+
+def test_large_results_keep_top_rows_and_summary():
+    rows = [[f"Site {i}", "FloodRisk", (i % 70) / 10] for i in range(2000)]
+    compacted = compact_result(COLUMNS, rows, token_budget=300)
+
+    assert compacted.tokens_after <= 300
+    assert 1 <= compacted.rows_kept < 2000
+    assert "Summary of all rows" in compacted.text
+    assert "rows: 2000" in compacted.text
+    # highest risk rows survive the cut
+    assert ",6.9\n" in compacted.text
+
+
+def test_missing_column_names_get_placeholders():
+    assert encode_rows([], [[1.0, None]]).startswith("col1,col2\n1,\n")
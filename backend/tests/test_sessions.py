@@ -0,0 +1,113 @@
+import asyncio
+import json
+
+from fastapi.testclient import TestClient
+
+from conversationSessions import SessionState, SessionStore, plan_follow_up
+from database import QueryResult
+from main import app
+from queryPlanner import plan_columns, plan_query
+
+client = TestClient(app)
+
+
+def _state():
+    plan = plan_query("Flood risk in Miami", ['"FloodRisk"'])
+    rows = QueryResult([["Miami", "FloodRisk", "North America", 4, 5, 6]], plan_columns(plan))
+    return SessionState("Flood risk in Miami", plan.sql, plan, rows)
+
+
+def test_horizon_follow_up_is_answered_from_stored_rows():
+    follow_up = plan_follow_up("what about 30 years?", _state())
+    assert follow_up.delta is None
+    assert follow_up.reused == [["Miami", "FloodRisk", "North America", 6]]
+    assert follow_up.columns == ["city", "hazard", "region", "risk_score"]
+    assert "Miami" in follow_up.question and follow_up.plan.horizons == (30,)
+
+
+def test_scenario_and_hazard_follow_ups_use_delta_queries():
+    scenario = plan_follow_up("and SSP1?", _state())
+    assert scenario.reused == [] and scenario.delta.scenario == 1
+    assert scenario.delta.hazard_tables == ['"FloodRisk"']
+
+    hazard = plan_follow_up("what about heat?", _state())
+    assert hazard.delta.hazard_tables == ['"HeatRisk"'] and hazard.reused == []
+    assert "ssp5_10yr" in hazard.delta.sql and "Miami" in hazard.delta.sql
+
+
+def test_new_questions_are_not_follow_ups():
+    assert plan_follow_up("Flood risk in Boston", _state()) is None
+    assert plan_follow_up("which cities have the highest heat risk?", _state()) is None
+    assert plan_follow_up("thanks!", _state()) is None
+    assert plan_follow_up("what about 30 years?", None) is None
+
+
+def test_definition_and_general_questions_are_not_follow_ups():
+    assert plan_follow_up("How is wildfire risk defined?", _state()) is None
+    assert plan_follow_up("Is heat risk getting worse in general?", _state()) is None
+    # a cue is still needed when the question names a hazard or a horizon
+    assert plan_follow_up("Does heat risk rise faster than flood risk?", _state()) is None
+    assert plan_follow_up("show it as a table", _state()) is not None
+    assert plan_follow_up("30 years?", _state()).plan.horizons == (30,)
+
+
+def test_sessions_are_bounded():
+    store = SessionStore(max_sessions=2, max_rows=1)
+    for session in ("a", "b", "c"):
+        store.save(session, "q", "SELECT 1", None, QueryResult([[1]], ["x"]))
+    assert store.get("a") is None and store.get("c") is not None
+    store.save("d", "q", "SELECT 1", None, QueryResult([[1], [2]], ["x"]))
+    assert store.get("d").rows is None
+
+
+def test_turns_with_failed_branches_are_not_saved():
+    async def events():
+        yield {"type": "sql", "sql": "SELECT 1"}
+        yield {"type": "rows", "rows": [[1]], "columns": ["x"], "failed": ["HeatRisk: Miami"]}
+        yield {"type": "done"}
+
+    async def scenario(store):
+        return [event async for event in store.recording("session-1", "q", events())]
+
+    store = SessionStore()
+    assert len(asyncio.run(scenario(store))) == 3
+    assert store.get("session-1") is None
+
+
+def test_follow_up_reuses_previous_turn(monkeypatch):
+    queries = []
+
+    async def fake_rows(sql, **k):
+        queries.append(sql)
+        return QueryResult([["Miami", "FloodRisk", "North America", 4, 5, 6]],
+                           ["city", "hazard", "region", "risk_1yr", "risk_10yr", "risk_30yr"])
+
+    async def fake_stream(user_query, **k):
+        yield user_query
+
+    monkeypatch.setattr("main.sessions", SessionStore())
+    monkeypatch.setattr("main.answer_in_memory", lambda plan: None)
+    monkeypatch.setattr("main.run_sql_query_async", fake_rows)
+    monkeypatch.setattr("main.stream_summarize_answer_async", fake_stream)
+    monkeypatch.setattr("main.SUMMARY_CACHE_ENABLED", False)
+
+    first = client.post("/ask?format=ndjson", json={"query": "Flood risk in Miami"})
+    session_id = first.headers["x-session-id"]
+    second = client.post("/ask?format=ndjson", json={"query": "what about 30 years?", "session_id": session_id})
+    events = [json.loads(line) for line in second.text.splitlines()]
+    by_type = {e["type"]: e for e in events}
+
+    assert len(queries) == 1
+    assert second.headers["x-session-id"] == session_id
+    assert by_type["sql"]["source"] == "session"
+    assert by_type["rows"]["rows"] == [["Miami", "FloodRisk", "North America", 6]]
+    assert "Flood risk in Miami" in by_type["token"]["text"]
+
+
+def test_chained_follow_ups_combine_with_the_base_question():
+    first = plan_follow_up("what about heat?", _state())
+    assert first.base_question == "Flood risk in Miami"
+    state = SessionState(first.base_question, first.sql, first.plan, None)
+    second = plan_follow_up("and 30 years?", state)
+    assert second.question == "Flood risk in Miami (follow-up: and 30 years?)"
+    assert second.plan.hazard_tables == ['"HeatRisk"'] and second.plan.horizons == (30,)
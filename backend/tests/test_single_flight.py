@@ -0,0 +1,99 @@
+import asyncio
+
+import pytest
+
+from singleFlight import SingleFlight, StreamOverflow, coalesce_key
+
+
+def _pipeline(calls, tokens, gate=None):
+    async def events():
+        calls.append(1)
+        for i, token in enumerate(tokens):
+            if gate is not None and i == 2:
+                await gate.wait()
+            yield {"type": "token", "text": token}
+            await asyncio.sleep(0)
+        yield {"type": "done"}
+    return events
+
+
+async def _collect(events):
+    return [event async for event in events]
+
+
+def test_coalesce_key_ignores_case_and_punctuation():
+    assert coalesce_key("Flood risk in Miami?") == coalesce_key("  flood RISK in miami ")
+    assert coalesce_key("Asia vs Europe") != coalesce_key("Europe vs Asia")
+
+
+def test_concurrent_identical_questions_share_one_execution():
+    async def scenario():
+        flight, calls, gate = SingleFlight(), [], asyncio.Event()
+        start = _pipeline(calls, ["a", "b", "c", "d"], gate)
+        first = asyncio.create_task(_collect(flight.subscribe("q", start)))
+        await asyncio.sleep(0.01)           # first subscriber is mid-stream, waiting on the gate
+        late = asyncio.create_task(_collect(flight.subscribe("q", start)))
+        await asyncio.sleep(0.01)
+        gate.set()
+        return flight, calls, await first, await late
+
+    flight, calls, first, late = asyncio.run(scenario())
+    assert len(calls) == 1
+    # the late joiner gets a replay of the tokens emitted before it joined
+    assert first == late
+    assert [e.get("text") for e in late] == ["a", "b", "c", "d", None]
+    assert flight.stats()["coalesced"] == 1 and flight.stats()["in_flight"] == 0
+
+
+def test_finished_question_runs_again():
+    async def scenario():
+        flight, calls = SingleFlight(), []
+        await _collect(flight.subscribe("q", _pipeline(calls, ["a"])))
+        await _collect(flight.subscribe("q", _pipeline(calls, ["a"])))
+        return calls
+
+    assert len(asyncio.run(scenario())) == 2
+
+
+def test_buffer_is_bounded_and_closes_to_joiners():
+    async def scenario():
+        flight, calls = SingleFlight(max_bytes=200), []
+        stream_events = flight.subscribe("q", _pipeline(calls, ["x" * 50] * 20))
+        stream = flight._inflight["q"]
+        seen, peak = [], 0
+        async for event in stream_events:
+            seen.append(event)
+            peak = max(peak, stream._bytes)
+        return stream, seen, peak
+
+    stream, seen, peak = asyncio.run(scenario())
+    assert len(seen) == 21
+    assert not stream.joinable
+    assert peak <= 200 + 100        # bound plus at most one event
+
+
+def test_lagging_subscriber_is_dropped():
+    async def scenario():
+        flight, calls = SingleFlight(max_bytes=200), []
+        start = _pipeline(calls, ["x" * 50] * 20)
+        fast = flight.subscribe("q", start)
+        slow = flight.subscribe("q", start)
+        await _collect(fast)
+        with pytest.raises(StreamOverflow):
+            await _collect(slow)
+
+    asyncio.run(scenario())
+
+
+def test_lone_subscriber_is_never_dropped():
+    async def pipeline():
+        yield {"type": "rows", "rows": [["x" * 50]] * 20}
+        yield {"type": "token", "text": "answer"}
+        yield {"type": "done"}
+
+    async def scenario():
+        flight = SingleFlight(max_bytes=200)
+        return await _collect(flight.subscribe("q", pipeline))
+
+    events = asyncio.run(scenario())
+    assert [e["type"] for e in events] == ["rows", "token", "done"]
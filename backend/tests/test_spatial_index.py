@@ -0,0 +1,55 @@
+import numpy as np
+from queryPlanner import QueryPlanner
+from spatialIndex import SpatialIndex, verify_against_postgis
+
+TABLES = ['"FloodRisk"', '"HeatRisk"']
+
+
+def fake_execute(sql):
+    # A 10 x 10 grid of cells around (0, 0); every risk column equals the cell's lon
+    rows = []
+    for lon in range(-5, 5):
+        for lat in range(-5, 5):
+            region = "europe" if lon >= 0 else "north_america"
+            rows.append([lon, lat, region] + [float(lon)] * 9)
+    return rows
+
+
+def test_knn_averages_nearest_cells():
+    index = SpatialIndex.build(fake_execute, TABLES)
+
+    rows = index.city_rows([("East", 4.1, 0.2), ("West", -4.9, 0.0)], '"FloodRisk"', 5, (10,), k=1)
+    assert rows == [["East", "FloodRisk", "europe", 4.0], ["West", "FloodRisk", "north_america", -5.0]]
+
+    distances, indices = index.tables['"FloodRisk"'].knn(np.array([[0.0, 0.0]] * 3), k=20)
+    assert distances.shape == (3, 20) and indices.shape == (3, 20)
+
+
+def test_rows_for_plan_match_sql_shape():
+    index = SpatialIndex.build(fake_execute, TABLES)
+    plan = QueryPlanner().plan("Flood and heat risk in London and Paris")
+
+    rows = index.rows_for_plan(plan)
+    assert [row[:2] for row in rows] == [
+        ["London", "FloodRisk"], ["Paris", "FloodRisk"], ["London", "HeatRisk"], ["Paris", "HeatRisk"],
+    ]
+    assert len(rows[0]) == 3 + 3  # city, hazard, region + three horizons
+
+
+def test_verify_against_postgis_reports_mismatches():
+    index = SpatialIndex.build(fake_execute, ['"FloodRisk"'])
+    locations = [("East", 4.0, 0.0)]
+
+    same = verify_against_postgis(index, locations, lambda sql: [["East", "FloodRisk", "europe", 3.5, 3.5, 3.5]], tolerance=1)
+    different = verify_against_postgis(index, locations, lambda sql: [["East", "FloodRisk", "asia", 3.5, 3.5, 3.5]])
+
+    assert same["mismatches"] == 0
+    assert different["mismatches"] == 1 and different["match_rate"] == 0.0
+
+
+def test_empty_table_has_no_match():
+    index = SpatialIndex.build(lambda sql: [], ['"FloodRisk"'])
+    distances, indices = index.tables['"FloodRisk"'].knn(np.array([[0.0, 0.0]]), k=20)
+    assert indices.shape == (1, 0)
+    assert index.city_rows([("Miami", -80.19, 25.76)], '"FloodRisk"', 5, (10, 30)) == [
+        ["Miami", "FloodRisk", None, None, None]]
@@ -0,0 +1,59 @@
+from sqlCache import SqlCache, normalize_question
+
+SQL = 'SELECT AVG(ssp5_10yr) AS risk_score, \'Miami\' AS city, \'Flood\' AS hazard FROM "FloodRisk";'
+
+
+def test_near_identical_questions_share_a_key():
+    assert normalize_question("flood risk in Miami") == normalize_question("What is the flood risk in Miami?")
+    assert normalize_question("flood risk in Miami") != normalize_question("flood risk in Boston")
+
+
+def test_word_order_and_repeats_change_the_key():
+    first = "Flood risk in Miami in 10 years under SSP1 vs 30 years under SSP5"
+    swapped = "Flood risk in Miami in 30 years under SSP1 vs 10 years under SSP5"
+    assert normalize_question(first) != normalize_question(swapped)
+
+    cache = SqlCache(path=None)
+    cache.put(first, ['"FloodRisk"'], None, "v1", SQL)
+    assert cache.get(swapped, ['"FloodRisk"'], None, "v1") is None
+
+
+def test_only_valid_sql_is_cached():
+    cache = SqlCache(path=None)
+    assert cache.put("flood risk in Miami", ['"FloodRisk"'], None, "v1", 'DROP TABLE "FloodRisk"') is False
+    assert cache.get("flood risk in Miami", ['"FloodRisk"'], None, "v1") is None
+
+    assert cache.put("flood risk in Miami", ['"FloodRisk"'], None, "v1", SQL) is True
+    assert cache.get("What is the flood risk in Miami?", ['"FloodRisk"'], None, "v1") == SQL
+    assert cache.stats()["hits"] == 1
+
+
+def test_prompt_change_invalidates_cache():
+    cache = SqlCache(path=None)
+    cache.put("flood risk in Miami", ['"FloodRisk"'], None, "v1", SQL)
+
+    assert cache.get("flood risk in Miami", ['"FloodRisk"'], None, "v2") is None
+    assert cache.stats()["invalidations"] == 1
+
+
+def test_cache_survives_restart(tmp_path):
+    path = str(tmp_path / "sql_cache.json")
+    cache = SqlCache(path=path)
+    cache.put("flood risk in Miami", ['"FloodRisk"'], None, "v1", SQL)
+    # the write is debounced off the caller's thread
+    assert not (tmp_path / "sql_cache.json").exists()
+    cache.flush()
+
+    assert SqlCache(path=path).get("flood risk in Miami", ['"FloodRisk"'], None, "v1") == SQL
+
+
+def test_generate_sql_uses_cache(monkeypatch):
+    import llm
+
+    calls = []
+    monkeypatch.setattr(llm, "sql_cache", SqlCache(path=None))
+    monkeypatch.setattr(llm, "call_llm", lambda *a, **k: calls.append(1) or SQL)
+
+    assert llm.generate_sql("flood risk in Miami", ['"FloodRisk"']) == SQL
+    assert llm.generate_sql("What is the flood risk in Miami?", ['"FloodRisk"']) == SQL
+    assert len(calls) == 1
@@ -0,0 +1,104 @@
+import asyncio
+import json
+
+from fastapi.testclient import TestClient
+
+from database import QueryResult
+from main import app
+from summaryCache import SummaryCache, replay
+
+client = TestClient(app)
+
+
+def _key(cache, question="Flood risk in Miami?", rows=([4, 5],), sql='SELECT 1 FROM "FloodRisk"'):
+    return cache.make_key(question, ["ssp5_1yr", "ssp5_10yr"], [list(r) for r in rows], sql, "v1")
+
+
+def test_key_ignores_formatting_but_not_data():
+    cache = SummaryCache()
+    assert _key(cache) == _key(cache, question="flood risk in miami")
+    assert _key(cache) == _key(cache, sql='SELECT 1\n  FROM "FloodRisk"')
+    assert _key(cache) != _key(cache, rows=([4, 6],))
+    assert _key(cache) != _key(cache, question="Flood risk in Boston?")
+
+
+def test_only_completed_streams_are_stored():
+    cache = SummaryCache()
+
+    async def source(fail=False):
+        yield "Miami "
+        if fail:
+            raise RuntimeError("stream dropped")
+        yield "is exposed."
+
+    async def consume(chunks, limit=None):
+        seen = []
+        async for chunk in chunks:
+            seen.append(chunk)
+            if limit and len(seen) == limit:
+                await chunks.aclose()
+                break
+        return seen
+
+    assert asyncio.run(consume(cache.recording("a", source()))) == ["Miami ", "is exposed."]
+    assert cache.get("a") == ["Miami ", "is exposed."]
+
+    try:
+        asyncio.run(consume(cache.recording("b", source(fail=True))))
+    except RuntimeError:
+        pass
+    asyncio.run(consume(cache.recording("c", source()), limit=1))
+    assert cache.get("b") is None and cache.get("c") is None
+    assert cache.stats()["abandoned"] == 2
+
+
+def test_byte_budget_evicts_least_recent():
+    cache = SummaryCache(max_bytes=10)
+    cache.put("a", ["12345"])
+    cache.put("b", ["12345"])
+    cache.get("a")
+    cache.put("c", ["12345"])
+    assert cache.get("a") == ["12345"] and cache.get("b") is None
+    assert cache.put("huge", ["x" * 11]) is False
+
+
+def test_replay_paces_chunks():
+    async def timed():
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        chunks = [chunk async for chunk in replay(["a", "b", "c"], chunks_per_second=50)]
+        return chunks, loop.time() - started
+
+    chunks, elapsed = asyncio.run(timed())
+    assert chunks == ["a", "b", "c"] and elapsed >= 0.035
+
+
+def test_repeat_question_replays_cached_summary(monkeypatch):
+    calls = []
+
+    async def fake_generate_sql(user_query, hazard_tables, region=None):
+        return 'SELECT ssp5_10yr AS risk_score FROM "FloodRisk"'
+
+    async def fake_rows(sql, **k):
+        return QueryResult([[5]], ["risk_score"])
+
+    async def fake_stream(*a, **k):
+        calls.append(1)
+        yield "High "
+        yield "risk."
+
+    monkeypatch.setattr("main.PLANNER_ENABLED", False)
+    monkeypatch.setattr("main.summary_cache", SummaryCache())
+    monkeypatch.setattr("main.generate_sql_async", fake_generate_sql)
+    monkeypatch.setattr("main.run_sql_query_async", fake_rows)
+    monkeypatch.setattr("main.stream_summarize_answer_async", fake_stream)
+
+    first = client.post("/ask?format=ndjson", json={"query": "Flood risk in Miami?"})
+    second = client.post("/ask?format=ndjson", json={"query": "flood risk in miami"})
+    events = [json.loads(line) for line in second.text.splitlines()]
+
+    assert calls == [1]
+    assert {"type": "summary_cache", "hit": True} in events
+    assert [e["text"] for e in events if e["type"] == "token"] == ["High ", "risk."]
+    assert events[-1] == {"type": "done"}
+    assert "summary_cache" not in first.text
@@ -0,0 +1,53 @@
+import asyncio
+import os
+import shutil
+
+import documentReader
+import main
+
+DOCX = os.path.join(os.path.dirname(__file__), "..", "Beehive_DB_Context_Summary.docx")
+
+
+def test_artifact_is_used_and_invalidated(tmp_path, monkeypatch):
+    docx = tmp_path / "context.docx"
+    shutil.copy(DOCX, docx)
+    documentReader.compile_doc(str(docx))
+    expected = documentReader.parse_docx(str(docx))
+
+    parsed = []
+    real_parse = documentReader.parse_docx
+    monkeypatch.setattr(documentReader, "parse_docx", lambda path: parsed.append(path) or real_parse(path))
+    monkeypatch.setattr(documentReader, "_DB_DOC_CACHE", None)
+
+    assert documentReader.load_doc_from_db(str(docx)) == expected
+    assert parsed == []   # served from the artifact, no python-docx
+
+    # same content, new mtime (fresh checkout): still valid by hash
+    os.utime(docx, ns=(1, 1))
+    assert documentReader.load_doc_from_db(str(docx)) == expected
+    assert parsed == []
+
+    # different file: artifact is stale, the DOCX is parsed again
+    shutil.copy(DOCX, docx)
+    with open(docx, "ab") as f:
+        f.write(b"\0")
+    try:
+        documentReader.load_doc_from_db(str(docx))
+    except Exception:
+        pass  # the appended byte may make the DOCX unreadable; the point is the re-parse
+    assert parsed == [str(docx)]
+
+
+def test_warm_up_records_steps_and_survives_failures(monkeypatch):
+    def no_db():
+        raise ConnectionError("db down")
+
+    monkeypatch.setattr(main, "warm_pool", no_db)
+    monkeypatch.setattr(main, "WARMUP_OPENAI", False)
+    monkeypatch.setattr(main, "warmup_stats", {})
+
+    stats = asyncio.run(main.warm_up())
+    assert stats["db_context"]["ok"] and stats["sql_prompt"]["ok"] and stats["planner"]["ok"]
+    assert stats["db_pool"]["ok"] is False
+    assert "openai" not in stats
+    assert stats["total_ms"] >= 0
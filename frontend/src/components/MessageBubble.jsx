@@ -1,6 +1,38 @@
 import ReactMarkdown from "react-markdown";
 
-function MessageBubble({ sender, text }) {
+const formatCell = (value) =>
+  typeof value === "number" ? Number(value.toFixed(2)) : value ?? "–";
+
+function ResultTable({ columns, rows }) {
+  return (
+    <div style={{ overflowX: "auto", marginBottom: "0.5rem" }}>
+      <table style={{ borderCollapse: "collapse", fontSize: "0.85rem" }}>
+        {columns.length > 0 && (
+          <thead>
+            <tr>
+              {columns.map((col) => (
+                <th key={col} style={{ textAlign: "left", padding: "0.2rem 0.5rem", borderBottom: "1px solid #ffcc33" }}>
+                  {col}
+                </th>
+              ))}
+            </tr>
+          </thead>
+        )}
+        <tbody>
+          {rows.map((row, i) => (
+            <tr key={i}>
+              {row.map((cell, j) => (
+                <td key={j} style={{ padding: "0.2rem 0.5rem" }}>{formatCell(cell)}</td>
+              ))}
+            </tr>
+          ))}
+        </tbody>
+      </table>
+    </div>
+  );
+}
+
+function MessageBubble({ sender, text, table }) {
   const isUser = sender === "user";
 
   const displayText =
@@ -45,6 +77,7 @@ function MessageBubble({ sender, text }) {
             color: "#333",
           }}
         >
+          {table && <ResultTable columns={table.columns} rows={table.rows} />}
           {displayText}
         </div>
       )}
@@ -4,7 +4,7 @@ function MessageList({ messages }) {
   return (
     <div style={{ flex: 1, overflowY: "auto", padding: "1rem" }}>
       {messages.map((msg, i) => (
-        <MessageBubble key={i} sender={msg.sender} text={msg.text} />
+        <MessageBubble key={i} sender={msg.sender} text={msg.text} table={msg.table} />
       ))}
     </div>
   );
@@ -4,6 +4,17 @@ export function useChat() {
   const API_URL = import.meta.env.VITE_API_URL;
 
   const [messages, setMessages] = useState([]);
+  // Conversation id from the backend, so follow-ups ("what about 30 years?") reuse the last answer
+  const [sessionId, setSessionId] = useState(null);
+
+  // Merge fields into the last (bot) message
+  const updateLast = (fields) => {
+    setMessages((prev) => {
+      const updated = [...prev];
+      updated[updated.length - 1] = { ...updated[updated.length - 1], ...fields };
+      return updated;
+    });
+  };
 
   const sendMessage = async (query) => {
     if (!query.trim()) return;
@@ -12,28 +23,56 @@ export function useChat() {
     setMessages((prev) => [...prev, { sender: "bot", text: "Thinking..." }]);
 
     try {
-      const response = await fetch(`${API_URL}/ask`, {
+      // NDJSON mode: one typed event per line (stage, sql, partial_rows, rows, token, fallback, done)
+      const response = await fetch(`${API_URL}/ask?format=ndjson`, {
         method: "POST",
         headers: { "Content-Type": "application/json" },
-        body: JSON.stringify({ query }),
+        body: JSON.stringify({ query, session_id: sessionId }),
       });
+      if (!response.ok) {
+        // 503 = LLM capacity exhausted; the body is {"detail": ...}, not an event stream
+        const busy = response.status === 503;
+        updateLast({
+          text: busy ? "⚠️ The assistant is busy right now, please try again in a moment." : "⚠️ Error streaming response",
+        });
+        return;
+      }
+      const returnedSession = response.headers.get("X-Session-Id");
+      if (returnedSession) setSessionId(returnedSession);
 
       if (!response.body) throw new Error("No response body");
       const reader = response.body.getReader();
       const decoder = new TextDecoder();
+      let buffer = "";
       let botMessage = "";
+      let partialRows = [];
+
+      const handleEvent = (event) => {
+        if (event.type === "rows") {
+          // Show the data table right away, before the summary starts
+          updateLast({ table: { columns: event.columns, rows: event.rows } });
+        } else if (event.type === "partial_rows") {
+          // Fan-out branches arrive as they complete; the rows event then puts them in order
+          partialRows = partialRows.concat(event.rows);
+          updateLast({ table: { columns: event.columns, rows: partialRows } });
+        } else if (event.type === "token") {
+          botMessage += event.text;
+          updateLast({ text: botMessage });
+        }
+      };
 
       while (true) {
         const { done, value } = await reader.read();
         if (done) break;
-        botMessage += decoder.decode(value, { stream: true });
+        buffer += decoder.decode(value, { stream: true });
 
-        setMessages((prev) => {
-          const updated = [...prev];
-          updated[updated.length - 1].text = botMessage;
-          return updated;
-        });
+        const lines = buffer.split("\n");
+        buffer = lines.pop();
+        for (const line of lines) {
+          if (line.trim()) handleEvent(JSON.parse(line));
+        }
       }
+      if (buffer.trim()) handleEvent(JSON.parse(buffer));
     } catch {
       setMessages((prev) => [...prev, { sender: "bot", text: "⚠️ Error streaming response" }]);
     }